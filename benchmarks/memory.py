@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Measure the memory held per dotfile and the cost of ordering them.
+
+For every size a fresh home directory and repository are generated (see
+synthetic.py) and the repository's contents are listed with tracemalloc
+running.  The memory still allocated afterwards, divided by the number
+of dotfiles, is reported as the size of one entry, once for the bare
+dotfiles and once more after each has been examined (its snapshot
+taken).  Sorting the dotfiles by their precomputed key is then timed
+against sorting them by their names as Path objects, which are built
+as the names are first used:
+
+    python benchmarks/memory.py --sizes 10000 100000
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+from operator import attrgetter
+
+import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dotfiles.repository import Repository  # noqa: E402
+
+SIZES = [10000, 100000]
+
+
+def allocated(function, *args):
+    """Return the result of a call and the bytes it left allocated."""
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def snapshots(dotfiles):
+    for dotfile in dotfiles:
+        dotfile.snapshot
+
+
+def sort_time(dotfiles, key):
+    start = time.perf_counter()
+    sorted(dotfiles, key=key, reverse=True)
+    return time.perf_counter() - start
+
+
+def measure(home, repo):
+    """Yield (measurement, formatted value) pairs for one tree."""
+    repo = Repository(repo, home)
+    dotfiles, size = allocated(list, repo.contents())
+    count = len(dotfiles)
+    yield 'dotfiles', '%10d' % count
+    yield 'bytes/entry', '%10.1f' % (size / count)
+    _, size = allocated(snapshots, dotfiles)
+    yield 'bytes/snapshot', '%10.1f' % (size / count)
+    for key in ('key', 'name'):
+        seconds = sort_time(dotfiles, attrgetter(key))
+        yield 'sort by %s' % key, '%10.1f ms' % (seconds * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='repository sizes in files')
+    synthetic.add_arguments(parser)
+    args = parser.parse_args()
+
+    for files in args.sizes:
+        root = tempfile.mkdtemp(prefix='dotfiles-memory-')
+        try:
+            home, repo = synthetic.generate(os.path.join(root, 'tree'),
+                                            files,
+                                            **synthetic.parameters(args))
+            print('%d files:' % files)
+            for measurement, value in measure(home, repo):
+                print('  %-15s %s' % (measurement, value))
+        finally:
+            shutil.rmtree(root)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Measure the start-up latency of a quiet 'dotfiles status'.
+
+A home directory and a repository with every dotfile enabled are
+created in a temporary directory, then 'dotfiles status' is run in a
+fresh interpreter several times.  The script exits with status 1 when
+the median run exceeds the latency budget.
+
+    python benchmarks/startup.py --files 100 --budget 50
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMAND = ('import sys; from dotfiles.fastpath import main; '
+           'sys.exit(main(sys.argv[1:]))')
+
+
+def populate(root, files):
+    home = os.path.join(root, 'home')
+    repo = os.path.join(home, 'Dotfiles')
+    for i in range(files):
+        rel = os.path.join('config', 'app%d' % (i % 10), 'file%d' % i)
+        target = os.path.join(repo, rel)
+        name = os.path.join(home, '.' + rel)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        with open(target, 'w') as f:
+            f.write('%d\n' % i)
+        os.symlink(os.path.relpath(target, os.path.dirname(name)), name)
+    return home, repo
+
+
+def run(home, repo, env):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', COMMAND, '-r', repo,
+                             'status'], env=env, stdout=subprocess.PIPE,
+                            cwd=ROOT)
+    elapsed = time.perf_counter() - start
+    if result.returncode or result.stdout:
+        sys.exit('status was not quiet: %r' % result.stdout)
+    return elapsed
+
+
+def interpreter_startup():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=100)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--budget', type=float, default=50.0,
+                        help='latency budget in milliseconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        home, repo = populate(root, args.files)
+        env = dict(os.environ, HOME=home,
+                   XDG_CACHE_HOME=os.path.join(root, 'cache'),
+                   PYTHONPATH=ROOT)
+        env.pop('DOTFILES_REPOS', None)
+
+        run(home, repo, env)  # build the stat index
+        times = [run(home, repo, env) for _ in range(args.runs)]
+
+    interpreter = statistics.median(interpreter_startup()
+                                    for _ in range(args.runs)) * 1000
+    median = statistics.median(times) * 1000
+    print('files: %d  runs: %d  median: %.1f ms  min: %.1f ms  '
+          'interpreter: %.1f ms  budget: %.1f ms' % (
+              args.files, args.runs, median, min(times) * 1000,
+              interpreter, args.budget))
+    return 1 if median > args.budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""Time dotfiles operations on synthetic trees of increasing size.
+
+For every size a fresh home directory and repository are generated (see
+synthetic.py) for each interface, the Python API and the click command
+line, and the following operations are timed in turn:
+
+    status (cold stat index), status (warm), enable, remove, prune,
+    add, disable
+
+The command line's remove includes pruning, so prune is only timed on
+its own through the API.  Results are written as JSON, and compared
+against an earlier result with '--compare':
+
+    python benchmarks/suite.py --sizes 1000 10000 --output HEAD.json
+    python benchmarks/suite.py --sizes 1000 10000 --compare HEAD.json
+
+With '--compare', the script exits with status 1 when an operation got
+slower than the threshold allows.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dotfiles.cli import cli  # noqa: E402
+from dotfiles.dotfile import clear_caches  # noqa: E402
+from dotfiles.exceptions import DotfileException  # noqa: E402
+from dotfiles.plan import Plan  # noqa: E402
+from dotfiles.repository import Repositories, Repository  # noqa: E402
+from dotfiles.status import report  # noqa: E402
+
+VERSION = 1
+SIZES = [1000, 10000, 100000, 1000000]
+
+
+class Api(object):
+    """Run operations through the Python API."""
+
+    def __init__(self, home, repo):
+        self.home = home
+        self.repo = repo
+
+    def status(self):
+        list(report(Repositories([self.repo], self.home)))
+
+    def perform(self, method, files=None):
+        repo = Repository(self.repo, self.home)
+        if files is None:
+            files = [str(x.name) for x in repo.contents()]
+        plan = Plan(method, repo)
+        for dotfile in repo.dotfiles(files):
+            try:
+                dotfile.plan(plan, method)
+            except DotfileException:
+                continue
+        plan.execute()
+
+    def prune(self):
+        Repository(self.repo, self.home).prune()
+
+
+class Cli(object):
+    """Run operations through the click command line interface."""
+
+    def __init__(self, home, repo, env):
+        from click.testing import CliRunner
+        self.runner = CliRunner(env=env)
+        self.home = home
+        self.repo = repo
+
+    def invoke(self, *args, **kwargs):
+        result = self.runner.invoke(cli, ['-r', self.repo] + list(args),
+                                    **kwargs)
+        if result.exit_code:
+            raise RuntimeError('%s failed: %s' % (args[0], result.output))
+
+    def status(self):
+        self.invoke('status')
+
+    def perform(self, method, files=None):
+        if files is None:
+            self.invoke(method, input='y\n')
+        else:
+            self.invoke(method, *files)
+
+    def prune(self):
+        # the remove command prunes the repository itself
+        return False
+
+
+def timed(function, *args):
+    clear_caches()
+    start = time.perf_counter()
+    skipped = function(*args) is False
+    return None if skipped else time.perf_counter() - start
+
+
+def run(interface, home):
+    """Yield (operation, seconds) pairs for one interface and tree."""
+    yield 'status-cold', timed(interface.status)
+    yield 'status-warm', timed(interface.status)
+    yield 'enable', timed(interface.perform, 'enable')
+    # the dotfiles to add again are those that remove brings home
+    names = [str(x.name) for x in Repository(interface.repo,
+                                             home).contents()
+             if os.path.islink(str(x.name))]
+    yield 'remove', timed(interface.perform, 'remove')
+    yield 'prune', timed(interface.prune)
+    yield 'add', timed(interface.perform, 'add', names)
+    yield 'disable', timed(interface.perform, 'disable')
+
+
+def commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+            stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(args):
+    results = []
+    for files in args.sizes:
+        for name in args.interfaces:
+            root = tempfile.mkdtemp(prefix='dotfiles-bench-')
+            try:
+                home, repo = synthetic.generate(
+                    os.path.join(root, 'tree'), files,
+                    **synthetic.parameters(args))
+                env = {'XDG_CACHE_HOME': os.path.join(root, 'cache'),
+                       'XDG_RUNTIME_DIR': os.path.join(root, 'run'),
+                       'HOME': home}
+                saved = {x: os.environ.get(x) for x in env}
+                os.environ.update(env)
+                try:
+                    if name == 'api':
+                        interface = Api(home, repo)
+                    else:
+                        interface = Cli(home, repo, env)
+                    for operation, seconds in run(interface, home):
+                        if seconds is None:
+                            continue
+                        results.append({'files': files, 'interface': name,
+                                        'operation': operation,
+                                        'seconds': seconds})
+                        print('%8d %-4s %-12s %9.3f s' % (
+                            files, name, operation, seconds),
+                            file=sys.stderr)
+                finally:
+                    for key, value in saved.items():
+                        if value is None:
+                            os.environ.pop(key, None)
+                        else:
+                            os.environ[key] = value
+            finally:
+                shutil.rmtree(root)
+    return results
+
+
+def compare(base, results, threshold):
+    """Print the change against a base result, return the regressions."""
+    def key(x):
+        return x['files'], x['interface'], x['operation']
+
+    before = {key(x): x['seconds'] for x in base['results']}
+    regressions = 0
+    for result in results:
+        old = before.get(key(result))
+        if not old:
+            continue
+        ratio = result['seconds'] / old
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print('%8d %-4s %-12s %9.3f s -> %9.3f s  %5.2fx%s' % (
+            key(result) + (old, result['seconds'], ratio, flag)),
+            file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES[:2],
+                        help='repository sizes in files, up to %d' %
+                             SIZES[-1])
+    parser.add_argument('--interfaces', nargs='+', default=['api', 'cli'],
+                        choices=['api', 'cli'])
+    synthetic.add_arguments(parser)
+    parser.add_argument('--output', type=argparse.FileType('w'),
+                        default=sys.stdout,
+                        help='where to write the JSON results')
+    parser.add_argument('--compare', type=argparse.FileType('r'),
+                        help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown ratio counted as a regression')
+    args = parser.parse_args()
+
+    base = json.load(args.compare) if args.compare else None
+    if base is not None and base['parameters'] != synthetic.parameters(args):
+        parser.error('%s was generated with other parameters: %s' % (
+            args.compare.name, base['parameters']))
+    results = benchmark(args)
+    json.dump({
+        'version': VERSION,
+        'commit': commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'parameters': synthetic.parameters(args),
+        'results': results,
+    }, args.output, indent=1)
+    args.output.write('\n')
+
+    if base is not None:
+        return 1 if compare(base, results, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Generate a synthetic home directory and dotfiles repository.
+
+Every dotfile is a small file in the repository, nested `depth`
+directories deep.  A share of them is enabled in the home directory as
+symlinks or as identical copies, the rest are missing.  A share of the
+repository files is matched by the repository's ignore file, which is
+padded with patterns that match nothing, and a '.git' directory with
+loose objects is added next to the dotfiles.
+
+    python benchmarks/synthetic.py --files 10000 /tmp/synthetic
+"""
+
+import os
+import sys
+import random
+import argparse
+
+FANOUT = 16
+
+
+def _relpath(i, depth):
+    """Return the repository path of the i-th file."""
+    dirs = ['d%x' % ((i // FANOUT ** (level + 1)) % FANOUT)
+            for level in reversed(range(depth))]
+    return os.path.join(*(dirs + ['file%d' % i]))
+
+
+def _write(path, data):
+    try:
+        f = open(path, 'w')
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(path, 'w')
+    with f:
+        f.write(data)
+
+
+def generate(root, files, depth=2, ignored=0.05, patterns=20, links=0.5,
+             copies=0.1, git=1000, seed=0):
+    """Populate `root` and return the (home, repository) paths.
+
+    :param files:    the number of files in the repository, ignored ones
+                     included
+    :param depth:    the number of directories above each file
+    :param ignored:  the share of files matched by an ignore pattern
+    :param patterns: the number of extra ignore patterns matching nothing
+    :param links:    the share of dotfiles enabled as symlinks
+    :param copies:   the share of dotfiles enabled as copies
+    :param git:      the number of objects in the repository's .git
+    """
+    rng = random.Random(seed)
+    home = os.path.join(root, 'home')
+    repo = os.path.join(root, 'repo')
+    os.makedirs(home)
+    os.makedirs(repo)
+
+    with open(os.path.join(repo, '.dotfilesignore'), 'w') as f:
+        f.write('*.bak\ncache/\n')
+        for i in range(patterns):
+            f.write('nomatch%d*\n' % i)
+
+    for i in range(git):
+        _write(os.path.join(repo, '.git', 'objects', '%02x' % (i % 256),
+                            '%038x' % i), 'x')
+
+    for i in range(files):
+        rel = _relpath(i, depth)
+        data = '%d\n' % i
+        roll = rng.random()
+        if roll < ignored:
+            # alternate between ignored files and ignored directories
+            if i % 2:
+                _write(os.path.join(repo, rel + '.bak'), data)
+            else:
+                _write(os.path.join(repo, os.path.dirname(rel), 'cache',
+                                    os.path.basename(rel)), data)
+            continue
+
+        target = os.path.join(repo, rel)
+        name = os.path.join(home, '.' + rel)
+        _write(target, data)
+        roll = rng.random()
+        if roll < links:
+            os.makedirs(os.path.dirname(name), exist_ok=True)
+            os.symlink(os.path.relpath(target, os.path.dirname(name)), name)
+        elif roll < links + copies:
+            _write(name, data)
+
+    return home, repo
+
+
+def add_arguments(parser):
+    """Add the generator's parameters to an argument parser."""
+    parser.add_argument('--depth', type=int, default=2,
+                        help='directories above each file')
+    parser.add_argument('--ignored', type=float, default=0.05,
+                        help='share of files that are ignored')
+    parser.add_argument('--patterns', type=int, default=20,
+                        help='extra ignore patterns that match nothing')
+    parser.add_argument('--links', type=float, default=0.5,
+                        help='share of dotfiles enabled as symlinks')
+    parser.add_argument('--copies', type=float, default=0.1,
+                        help='share of dotfiles enabled as copies')
+    parser.add_argument('--git', type=int, default=1000,
+                        help='objects in the .git directory')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def parameters(args):
+    """Return the generator's keyword arguments from parsed arguments."""
+    return dict(depth=args.depth, ignored=args.ignored,
+                patterns=args.patterns, links=args.links,
+                copies=args.copies, git=args.git, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=1000)
+    add_arguments(parser)
+    parser.add_argument('root', help='an empty or missing directory')
+    args = parser.parse_args()
+
+    home, repo = generate(args.root, args.files, **parameters(args))
+    print('home: %s\nrepo: %s' % (home, repo))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import os
+import time
+
+from zlib import crc32
+
+from .index import atomic_write, cache_dir, StatIndex
+from .ignore import IGNORE_FILES
+from .manifest import NAME as MANIFEST
+from .status import scan
+
+
+DRIFT = ('missing', 'conflict')
+MAGIC = b'DCHK1'
+
+
+def _stamp(path):
+    """Return the (inode, mtime) pair of a path, or zeros if it is gone."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 0, 0
+    return st.st_ino, st.st_mtime_ns
+
+
+class Summary(object):
+    """The cached outcome of a drift check.
+
+    Along with whether any dotfile was found missing or in conflict, the
+    summary records the inode and mtime of every path the outcome was
+    derived from: all repository directories, ignore files and manifests,
+    the home directories holding the dotfiles, and the files of copied or
+    conflicting dotfiles.  Adding, removing or replacing a dotfile or a
+    link changes the mtime of its directory, so as long as none of these
+    stamps changed the outcome still holds.  Like the stat index, stamps
+    modified at or after the time the summary was taken are not trusted.
+
+    :param paths: the repository paths as given on the command line
+    :param home:  the home directory, the user's by default
+    """
+
+    def __init__(self, paths, home=None):
+        if home is None:
+            home = os.path.expanduser('~')
+        key = '\0'.join([os.path.abspath(os.path.expanduser(str(x)))
+                         for x in [home] + list(paths)])
+        self.path = os.path.join(cache_dir(),
+                                 'check-%08x' % crc32(os.fsencode(key)))
+        self.stamps = {}
+        self.written = 0
+        self.drift = None
+
+    def __repr__(self):
+        return '<Summary %r>' % self.path
+
+    @classmethod
+    def load(cls, paths, home=None):
+        """Load the summary for some repositories, or an empty one."""
+        summary = cls(paths, home)
+        try:
+            with open(summary.path, 'rb') as f:
+                header, _, records = f.read().partition(b'\n')
+            magic, written, drift = header.split()
+            if magic != MAGIC:
+                return summary
+            stamps = {}
+            for record in records.split(b'\0')[:-1]:
+                ino, mtime, path = record.split(b' ', 2)
+                stamps[os.fsdecode(path)] = (int(ino), int(mtime))
+        except (OSError, ValueError):
+            return summary
+        summary.stamps = stamps
+        summary.written = int(written)
+        summary.drift = drift == b'1'
+        return summary
+
+    def valid(self):
+        """Does the recorded outcome still hold?"""
+        if self.drift is None:
+            return False
+        for path, stamp in self.stamps.items():
+            if stamp[1] >= self.written or _stamp(path) != stamp:
+                return False
+        return True
+
+    def record(self, path):
+        """Stamp a path the outcome depends on, before it is examined."""
+        path = str(path)
+        if path not in self.stamps:
+            self.stamps[path] = _stamp(path)
+
+    def save(self):
+        """Write the summary, failures are silently ignored."""
+        header = b'%s %d %d\n' % (MAGIC, self.written, self.drift)
+        records = [b'%d %d %s\0' % (ino, mtime, os.fsencode(path))
+                   for path, (ino, mtime) in self.stamps.items()]
+        try:
+            atomic_write(self.path, [header] + records)
+        except OSError:
+            pass
+
+
+def check(repos, refresh=False):
+    """Return whether no dotfile in some repositories has drifted.
+
+    The answer is taken from the cached summary when none of the paths
+    it was derived from changed.  Otherwise the repositories are scanned,
+    stopping at the first missing or conflicting dotfile, and the summary
+    is taken again.
+
+    :param repos:   a Repositories collection, its repositories are only
+                    constructed when they have to be scanned
+    :param refresh: ignore the cached summary
+    """
+    if not refresh:
+        summary = Summary.load(repos.paths, repos.home)
+        if summary.valid():
+            return not summary.drift
+
+    summary = Summary(repos.paths, repos.home)
+    summary.written = int(time.time() * 1e9)
+    for repo in repos:
+        summary.record(repo.path)
+        for name in IGNORE_FILES + [MANIFEST]:
+            summary.record(repo.path / name)
+        for dir in repo._walk(repo.path, dirs=True):
+            summary.record(dir)
+
+    indexes = {repo: StatIndex.load(repo) for repo in repos}
+    summary.drift = False
+    for repo, dotfile, claims in scan(repos):
+        summary.record(os.path.dirname(str(dotfile)))
+        state = indexes[repo].state(dotfile)
+        if state in ('copy', 'conflict'):
+            summary.record(dotfile.name)
+            summary.record(dotfile.target)
+        if state in DRIFT:
+            summary.drift = True
+            break
+    else:
+        # the indexes only keep the dotfiles looked up, so a partial scan
+        # must not be saved
+        for index in indexes.values():
+            index.save()
+
+    summary.save()
+    return not summary.drift
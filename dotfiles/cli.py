@@ -1,15 +1,25 @@
+import os
 import click
 
+from itertools import chain
+from collections import OrderedDict
+from functools import update_wrapper
+
+from . import manifest
 from .exceptions import DotfileException
+from .plan import Plan
+from .status import report
+from .check import check as no_drift
+from .daemon import Daemon, POLL_INTERVAL, notify, query
 from .repository import Repositories
 
 
 def single(repos):
     """Raise an exception if multiple repositories are provided.
 
-    Certain operations (add, remove, etc...) can only be applied to a
-    single repository while other operations (list) can be applied
-    across multiple repositories.
+    Certain operations (writing a plan) can only be applied to a single
+    repository while other operations (list) can be applied across
+    multiple repositories.
     """
     if len(repos) > 1:
         raise click.BadParameter('Must specify exactly one repository.',
@@ -17,48 +27,234 @@ def single(repos):
     return repos[0]
 
 
-def confirm(method, files, repo):
-    """Return a list of files, or all files if none were specified.
+def read_paths(file, size=64 * 1024):
+    """Yield the NUL-delimited paths read from a binary file."""
+    rest = b''
+    while True:
+        chunk = file.read(size)
+        if not chunk:
+            break
+        parts = (rest + chunk).split(b'\0')
+        rest = parts.pop()
+        for part in parts:
+            if part:
+                yield os.fsdecode(part)
+    if rest:
+        yield os.fsdecode(rest)
+
+
+def given(files, from_file=None):
+    """Return the files given as arguments followed by those in a file."""
+    if from_file is None:
+        return files
+    return chain(files, read_paths(from_file))
+
+
+def confirm(method, files, repos, from_file=None):
+    """Return the files given, or all files if none were specified.
 
     When no files are specified, all files are assumed.  But before we
     go ahead, confirm to make sure this is the intended operation.
     """
-    if files:
+    if files or from_file is not None:
         # user has specified specific files, so we are not assuming all
-        return files
+        return given(files, from_file)
     # no files provided, so we assume all files after confirmation
     message = 'Are you sure you want to %s all dotfiles?' % method
     click.confirm(message, abort=True)
-    return str(repo).split()
+    return (str(dotfile) for repo in repos for dotfile in repo.contents())
+
 
+def show(repos, state, refresh=False, jobs=None):
+    """Print the dotfiles whose state is to be displayed.
 
-def show(repo, state):
-    """TODO"""
-    for dotfile in repo.contents():
+    The repositories are scanned concurrently and their dotfiles printed
+    in one stream sorted by home path.  States are looked up in each
+    repository's stat index, which is rebuilt from scratch when `refresh`
+    is set, and computed by `jobs` worker threads.  Home paths claimed by
+    more than one repository are flagged with the 'overlap' display.
+
+    When a 'dotfiles watch' daemon serves these repositories, its states
+    are shown instead, unless `refresh` is set.
+    """
+    entries = None if refresh else query(repos)
+    if entries is None:
+        entries = report(repos, jobs, refresh)
+    render(entries, state)
+
+
+def render(entries, state, home=None):
+    """Print (name, state, claims) entries as status shows them.
+
+    Names are joined to `home` when one is given.
+    """
+    def echo(display, text):
+        fg = display.get('color', None)
+        bold = display.get('bold', False)
+        click.secho('%c %s' % (display['char'], text), fg=fg, bold=bold)
+
+    last = None
+    for name, dotfile_state, claims in entries:
+        shown = name if home is None else os.path.join(home, name)
+        if claims and name != last:
+            echo(state['overlap'], '%s (%s)' % (shown, ', '.join(claims)))
+        last = name
         try:
-            display = state[dotfile.state]
+            display = state[dotfile_state]
         except KeyError:
             continue
-        char  = display['char']
-        name = dotfile.short_name(repo.home)
-        fg = display.get('color', None)
-        bold = display.get('bold', False)
-        click.secho('%c %s' % (char, name), fg=fg, bold=bold)
+        echo(display, shown)
+
+
+def fleet(repos, homes, jobs=None):
+    """Return a Fleet of repositories and home directories."""
+    # imported here, only needed for several home directories
+    from .fleet import Fleet
+    try:
+        return Fleet(repos, homes, jobs)
+    except FileNotFoundError as e:
+        raise click.ClickException('Directory not found: %s' % e)
 
 
-def perform(method, files, repo, copy, debug):
-    """Perform an operation on one or more dotfiles."""
+def perform_fleet(method, paths, repos, homes, copy, debug):
+    """Perform an operation in several home directories.
+
+    Paths are relative to each home directory.  What was done is shown
+    per home directory once every home directory has been handled.
+    """
+    paths = list(paths)
+    for path in paths:
+        if os.path.isabs(os.path.expanduser(path)):
+            raise click.BadParameter(
+                '%s: paths must be relative to the home directories' % path,
+                param_hint=['FILES'])
+    failed = 0
+    for result in fleet(repos, homes).perform(method, paths, copy, debug):
+        for line in result.messages + result.errors:
+            click.echo(line)
+        if result.failure is not None:
+            failed += 1
+            click.echo('ERROR: %s: %s' % (result.home, result.failure),
+                       err=True)
+    if failed:
+        raise click.ClickException('failed in %d of %d home directories' % (
+            failed, len(homes)))
+
+
+def perform(method, files, repo, copy, debug, plan_file=None):
+    """Perform an operation on one or more dotfiles.
+
+    The operation is planned for every dotfile before anything is
+    changed.  When a plan file is given, the plan is written to it
+    instead of being executed.  Returns whether the plan was executed.
+    """
+    plan = Plan(method, repo)
+    done = '%s%s' % (method, 'd' if method[-1] == 'e' else 'ed')
     for dotfile in repo.dotfiles(files):
         try:
-            getattr(dotfile, method)(copy, debug)
-            if not debug:
-                msg = '%s%s' % (method, 'd' if method[-1] == 'e' else 'ed')
-                click.echo('%s %s' % (msg, dotfile.short_name(repo.home)))
+            dotfile.plan(plan, method, copy)
         except DotfileException as err:
             click.echo(err)
+            continue
+        plan.done('%s %s' % (done, dotfile.short_name(repo.home)))
+
+    if plan_file is not None:
+        plan.dump(plan_file)
+        return False
+
+    execute(plan, debug)
+    return True
+
+
+def dispatch(method, files, repos, copy, debug, plan_file=None):
+    """Perform an operation, handing each file to the repository owning it.
+
+    With a single repository this is perform().  Otherwise an ownership
+    index of all repositories is built and every file goes to the one
+    repository with a dotfile at its path.  A directory is expanded once,
+    from the index, and each dotfile below it goes to its own repository.
+    A file to add goes to the repository owning its closest parent
+    directory.  Files owned by several repositories, or by none, are
+    reported and skipped.
+    """
+    if len(repos) == 1 or plan_file is not None:
+        return perform(method, files, single(repos), copy, debug, plan_file)
+
+    from .ownership import Ownership
+    owners = Ownership(repos)
+    routed = OrderedDict((repo, []) for repo in repos)
+    seen = set()
+    for path in files:
+        if path in seen:
+            continue
+        seen.add(path)
+        claims = owners.claims(path)
+        if method == 'add':
+            claims = claims or owners.below(path) or owners.nearest(path)
+            if len(claims) != 1:
+                click.echo('ERROR: \'%s\' %s, choose one with --repos' % (
+                    path, 'could belong to several repositories' if claims
+                    else 'belongs to no repository'))
+            else:
+                routed[claims[0]].append(path)
+            continue
+
+        if claims:
+            owned = [(path, claims)]
+        else:
+            # a directory, the dotfiles below it are taken from the index
+            owned = list(owners.files(path))
+            if not owned:
+                click.echo('ERROR: \'%s\' is not in any repository' % path)
+                continue
+        for name, claims in owned:
+            if name != path and name in seen:
+                continue
+            seen.add(name)
+            if len(claims) > 1:
+                click.echo('ERROR: \'%s\' is claimed by %s' % (
+                    name, ', '.join(str(x.path) for x in claims)))
+            else:
+                routed[claims[0]].append(name)
+
+    for repo, paths in routed.items():
+        if paths:
+            perform(method, paths, repo, copy, debug)
+    return True
+
+
+def execute(plan, debug, journal=None):
+    """Execute a plan and report what was done.
+
+    The manifest of the plan's repository, if it has one, is updated and
+    running daemons are told which directories changed.
+    """
+    try:
+        plan.execute(debug, journal)
+        if not debug:
+            manifest.update(plan)
+    except (OSError, ValueError) as err:
+        raise click.ClickException(str(err))
+    finally:
+        if not debug:
+            notify(plan.dirs())
+    if not debug:
+        for message in plan.messages:
+            click.echo(message)
+
+
+def pass_repos(f):
+    """Pass the repositories to a command, constructing them first."""
+    @click.pass_context
+    def new_func(ctx, *args, **kwargs):
+        try:
+            repos = ctx.find_object(Repositories).load()
+        except FileNotFoundError as e:
+            raise click.ClickException('Directory not found: %s' % e)
+        return ctx.invoke(f, repos, *args, **kwargs)
+    return update_wrapper(new_func, f)
 
 
-pass_repos = click.make_pass_decorator(Repositories)
 CONTEXT_SETTINGS = dict(auto_envvar_prefix='DOTFILES',
                         help_option_names=['-h', '--help'])
 
@@ -67,23 +263,53 @@ CONTEXT_SETTINGS = dict(auto_envvar_prefix='DOTFILES',
 @click.option('--repos', '-r', type=click.Path(), multiple=True,
               help='Repository locations.', default=['~/Dotfiles'],
               show_default=True)
+@click.option('--scan', type=click.Choice(['walk', 'git']), default='walk',
+              show_default=True,
+              help='Find repository files by walking them, or from the git '
+                   'index and the directories changed since the last run.')
+@click.option('--timings', is_flag=True,
+              help='Report where the time went, the file system calls made '
+                   'and the slowest dotfiles.')
+@click.option('--profile', type=click.Path(dir_okay=False),
+              help='Write cProfile statistics to a file.')
 @click.version_option(None, '-v', '--version')
 @click.pass_context
-def cli(ctx, repos):
+def cli(ctx, repos, scan, timings, profile):
     """Dotfiles is a tool to make managing your dotfile symlinks in $HOME easy,
     allowing you to keep all your dotfiles in a single directory.
     """
 
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+
+        def dump():
+            profiler.disable()
+            profiler.dump_stats(profile)
+
+        ctx.call_on_close(dump)
+        profiler.enable()
+
+    if timings:
+        # imported here so that commands without timings run unwrapped
+        from .timings import Timings
+        accounting = Timings()
+
+        def report():
+            accounting.uninstall()
+            for line in accounting.report():
+                click.echo(line, err=True)
+
+        ctx.call_on_close(report)
+        accounting.install()
+
     # temporary notice for folks tracking git
     import os
     if os.environ.get('DOTFILES_REPO'):
         click.echo("Error: repository variable has changed to \"DOTFILES_REPOS\", please update")
         exit(-1)
 
-    try:
-        ctx.obj = Repositories(repos)
-    except FileNotFoundError as e:
-        raise click.ClickException('Directory not found: %s' % e)
+    ctx.obj = Repositories(repos, scan=scan)
 
 
 @cli.command()
@@ -91,55 +317,81 @@ def cli(ctx, repos):
               help='Copy files instead of creating symlinks.')
 @click.option('-d', '--debug', is_flag=True,
               help='Show what would be executed.')
+@click.option('--plan', 'plan_file', type=click.File('w'),
+              help='Write the operations to a file instead of executing '
+                   'them.')
+@click.option('--from-file', type=click.File('rb'),
+              help='Read NUL-delimited paths from a file, - for stdin.')
 @click.argument('files', nargs=-1, type=click.Path())
 @pass_repos
-def add(repos, copy, debug, files):
+def add(repos, copy, debug, plan_file, from_file, files):
     """Add dotfiles to a repository."""
-    repo = single(repos)
-    perform('add', files, repo, copy, debug)
+    dispatch('add', given(files, from_file), repos, copy, debug, plan_file)
 
 
 @cli.command()
 @click.option('-d', '--debug', is_flag=True,
               help='Show what would be executed.')
+@click.option('--plan', 'plan_file', type=click.File('w'),
+              help='Write the operations to a file instead of executing '
+                   'them.')
+@click.option('--from-file', type=click.File('rb'),
+              help='Read NUL-delimited paths from a file, - for stdin.')
 @click.argument('files', nargs=-1, type=click.Path(exists=True))
 @pass_repos
-def remove(repos, debug, files):
+def remove(repos, debug, plan_file, from_file, files):
     """Remove dotfiles from a repository."""
-    repo = single(repos)
-    files = confirm('remove', files, repo)
-    perform('remove', files, repo, False, debug)
-    if not debug:
-        # pruning will remove any remaining empty directories
-        repo.prune()
+    files = confirm('remove', files, repos, from_file)
+    dispatch('remove', files, repos, False, debug, plan_file)
 
 
 @cli.command()
 @click.option('-a', '--all',   is_flag=True, help='Show all dotfiles.')
 @click.option('-c', '--color', is_flag=True, help='Enable color output.')
+@click.option('--refresh', is_flag=True,
+              help='Rebuild the stat index instead of trusting it.')
+@click.option('-j', '--jobs', type=click.IntRange(min=1),
+              help='Number of dotfiles, or home directories with --home, to '
+                   'examine in parallel.  [default: based on the file '
+                   'system]')
+@click.option('--home', 'homes', multiple=True,
+              type=click.Path(exists=True, file_okay=False),
+              help='Show the status in this home directory instead of yours. '
+                   ' May be given several times.')
 @pass_repos
-def status(repos, all, color):
+def status(repos, all, color, refresh, jobs, homes):
     """Show current status of dotfiles.
 
     By default only non-OK dotfiles are shown.  This can be overridden
     with the '-a, --all' flag.
 
+    States are cached in a stat index so that unchanged dotfiles are not
+    examined again, the '--refresh' flag rebuilds this index.  If 'dotfiles
+    watch' is running for the same repositories, its states are used.
+
+    With '--home', the status in each home directory given is shown
+    instead, with full paths.  The repositories are scanned once for all
+    of them and the home directories are examined in parallel.
+
     Legend:
 
       l: symlink  c: copy  e: external symlink
 
-      ?: missing  !: conflict
+      ?: missing  !: conflict  =: overlap
 
     Meaning:
 
       * Missing: Not found in your home directory.
 
       * Conflict: Different from the file in your home directory.
+
+      * Overlap: Claimed by more than one repository.
     """
     bold = True if all and not color else False
     state = {
         'missing':  {'char': '?', 'bold': bold},
         'conflict': {'char': '!', 'bold': bold},
+        'overlap':  {'char': '=', 'bold': bold},
     }
 
     if all:
@@ -150,9 +402,33 @@ def status(repos, all, color):
     if color:
         state['missing'].update( {'color': 'yellow'})
         state['conflict'].update({'color': 'magenta'})
+        state['overlap'].update({'color': 'red'})
 
-    for repo in repos:
-        show(repo, state)
+    if homes:
+        for home, entries in fleet(repos, homes, jobs).status(refresh):
+            render(entries, state, home)
+        return
+    show(repos, state, refresh, jobs)
+
+
+@cli.command()
+@click.option('--refresh', is_flag=True,
+              help='Scan the repositories instead of trusting the cached '
+                   'result.')
+@click.pass_context
+def check(ctx, refresh):
+    """Exit with a non-zero status if dotfiles have drifted.
+
+    Nothing is printed.  The exit status is 1 when any dotfile is missing
+    or in conflict, which makes this cheap enough to run from a shell
+    prompt: the result is cached and only examined again once the
+    repository or the home directories holding dotfiles change.
+    """
+    try:
+        clean = no_drift(ctx.find_object(Repositories), refresh)
+    except FileNotFoundError as e:
+        raise click.ClickException('Directory not found: %s' % e)
+    ctx.exit(0 if clean else 1)
 
 
 @cli.command()
@@ -160,22 +436,137 @@ def status(repos, all, color):
               help='Copy files instead of creating symlinks.')
 @click.option('-d', '--debug', is_flag=True,
               help='Show what would be executed.')
+@click.option('--plan', 'plan_file', type=click.File('w'),
+              help='Write the operations to a file instead of executing '
+                   'them.')
+@click.option('--from-file', type=click.File('rb'),
+              help='Read NUL-delimited paths from a file, - for stdin.')
+@click.option('--home', 'homes', multiple=True,
+              type=click.Path(exists=True, file_okay=False),
+              help='Enable in this home directory instead of yours, FILES '
+                   'are then relative to it.  May be given several times.')
 @click.argument('files', nargs=-1, type=click.Path())
 @pass_repos
-def enable(repos, copy, debug, files):
-    """Link dotfiles into your home directory."""
-    repo = single(repos)
-    files = confirm('enable', files, repo)
-    perform('enable', files, repo, copy, debug)
+def enable(repos, copy, debug, plan_file, from_file, homes, files):
+    """Link dotfiles into your home directory.
+
+    With '--home', dotfiles are linked into the home directories given
+    instead.  The repositories are scanned once for all of them and the
+    home directories are handled in parallel.
+    """
+    if homes:
+        if plan_file is not None:
+            raise click.BadParameter('cannot be used with --home',
+                                     param_hint=['--plan'])
+        if not files and from_file is None:
+            click.confirm('Are you sure you want to enable all dotfiles in '
+                          '%d home directories?' % len(homes), abort=True)
+        perform_fleet('enable', given(files, from_file), repos, homes, copy,
+                      debug)
+        return
+    files = confirm('enable', files, repos, from_file)
+    dispatch('enable', files, repos, copy, debug, plan_file)
 
 
 @cli.command()
 @click.option('-d', '--debug', is_flag=True,
               help='Show what would be executed.')
+@click.option('--plan', 'plan_file', type=click.File('w'),
+              help='Write the operations to a file instead of executing '
+                   'them.')
+@click.option('--from-file', type=click.File('rb'),
+              help='Read NUL-delimited paths from a file, - for stdin.')
 @click.argument('files', nargs=-1, type=click.Path())
 @pass_repos
-def disable(repos, debug, files):
+def disable(repos, debug, plan_file, from_file, files):
     """Unlink dotfiles from your home directory."""
-    repo = single(repos)
-    files = confirm('disable', files, repo)
-    perform('disable', files, repo, False, debug)
+    files = confirm('disable', files, repos, from_file)
+    dispatch('disable', files, repos, False, debug, plan_file)
+
+
+@cli.command()
+@click.option('-d', '--debug', is_flag=True,
+              help='Show what would be executed.')
+@click.argument('plan', type=click.Path(exists=True, dir_okay=False))
+def apply(debug, plan):
+    """Execute a plan written with the '--plan' option.
+
+    The repository is not scanned again.  Progress is journaled next to
+    the plan file, so an interrupted run continues where it stopped when
+    it is applied again.
+    """
+    try:
+        with open(plan) as f:
+            loaded = Plan.load(f)
+    except (ValueError, KeyError) as err:
+        raise click.ClickException('Invalid plan: %s' % err)
+    execute(loaded, debug, journal='%s.journal' % plan)
+
+
+@cli.command()
+@click.option('--rebuild', is_flag=True,
+              help='Write a new manifest of the repository contents.')
+@pass_repos
+def verify(repos, rebuild):
+    """Check repository manifests for drift.
+
+    A repository with a '.dotfiles-manifest' file has its contents read
+    from there instead of being walked.  The manifest is kept up to date
+    by add and remove, this compares it to the files actually in the
+    repository.  Exits with status 1 if they differ.
+
+    The '--rebuild' flag writes a new manifest instead, which also
+    creates one for repositories that have none.
+
+    Legend:
+
+      +: untracked  -: missing  ~: modified
+    """
+    chars = {'untracked': '+', 'missing': '-', 'modified': '~'}
+    drift = False
+    for repo in repos:
+        if rebuild:
+            listed = manifest.Manifest.build(repo)
+            listed.save()
+            click.echo('Wrote %s with %d files' % (listed.path, len(listed)))
+            continue
+        try:
+            listed = manifest.Manifest.load(repo.path)
+        except ValueError as err:
+            raise click.ClickException(str(err))
+        if listed is None:
+            click.echo('%s has no manifest, see --rebuild' % repo.path)
+            continue
+        for change, relpath in listed.compare(repo):
+            drift = True
+            click.echo('%c %s' % (chars[change],
+                                  os.path.join(str(repo.path), relpath)))
+    if drift:
+        click.get_current_context().exit(1)
+
+
+@cli.command()
+@click.option('-i', '--interval', type=float, default=POLL_INTERVAL,
+              show_default=True,
+              help='Seconds between scans when polling.')
+@click.option('--poll', is_flag=True,
+              help='Poll even if file system events are available.')
+@pass_repos
+def watch(repos, interval, poll):
+    """Keep dotfile states up to date for 'status'.
+
+    Runs in the foreground until interrupted.  Dotfiles are examined
+    again as soon as the file system reports changes to them, or
+    periodically where such reports are unavailable.  The status command
+    asks the running watcher instead of scanning the repositories.
+    """
+    import signal
+
+    daemon = Daemon(repos, interval, poll)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda signum, frame: daemon.stop())
+    click.echo('Listening on %s' % daemon.path)
+    try:
+        daemon.serve_forever()
+    except RuntimeError as err:
+        raise click.ClickException(str(err))
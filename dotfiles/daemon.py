@@ -0,0 +1,380 @@
+import os
+import json
+import time
+import struct
+
+from zlib import crc32
+
+from .index import cache_dir, StatIndex
+from .status import scan, classify
+
+
+PROTOCOL = 1
+DEBOUNCE = 0.05
+POLL_INTERVAL = 2.0
+QUERY_TIMEOUT = 0.5
+WAKEUP = 1.0
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+              IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+              IN_MOVE_SELF | IN_ONLYDIR)
+EVENT = struct.Struct('iIII')
+
+
+def _runtime_dir():
+    return os.environ.get('XDG_RUNTIME_DIR') or cache_dir()
+
+
+def socket_path(repos):
+    """Return the socket a daemon for some repositories listens on."""
+    key = '\0'.join([str(repos[0].home)] + [str(x.path) for x in repos])
+    return os.path.join(_runtime_dir(),
+                        'dotfiles-%08x.sock' % crc32(os.fsencode(key)))
+
+
+def query(repos, timeout=QUERY_TIMEOUT):
+    """Ask a running daemon for the status of some repositories.
+
+    Returns a list of (name, state, claims) tuples like status.report()
+    yields, or None when no daemon is answering.
+    """
+    path = socket_path(repos)
+    if not os.path.exists(path):
+        return None
+
+    import socket
+
+    chunks = []
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(b'status\n')
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        data = json.loads(b''.join(chunks).decode())
+    except (OSError, ValueError):
+        return None
+    if data.get('protocol') != PROTOCOL:
+        return None
+    return [(name, state, tuple(claims))
+            for name, state, claims in data['entries']]
+
+
+def notify(dirs):
+    """Tell running daemons that files in some directories were changed.
+
+    Every daemon listening in the runtime directory is told, those that
+    do not serve the directories ignore them.  A polling daemon examines
+    the directories again before it answers another query, so a status
+    right after a change is not stale.
+    """
+    base = _runtime_dir()
+    try:
+        names = [x for x in os.listdir(base)
+                 if x.startswith('dotfiles-') and x.endswith('.sock')]
+    except OSError:
+        return
+    if not dirs or not names:
+        return
+
+    import socket
+
+    message = b'changed\n' + b'\0'.join(os.fsencode(x) for x in dirs)
+    for name in names:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(QUERY_TIMEOUT)
+                sock.connect(os.path.join(base, name))
+                sock.sendall(message)
+        except OSError:
+            pass
+
+
+def _merge(pending, dirs):
+    """Add directories that saw events to the pending ones.
+
+    None stands for every directory, after the kernel dropped events.
+    """
+    if pending is None or dirs is None:
+        return None
+    return pending | dirs
+
+
+class Inotify(object):
+    """A minimal inotify(7) binding using ctypes.
+
+    Raises OSError when inotify is not available on this platform.
+    """
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            raise OSError('inotify is not available')
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.fd = fd
+        self.watches = {}
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        os.close(self.fd)
+
+    def watch(self, path):
+        """Watch a directory, watching it again is harmless."""
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            return False
+        self.watches[wd] = path
+        return True
+
+    def read(self):
+        """Return the set of watched directories that saw events.
+
+        Every queued event is read.  None is returned when the kernel
+        dropped events, in which case everything must be examined again.
+        """
+        dirs = set()
+        overflow = False
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buf):
+                wd, mask, cookie, length = EVENT.unpack_from(buf, offset)
+                offset += EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                path = self.watches.get(wd)
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                if path is not None:
+                    dirs.add(path)
+        return None if overflow else dirs
+
+
+class Daemon(object):
+    """Keep the state of every dotfile up to date and serve it.
+
+    The state table is built with a full scan and afterwards updated from
+    inotify events: a change in a home directory reclassifies the
+    dotfiles below it, a change in a repository scans again.  Without
+    inotify, the repositories are scanned every `interval` seconds, which
+    is cheap since the stat index spares unchanged dotfiles.
+
+    Status queries are answered over a Unix domain socket from a reply
+    that is serialized whenever the table changes.  Since the client may
+    just have changed dotfiles itself, events still waiting to settle are
+    applied before a query is answered.  When polling, the commands that
+    change dotfiles tell the daemon where they did, see notify(), and
+    only those directories are examined again.
+
+    :param repos:    the repositories to watch
+    :param interval: seconds between scans when polling
+    :param polling:  poll even when inotify is available
+    """
+
+    def __init__(self, repos, interval=POLL_INTERVAL, polling=False):
+        self.repos = repos
+        self.interval = interval
+        self.path = socket_path(repos)
+        self.indexes = {repo: StatIndex.load(repo) for repo in repos}
+        self.entries = []
+        self.reply = b''
+        self.inotify = None
+        if not polling:
+            try:
+                self.inotify = Inotify()
+            except OSError:
+                pass
+        self._running = False
+        self._server = None
+
+    def __repr__(self):
+        return '<Daemon %r>' % self.path
+
+    def _state(self, item):
+        repo, dotfile, claims = item
+        return self.indexes[repo].state(dotfile)
+
+    def _watch(self, path):
+        """Watch a directory, or its closest existing parent."""
+        while not self.inotify.watch(path):
+            parent = os.path.dirname(path)
+            if parent == path:
+                return
+            path = parent
+
+    def rescan(self):
+        """Build the state table from scratch.
+
+        The ignore files are read again, they may be what changed.
+        """
+        for repo in self.repos:
+            repo.reload_ignore()
+        self.entries = [[item, state] for item, state in
+                        classify(scan(self.repos), 1, self._state)]
+        if self.inotify is not None:
+            for repo in self.repos:
+                self._watch(str(repo.path))
+                for dir in repo._walk(repo.path, dirs=True):
+                    self._watch(str(dir))
+            for (repo, dotfile, claims), _ in self.entries:
+                self._watch(os.path.dirname(str(dotfile)))
+        self._update()
+
+    def reclassify(self, dirs):
+        """Examine the dotfiles below some home directories again."""
+        prefixes = tuple(os.path.join(x, '') for x in dirs)
+        for entry in self.entries:
+            repo, dotfile, claims = entry[0]
+            if str(dotfile).startswith(prefixes):
+                dotfile.refresh()
+                entry[1] = self._state(entry[0])
+                if self.inotify is not None:
+                    self._watch(os.path.dirname(str(dotfile)))
+        self._update()
+
+    def _update(self):
+        entries = [(str(dotfile.short_name(repo.home)), state,
+                    [str(x.path) for x in claims])
+                   for (repo, dotfile, claims), state in self.entries]
+        self.reply = json.dumps({'protocol': PROTOCOL,
+                                 'entries': entries}).encode()
+        for index in self.indexes.values():
+            index.save()
+
+    def _changed(self, dirs):
+        """Handle a batch of inotify events."""
+        repo_paths = tuple(os.path.join(str(x.path), '') for x in self.repos)
+        if dirs is None or any(os.path.join(x, '').startswith(repo_paths)
+                               for x in dirs):
+            self.rescan()
+        elif dirs:
+            self.reclassify(dirs)
+
+    def _answer(self, conn):
+        """Answer a status query, or handle a change notification."""
+        chunks = []
+        with conn:
+            conn.settimeout(QUERY_TIMEOUT)
+            try:
+                chunk = conn.recv(65536)
+                if chunk.startswith(b'status'):
+                    conn.sendall(self.reply)
+                    return
+                while chunk:
+                    chunks.append(chunk)
+                    chunk = conn.recv(65536)
+            except OSError:
+                return
+        request = b''.join(chunks)
+        # inotify already reported these changes
+        if request.startswith(b'changed\n') and self.inotify is None:
+            dirs = request[len(b'changed\n'):].split(b'\0')
+            self._changed({os.fsdecode(x) for x in dirs if x})
+
+    def _listen(self):
+        import socket
+
+        if os.path.exists(self.path):
+            if query(self.repos) is not None:
+                raise RuntimeError('already running: %s' % self.path)
+            os.unlink(self.path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        os.chmod(self.path, 0o600)
+        server.listen(16)
+        server.setblocking(False)
+        return server
+
+    def serve_forever(self):
+        """Scan, then answer queries and follow changes until stopped."""
+        import selectors
+
+        self._server = server = self._listen()
+        self._running = True
+        selector = selectors.DefaultSelector()
+        selector.register(server, selectors.EVENT_READ, 'query')
+        if self.inotify is not None:
+            selector.register(self.inotify, selectors.EVENT_READ, 'event')
+
+        try:
+            self.rescan()
+            pending = set()
+            deadline = time.monotonic() + self.interval
+            while self._running:
+                if self.inotify is None:
+                    timeout = min(WAKEUP, deadline - time.monotonic())
+                elif pending is None or pending:
+                    timeout = DEBOUNCE
+                else:
+                    timeout = WAKEUP
+                settled = True
+                for key, _ in selector.select(max(0, timeout)):
+                    if key.data == 'query':
+                        try:
+                            conn, _ = server.accept()
+                        except BlockingIOError:
+                            continue
+                        if self.inotify is not None:
+                            pending = _merge(pending, self.inotify.read())
+                            if pending is None or pending:
+                                self._changed(pending)
+                                pending = set()
+                        self._answer(conn)
+                    else:
+                        settled = False
+                        pending = _merge(pending, self.inotify.read())
+                if self.inotify is None:
+                    if time.monotonic() >= deadline:
+                        self.rescan()
+                        deadline = time.monotonic() + self.interval
+                elif settled and (pending is None or pending):
+                    # events have settled down, apply them
+                    self._changed(pending)
+                    pending = set()
+        finally:
+            selector.close()
+            server.close()
+            if self.inotify is not None:
+                self.inotify.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def stop(self):
+        """Make serve_forever() return within a second.
+
+        This may be called from a signal handler or another thread.
+        """
+        self._running = False
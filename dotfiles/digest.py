@@ -0,0 +1,186 @@
+import os
+import time
+import struct
+import threading
+
+from collections import OrderedDict
+
+from .index import atomic_write, cache_dir
+
+
+# header: magic, version, entry count
+HEADER = struct.Struct('<4sHI')
+# entry: dev, ino, size, mtime_ns, ctime_ns and the digest
+ENTRY = struct.Struct('<QQqqq16s')
+MAGIC = b'DDIG'
+VERSION = 1
+
+DIGEST_SIZE = 16
+CHUNK_SIZE = 1024 * 1024
+MAX_ENTRIES = 16384
+# files changed this recently may change again without a new ctime
+SETTLE_NS = 2 * 10 ** 9
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def _key(st):
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns
+
+
+def _hash(path):
+    """Return the blake2b digest of a file's contents."""
+    # imported here, hashlib is slow to import and rarely needed
+    from hashlib import blake2b
+    h = blake2b(digest_size=DIGEST_SIZE)
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                return h.digest()
+            h.update(view[:n])
+
+
+def _compare(a, b):
+    """Return the digest of two files if their contents are identical.
+
+    Both files are read side by side in chunks and hashed on the way.
+    Reading stops at the first chunk that differs, in which case None is
+    returned.
+    """
+    # imported here, hashlib is slow to import and rarely needed
+    from hashlib import blake2b
+    h = blake2b(digest_size=DIGEST_SIZE)
+    buf_a, buf_b = bytearray(CHUNK_SIZE), bytearray(CHUNK_SIZE)
+    view_a, view_b = memoryview(buf_a), memoryview(buf_b)
+    with open(a, 'rb', buffering=0) as f, open(b, 'rb', buffering=0) as g:
+        while True:
+            n = f.readinto(buf_a)
+            if n != g.readinto(buf_b) or view_a[:n] != view_b[:n]:
+                return None
+            if not n:
+                return h.digest()
+            h.update(view_a[:n])
+
+
+class DigestCache(object):
+    """A persistent map of file versions to content digests.
+
+    A file version is identified by its device, inode, size, mtime and
+    ctime, any write to the file changes at least the ctime.  Only the
+    most recently used `size` entries are kept.  One cache is shared by
+    all repositories, see shared().
+
+    :param size: the maximum number of entries
+    """
+
+    def __init__(self, size=MAX_ENTRIES):
+        self.path = os.path.join(cache_dir(), 'digests')
+        self.size = size
+        self.entries = OrderedDict()
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return '<DigestCache %r>' % self.path
+
+    @classmethod
+    def load(cls, size=MAX_ENTRIES):
+        """Load the cache, or an empty one."""
+        cache = cls(size)
+        try:
+            with open(cache.path, 'rb') as f:
+                data = f.read()
+            magic, version, count = HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION or \
+                    len(data) != HEADER.size + count * ENTRY.size:
+                raise ValueError('unknown digest cache format')
+            for entry in ENTRY.iter_unpack(data[HEADER.size:]):
+                cache.entries[entry[:5]] = entry[5]
+        except (OSError, ValueError, struct.error):
+            cache.entries.clear()
+        while len(cache.entries) > size:
+            cache.entries.popitem(last=False)
+        return cache
+
+    def lookup(self, st):
+        """Return the cached digest of a file version, or None."""
+        key = _key(st)
+        with self._lock:
+            digest = self.entries.get(key)
+            if digest is not None:
+                self.entries.move_to_end(key)
+            return digest
+
+    def _store(self, st, digest, started):
+        """Cache a digest taken at `started`, unless the file is too new."""
+        if started - st.st_ctime_ns < SETTLE_NS:
+            return
+        with self._lock:
+            self.entries[_key(st)] = digest
+            self.dirty = True
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def digest(self, path, st):
+        """Return the digest of a file, given its current stat data."""
+        digest = self.lookup(st)
+        if digest is not None:
+            return digest
+        started = int(time.time() * 1e9)
+        digest = _hash(path)
+        self._store(st, digest, started)
+        return digest
+
+    def same(self, a, a_st, b, b_st):
+        """Do two files of the same size have identical contents?
+
+        When the digests of both are cached, they are compared.  Otherwise
+        the files themselves are compared chunk by chunk, stopping at the
+        first difference, and their digest is only cached when they turn
+        out to be identical.
+        """
+        digest_a, digest_b = self.lookup(a_st), self.lookup(b_st)
+        if digest_a is not None and digest_b is not None:
+            return digest_a == digest_b
+        started = int(time.time() * 1e9)
+        digest = _compare(a, b)
+        if digest is None:
+            return False
+        self._store(a_st, digest, started)
+        self._store(b_st, digest, started)
+        return True
+
+    def save(self):
+        """Write the cache if it changed, failures are silently ignored."""
+        if not self.dirty:
+            return
+        with self._lock:
+            entries = [ENTRY.pack(*(key + (digest,)))
+                       for key, digest in self.entries.items()]
+            self.dirty = False
+        header = HEADER.pack(MAGIC, VERSION, len(entries))
+        try:
+            atomic_write(self.path, [header] + entries)
+        except OSError:
+            pass
+
+
+def shared():
+    """Return the cache shared by all dotfiles, loading it on first use.
+
+    The cache is saved when the interpreter exits.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            import atexit
+            _shared = DigestCache.load()
+            atexit.register(_shared.save)
+    return _shared
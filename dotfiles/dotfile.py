@@ -1,79 +1,278 @@
 import os
+import stat
 
-from click import echo
-from hashlib import md5
 from pathlib import Path
+from functools import lru_cache
 
 from .exceptions import \
     IsSymlink, NotASymlink, Exists, NotFound, Dangling, \
-    TargetExists, TargetMissing
+    TargetExists, TargetMissing, Modified
 
 UNUSED = False
+MAX_SYMLINKS = 40
+
+
+def _lstat(path, handles=None):
+    try:
+        if handles is None:
+            return os.lstat(path)
+        fd, name = handles.split(path)
+        return os.stat(name, dir_fd=fd, follow_symlinks=False)
+    except OSError:
+        return None
+
+
+def _stat(path, handles=None):
+    try:
+        if handles is None:
+            return os.stat(path)
+        fd, name = handles.split(path)
+        return os.stat(name, dir_fd=fd)
+    except OSError:
+        return None
+
+
+def _readlink(path, handles=None):
+    if handles is None:
+        return os.readlink(path)
+    fd, name = handles.split(path)
+    return os.readlink(name, dir_fd=fd)
+
+
+@lru_cache(maxsize=None)
+def _realpath(dir):
+    """Return the canonical path of a directory, cached for this run."""
+    return os.path.realpath(dir)
+
+
+@lru_cache(maxsize=1024)
+def _relpath(dir, start):
+    return os.path.relpath(dir, start)
+
+
+def clear_caches():
+    """Forget cached directory resolutions."""
+    _realpath.cache_clear()
+    _relpath.cache_clear()
+
+
+def relative_link(target, dir):
+    """Return the link text for a symlink in dir that points to target.
+
+    The relative path between the two directories is computed once per
+    pair of directories and reused for every file in them.
+    """
+    target_dir, base = os.path.split(str(target))
+    relpath = _relpath(target_dir, str(dir))
+    return base if relpath == '.' else os.path.join(relpath, base)
+
+
+def resolve(path):
+    """Resolve all symlinks in a path.
+
+    The parent directory is resolved through a cache, so dotfiles that
+    share parent directories only pay for resolving them once.  Only the
+    final component, and whatever its link text points to, is examined
+    for each call.
+    """
+    path = str(path)
+    for _ in range(MAX_SYMLINKS):
+        parent, base = os.path.split(path)
+        path = os.path.join(_realpath(parent), base)
+        try:
+            link = os.readlink(path)
+        except OSError:
+            return Path(path)
+        path = os.path.join(os.path.dirname(path), link)
+    return Path(os.path.realpath(path))
+
+
+class Snapshot(object):
+    """The stat data of a dotfile's name and target at one point in time.
+
+    Taking a snapshot costs one lstat per path, plus a readlink and a
+    stat for paths that turn out to be symlinks.  Everything needed to
+    classify a dotfile or to check the preconditions of an operation is
+    answered from this data.
+
+    :param shared:  a snapshot of another dotfile with the same name, whose
+                    name data is reused instead of examining the name again
+    :param handles: DirectoryHandles to examine both paths relative to, as
+                    plans do, see Plan.handles
+    """
+    __slots__ = ('name_lstat', 'name_stat', 'link', 'target_lstat',
+                 'target_stat')
+
+    def __init__(self, name, target, shared=None, handles=None):
+        if shared is not None:
+            # another dotfile with the same name has been examined already
+            self.name_lstat = shared.name_lstat
+            self.name_stat = shared.name_stat
+            self.link = shared.link
+        else:
+            self.name_lstat = _lstat(name, handles)
+            self.name_stat = self.name_lstat
+            self.link = None
+            if self.name_lstat and stat.S_ISLNK(self.name_lstat.st_mode):
+                try:
+                    self.link = _readlink(name, handles)
+                except OSError:
+                    pass
+                self.name_stat = _stat(name, handles)
+
+        self.target_lstat = _lstat(target, handles)
+        self.target_stat = self.target_lstat
+        if self.target_is_symlink:
+            self.target_stat = _stat(target, handles)
+
+    @property
+    def name_exists(self):
+        return self.name_stat is not None
+
+    @property
+    def name_is_symlink(self):
+        return self.link is not None
+
+    @property
+    def target_exists(self):
+        return self.target_stat is not None
+
+    @property
+    def target_is_symlink(self):
+        return (self.target_lstat is not None and
+                stat.S_ISLNK(self.target_lstat.st_mode))
+
+    @property
+    def target_is_file(self):
+        return (self.target_stat is not None and
+                stat.S_ISREG(self.target_stat.st_mode))
+
+    @property
+    def samefile(self):
+        """Do name and target, following symlinks, refer to one file?"""
+        if self.name_stat is None or self.target_stat is None:
+            return False
+        return ((self.name_stat.st_dev, self.name_stat.st_ino) ==
+                (self.target_stat.st_dev, self.target_stat.st_ino))
 
 
 class Dotfile(object):
     """A configuration file managed within a repository.
 
+    Repositories hold one dotfile per file, so they are kept small: both
+    paths are stored as strings and Path objects are only built when the
+    name or target attribute is used.  `key` sorts dotfiles in the order
+    of their names, component by component, as comparing the names as
+    Path objects would.
+
     :param name:   name of the symlink in the home directory (~/.vimrc)
     :param target: where the symlink should point to (~/Dotfiles/vimrc)
+    :param mapper: the PathMapper of the repository the dotfile belongs
+                   to, if any, which relative symlinks are computed with
+    :param blob:   the target's Blob in the repository's git index, if
+                   known, which copies can be compared against
     """
+    __slots__ = ('_name', '_target', '_name_path', '_target_path',
+                 '_snapshot', '_mapper', '_blob', 'key')
+
     RELATIVE_SYMLINKS = True
 
-    def __init__(self, name, target):
+    def __init__(self, name, target, mapper=None, blob=None):
         # if not name.is_file() and not name.is_symlink():
         #     raise NotFound(name)
-        self.name = Path(name)
-        self.target = Path(target)
+        self._name = str(name)
+        self._target = str(target)
+        self._name_path = None
+        self._target_path = None
+        self._snapshot = None
+        self._mapper = mapper
+        self._blob = blob
+        # '\0' sorts before any character of a file name, so names are
+        # compared component by component
+        self.key = self._name.replace('/', '\0')
 
     def __str__(self):
-        return str(self.name)
+        return self._name
 
     def __repr__(self):
         return '<Dotfile %r>' % self.name
 
-    def _ensure_dirs(self, debug):
+    @property
+    def name(self):
+        """The symlink in the home directory, as a Path."""
+        if self._name_path is None:
+            self._name_path = Path(self._name)
+        return self._name_path
+
+    @property
+    def target(self):
+        """What the symlink points to in the repository, as a Path."""
+        if self._target_path is None:
+            self._target_path = Path(self._target)
+        return self._target_path
+
+    @property
+    def snapshot(self):
+        """The stat data this dotfile is examined with, taken on first use."""
+        if self._snapshot is None:
+            self._snapshot = Snapshot(self._name, self._target)
+        return self._snapshot
+
+    def share_snapshot(self, other):
+        """Take a snapshot reusing the name data of another dotfile's."""
+        self._snapshot = Snapshot(self._name, self._target,
+                                  shared=other.snapshot)
+
+    def refresh(self):
+        """Discard the snapshot so the file system is examined again."""
+        self._snapshot = None
+
+    def _ensure_dirs(self, plan):
         """Ensure the directories for both name and target are in place.
 
         This is needed for the 'add' and 'link' operations where the
         directory structure is expected to exist.
         """
-        def ensure(dir, debug):
-            if not dir.is_dir():
-                if debug:
-                    echo('MKDIR  %s' % dir)
-                else:
-                    dir.mkdir(parents=True)
-
-        ensure(self.name.parent, debug)
-        ensure(self.target.parent, debug)
-
-    def _prune_dirs(self, debug):
-        # TODO
-        if debug:
-            echo('PRUNE  <TODO>')
-
-    def _link(self, debug, home):
+        plan.mkdir(os.path.dirname(self._name))
+        plan.mkdir(os.path.dirname(self._target))
+
+    def _prune_dirs(self, plan):
+        """Remove the directories of name once they are left empty."""
+        plan.prune(os.path.dirname(self._name))
+
+    def _link(self, plan):
         """Create a symlink from name to target, no error checking."""
-        source = self.name
-        target = self.target
+        source = self._name
+        target = self._target
 
-        if self.name.is_symlink():
-            source = self.target
-            target = self.name.resolve()
+        if self.snapshot.name_is_symlink:
+            source = self._target
+            target = resolve(self._name)
+        elif self.RELATIVE_SYMLINKS and self._mapper is not None:
+            target = self._mapper.link(source)
         elif self.RELATIVE_SYMLINKS:
-            target = os.path.relpath(target, source.parent)
+            target = relative_link(target, os.path.dirname(source))
 
-        if debug:
-            echo('LINK   %s -> %s' % (source, target))
-        else:
-            source.symlink_to(target)
+        plan.link(source, target)
 
-    def _unlink(self, debug):
-        """Remove a symlink in the home directory, no error checking."""
-        if debug:
-            echo('UNLINK %s' % self.name)
-        else:
-            self.name.unlink()
+    def _copy(self, plan):
+        """Copy the target over name, no error checking."""
+        plan.copy(self._target, self._name)
+
+    def _check_copy(self):
+        """Raise unless name is an unmodified copy of the target."""
+        snapshot = self.snapshot
+        if snapshot.name_lstat is None or \
+                not stat.S_ISREG(snapshot.name_lstat.st_mode):
+            raise NotASymlink(self.name)
+        if not snapshot.target_is_file:
+            raise TargetMissing(self.name)
+        if not self._same_contents():
+            raise Modified(self.name)
+
+    def _unlink(self, plan):
+        """Remove the symlink or copy at name, no error checking."""
+        plan.unlink(self._name, self.snapshot.name_lstat)
 
     def short_name(self, home):
         """A shorter, more readable name given a home directory."""
@@ -81,84 +280,154 @@ class Dotfile(object):
 
     def _is_present(self):
         """Is this dotfile present in the repository?"""
-        return self.name.is_symlink() and (self.name.resolve() == self.target)
+        return (self.snapshot.name_is_symlink and
+                str(resolve(self._name)) == self._target)
 
     def _same_contents(self):
-        return (md5(self.name.read_bytes()).hexdigest() == \
-                md5(self.target.read_bytes()).hexdigest())
+        """Do name and target have identical contents?
+
+        Sizes and inodes are compared first.  Then cached content digests
+        are compared, or else the contents themselves until the first
+        difference, see DigestCache.same().  When the git index records
+        the unchanged target, only the name is read and compared against
+        the target's object id.
+        """
+        name_st = self.snapshot.name_stat
+        target_st = self.snapshot.target_stat
+        if name_st.st_size != target_st.st_size:
+            return False
+        if (name_st.st_dev, name_st.st_ino) == \
+                (target_st.st_dev, target_st.st_ino):
+            return True
+        if self._blob is not None and self._blob.unchanged(target_st):
+            return self._blob.matches(self._name)
+        # imported here, only copied dotfiles need digests
+        from .digest import shared
+        return shared().same(self._name, name_st, self._target, target_st)
 
     @property
     def state(self):
         """The current state of this dotfile."""
-        if self.target.is_symlink():
+        snapshot = self.snapshot
+
+        if snapshot.target_is_symlink:
             return 'external'
 
-        if not self.name.exists():
+        if not snapshot.name_exists:
             # no $HOME file or symlink
             return 'missing'
 
-        if self.name.is_symlink():
+        if snapshot.name_is_symlink:
             # name exists, is a link, but isn't a link to the target
-            if not self.name.samefile(self.target):
+            if not snapshot.samefile:
                 return 'conflict'
             return 'link'
 
-        if not self._same_contents():
+        if not snapshot.target_exists or not self._same_contents():
             # name exists, is a file, but differs from the target
             return 'conflict'
 
         return 'copy'
 
-    def add(self, copy=False, debug=False, home=Path.home()):
-        """Move a dotfile to its target and create a link.
+    def plan(self, plan, method, copy=False):
+        """Add the operations for a method (add, enable, ...) to a plan.
 
-        The link is either a symlink or a copy.
+        Preconditions are checked against the current snapshot, which
+        is taken relative to the plan's directory handles if there is
+        none yet.  A DotfileException is raised if the operation cannot
+        be performed.
         """
-        if copy:
-            raise NotImplementedError()
+        if self._snapshot is None:
+            self._snapshot = Snapshot(self._name, self._target,
+                                      handles=plan.handles)
+        getattr(self, '_plan_%s' % method)(plan, copy)
+
+    def _execute(self, method, copy, debug):
+        # imported here to keep plan's dependencies off the status path
+        from .plan import Plan
+        plan = Plan(method)
+        try:
+            self.plan(plan, method, copy)
+            plan.execute(debug)
+        finally:
+            plan.close()
+        self.refresh()
+
+    def _plan_add(self, plan, copy):
+        snapshot = self.snapshot
+        if snapshot.name_lstat is None:
+            raise NotFound(self.name)
         if self._is_present():
             raise IsSymlink(self.name)
-        if self.target.exists():
+        if snapshot.target_exists:
             raise TargetExists(self.name)
-        self._ensure_dirs(debug)
-        if not self.name.is_symlink():
-            if debug:
-                echo('MOVE   %s -> %s' % (self.name, self.target))
-            else:
-                self.name.replace(self.target)
-        self._link(debug, home)
+        self._ensure_dirs(plan)
+        if snapshot.name_is_symlink:
+            self._link(plan)
+            return
+        plan.move(self._name, self._target)
+        if copy:
+            self._copy(plan)
+        else:
+            self._link(plan)
 
-    def remove(self, copy=UNUSED, debug=False):
-        """Remove a dotfile and move target to its original location."""
-        if not self.name.is_symlink():
-            raise NotASymlink(self.name)
-        if not self.target.is_file():
+    def _plan_remove(self, plan, copy):
+        snapshot = self.snapshot
+        if not snapshot.name_is_symlink:
+            # the repository file replaces its copy
+            self._check_copy()
+            self._unlink(plan)
+            plan.move(self._target, self._name)
+            plan.prune(os.path.dirname(self._target))
+            return
+        if not snapshot.target_is_file:
             raise TargetMissing(self.name)
-        self._unlink(debug)
-        if debug:
-            echo('MOVE   %s -> %s' % (self.target, self.name))
-        else:
-            self.target.replace(self.name)
+        self._unlink(plan)
+        plan.move(self._target, self._name)
+        plan.prune(os.path.dirname(self._target))
 
-    def enable(self, copy=False, debug=False, home=Path.home()):
-        """Create a symlink or copy from name to target."""
-        if copy:
-            raise NotImplementedError()
-        if self.name.exists():
+    def _plan_enable(self, plan, copy):
+        snapshot = self.snapshot
+        if snapshot.name_lstat is not None:
             raise Exists(self.name)
-        if not self.target.exists():
+        if not snapshot.target_exists:
             raise TargetMissing(self.name)
-        self._ensure_dirs(debug)
-        self._link(debug, home)
+        self._ensure_dirs(plan)
+        if copy:
+            self._copy(plan)
+        else:
+            self._link(plan)
 
-    def disable(self, copy=UNUSED, debug=False):
-        """Remove a dotfile from name to target."""
-        if not self.name.is_symlink():
-            raise NotASymlink(self.name)
-        if self.name.exists():
-            if not self.target.exists():
+    def _plan_disable(self, plan, copy):
+        snapshot = self.snapshot
+        if not snapshot.name_is_symlink:
+            self._check_copy()
+            self._unlink(plan)
+            self._prune_dirs(plan)
+            return
+        if snapshot.name_exists:
+            if not snapshot.target_exists:
                 raise TargetMissing(self.name)
-            if not self.name.samefile(self.target):
+            if not snapshot.samefile:
                 raise RuntimeError
-        self._unlink(debug)
-        self._prune_dirs(debug)
+        self._unlink(plan)
+        self._prune_dirs(plan)
+
+    def add(self, copy=False, debug=False, home=None):
+        """Move a dotfile to its target and create a link.
+
+        The link is either a symlink or a copy.
+        """
+        self._execute('add', copy, debug)
+
+    def remove(self, copy=UNUSED, debug=False):
+        """Remove a dotfile and move target to its original location."""
+        self._execute('remove', copy, debug)
+
+    def enable(self, copy=False, debug=False, home=None):
+        """Create a symlink or copy from name to target."""
+        self._execute('enable', copy, debug)
+
+    def disable(self, copy=UNUSED, debug=False):
+        """Remove a dotfile from name to target."""
+        self._execute('disable', copy, debug)
@@ -1,3 +1,12 @@
+def echo(message):
+    """Show a message to the user.
+
+    click is imported on first use to keep it off the start-up path.
+    """
+    from click import echo
+    echo(message)
+
+
 class DotfileException(Exception):
     """An exception the CLI can handle and show to the user."""
     def __init__(self, path, message='an unknown error occurred'):
@@ -61,3 +70,8 @@ class TargetExists(DotfileException):
 class TargetMissing(DotfileException):
     def __init__(self, path):
         DotfileException.__init__(self, path, 'target is missing')
+
+
+class Modified(DotfileException):
+    def __init__(self, path):
+        DotfileException.__init__(self, path, 'differs from the repository')
@@ -0,0 +1,85 @@
+import os
+import sys
+
+from .check import check
+from .status import report
+from .daemon import query
+from .repository import Repositories
+
+
+DEFAULT_REPOS = ['~/Dotfiles']
+DRIFT = ('missing', 'conflict')
+
+
+def _parse(args):
+    """Return the repositories for a plain status or check, or None.
+
+    Only '-r/--repos' options followed by 'status' or 'check' are
+    understood, any other argument or a relevant environment variable
+    means the full interface is needed.
+    """
+    for name in os.environ:
+        if name.startswith('DOTFILES_') and name != 'DOTFILES_REPOS':
+            return None
+
+    repos = []
+    args = list(args)
+    while args and args[0] in ('-r', '--repos'):
+        if len(args) < 2:
+            return None
+        repos.append(args[1])
+        args = args[2:]
+    if args not in (['status'], ['check']):
+        return None
+
+    if not repos:
+        env = os.environ.get('DOTFILES_REPOS')
+        repos = env.split(os.pathsep) if env else DEFAULT_REPOS
+    return [os.path.expanduser(x) for x in repos if x]
+
+
+def quiet_status(paths, home=None):
+    """Check whether status has nothing to print for some repositories.
+
+    Returns False as soon as a dotfile is found that status would show,
+    or when a repository does not exist yet.
+    """
+    if not paths or not all(os.path.isdir(x) for x in paths):
+        return False
+
+    repos = Repositories(paths, home)
+    entries = query(repos)
+    if entries is None:
+        entries = report(repos)
+    for name, state, claims in entries:
+        if claims or state in DRIFT:
+            return False
+    return True
+
+
+def main(args=None):
+    """Run dotfiles, taking the fast path for a quiet status.
+
+    A plain 'dotfiles status' is run from login shells and usually finds
+    nothing to report, and 'dotfiles check' is run from shell prompts, so
+    both are answered without importing click or building the command
+    line interface.  Everything else, including a status that has
+    something to print, is handed to dotfiles.cli.
+    """
+    if args is None:
+        args = sys.argv[1:]
+
+    paths = _parse(args)
+    if paths is not None:
+        try:
+            if args[-1] == 'check':
+                if all(os.path.isdir(x) for x in paths):
+                    return 0 if check(Repositories(paths)) else 1
+            elif quiet_status(paths):
+                return 0
+        except Exception:
+            # anything unusual is left to the full interface to report
+            pass
+
+    from .cli import cli
+    return cli.main(args=args, prog_name='dotfiles')
@@ -0,0 +1,125 @@
+import os
+
+from .exceptions import DotfileException
+from .plan import Plan
+from .status import report
+
+
+MAX_JOBS = 32
+
+
+class Result(object):
+    """What an operation did in one home directory.
+
+    :param home: the home directory
+    """
+
+    def __init__(self, home):
+        self.home = home
+        # plan messages, or the operations when debugging
+        self.messages = []
+        # dotfiles that could not be planned
+        self.errors = []
+        # the error that stopped the plan from being executed, if any
+        self.failure = None
+
+    def __repr__(self):
+        return '<Result %r %d messages %d errors>' % (
+            self.home, len(self.messages), len(self.errors))
+
+
+def _selected(name, paths):
+    """Is a home relative name one of paths, or below one of them?"""
+    return not paths or any(name == x or name.startswith(x + '/')
+                            for x in paths)
+
+
+class Fleet(object):
+    """Repositories applied to many home directories in one run.
+
+    Each repository is scanned once and its listing shared by copies of
+    it for every home directory, see Repository.rehome().  The work for
+    each home directory is then done by a pool of threads, and results
+    are returned in the order the home directories were given.
+
+    :param repos: the repositories
+    :param homes: the home directories, they are resolved once so that
+                  names, results and repositories agree on their paths
+    :param jobs:  the number of worker threads, by default one per home
+                  directory up to MAX_JOBS
+    """
+
+    def __init__(self, repos, homes, jobs=None):
+        self.repos = list(repos)
+        self.homes = [os.path.realpath(os.path.expanduser(str(x)))
+                      for x in homes]
+        self.jobs = jobs or min(MAX_JOBS, len(self.homes))
+        for repo in self.repos:
+            repo.listing()
+
+    def __repr__(self):
+        return '<Fleet %d repositories %d homes>' % (len(self.repos),
+                                                     len(self.homes))
+
+    def _map(self, function):
+        """Call function(home, repos) for every home, in parallel."""
+        def work(home):
+            return function(home, [x.rehome(home) for x in self.repos])
+
+        if self.jobs <= 1:
+            return [work(home) for home in self.homes]
+
+        # imported here, it is slow to import and only needed for jobs > 1
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            return list(executor.map(work, self.homes))
+
+    def status(self, refresh=False):
+        """Return a (home, entries) pair for every home directory.
+
+        The entries are the (name, state, claims) tuples status.report()
+        yields, with names relative to the home directory.
+        """
+        def status(home, repos):
+            return home, list(report(repos, 1, refresh))
+        return self._map(status)
+
+    def perform(self, method, paths=(), copy=False, debug=False):
+        """Carry out an operation on the dotfiles of every home directory.
+
+        Each home directory gets its own plan per repository.  Returns a
+        Result for every home directory.
+
+        :param paths: names relative to the home directories, only the
+                      dotfiles at or below them are operated on
+        """
+        done = '%s%s' % (method, 'd' if method[-1] == 'e' else 'ed')
+        paths = [os.path.normpath(x) for x in paths]
+
+        def perform(home, repos):
+            result = Result(home)
+            prefix = len(os.path.join(home, ''))
+            for repo in repos:
+                plan = Plan(method, repo)
+                for dotfile in repo.contents():
+                    if not _selected(str(dotfile)[prefix:], paths):
+                        continue
+                    try:
+                        dotfile.plan(plan, method, copy)
+                    except DotfileException as err:
+                        result.errors.append(str(err))
+                        continue
+                    plan.done('%s %s' % (done, dotfile))
+                if debug:
+                    plan.close()
+                    result.messages.extend(plan.describe(x) for x in plan)
+                    continue
+                try:
+                    plan.execute()
+                except OSError as err:
+                    result.failure = str(err)
+                    break
+                result.messages.extend(plan.messages)
+            return result
+        return self._map(perform)
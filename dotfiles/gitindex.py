@@ -0,0 +1,341 @@
+import os
+import time
+import stat
+import struct
+
+from zlib import crc32
+
+from .index import atomic_write, cache_dir
+
+
+# header: signature, version, entry count
+HEADER = struct.Struct('>4sII')
+# entry: ctime and mtime (seconds, nanoseconds), dev, ino, mode, uid, gid
+# and size, all truncated to 32 bits
+ENTRY = struct.Struct('>10I')
+SIGNATURE = b'DIRC'
+VERSIONS = (2, 3, 4)
+
+EXTENDED = 0x4000
+STAGE = 0x3000
+SKIP_WORKTREE = 0x4000
+
+TREE_MAGIC = b'DTRE2'
+CHUNK_SIZE = 1024 * 1024
+
+
+def _varint(data, pos):
+    """Decode a git offset varint, returning it and the next position."""
+    c = data[pos]
+    pos += 1
+    value = c & 0x7f
+    while c & 0x80:
+        c = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (c & 0x7f)
+    return value, pos
+
+
+def git_dir(path):
+    """Return the git directory of a working tree, or None.
+
+    A '.git' file, as used by worktrees and submodules, is followed to
+    the directory it names.
+    """
+    dot_git = os.path.join(str(path), '.git')
+    if os.path.isdir(dot_git):
+        return dot_git
+    try:
+        with open(dot_git) as f:
+            line = f.readline()
+    except OSError:
+        return None
+    if not line.startswith('gitdir:'):
+        return None
+    return os.path.join(str(path), line[7:].strip())
+
+
+def _algorithm(git_dir):
+    """Return the name of the hash function objects are named with."""
+    try:
+        with open(os.path.join(git_dir, 'config')) as f:
+            for line in f:
+                key, _, value = line.partition('=')
+                if key.strip().lower() == 'objectformat':
+                    return value.strip().lower()
+    except OSError:
+        pass
+    return 'sha1'
+
+
+class Blob(object):
+    """The contents of a tracked file as recorded in a git index.
+
+    The object id is only known to match the file's contents for as long
+    as the file's stat data matches the index entry, see unchanged().
+    """
+    __slots__ = ('size', 'mtime_ns', 'ino', 'oid', 'algorithm')
+
+    def __init__(self, size, mtime_ns, ino, oid, algorithm='sha1'):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.ino = ino
+        self.oid = oid
+        self.algorithm = algorithm
+
+    def __repr__(self):
+        return '<Blob %s>' % self.oid.hex()
+
+    def unchanged(self, st):
+        """Does a file's stat data match the index entry?"""
+        return (st.st_size & 0xffffffff, st.st_mtime_ns,
+                st.st_ino & 0xffffffff) == \
+            (self.size, self.mtime_ns, self.ino)
+
+    def matches(self, path):
+        """Does a file have the contents this blob names?"""
+        # imported here, hashlib is slow to import and rarely needed
+        import hashlib
+        h = hashlib.new(self.algorithm)
+        with open(path, 'rb', buffering=0) as f:
+            h.update(b'blob %d\0' % os.fstat(f.fileno()).st_size)
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                h.update(data)
+        return h.digest() == self.oid
+
+
+class GitIndex(object):
+    """The entries of a git index file, read without running git.
+
+    Versions 2 to 4 of the index format are understood, extensions are
+    skipped.  Only entries whose files are expected in the working tree
+    are kept: sparse directory entries, submodules and entries marked
+    skip-worktree are left out.
+
+    :param git_dir: the repository's git directory
+    """
+
+    def __init__(self, git_dir):
+        self.path = os.path.join(git_dir, 'index')
+        self.algorithm = _algorithm(git_dir)
+        self.version = None
+        self.mtime_ns = 0
+        # relative path -> Blob, or None while the path is conflicted
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return '<GitIndex %r>' % self.path
+
+    @classmethod
+    def load(cls, git_dir):
+        """Read the index of a git directory, or None if it has none.
+
+        ValueError is raised if the index cannot be parsed.
+        """
+        index = cls(git_dir)
+        try:
+            with open(index.path, 'rb') as f:
+                index.mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            index._read(data)
+        except (IndexError, struct.error):
+            raise ValueError('%s: truncated git index' % index.path)
+        return index
+
+    def _read(self, data):
+        signature, version, count = HEADER.unpack_from(data)
+        if signature != SIGNATURE or version not in VERSIONS:
+            raise ValueError('%s: unknown git index format' % self.path)
+        self.version = version
+        oid_size = 32 if self.algorithm == 'sha256' else 20
+
+        pos = HEADER.size
+        path = b''
+        for _ in range(count):
+            start = pos
+            fields = ENTRY.unpack_from(data, pos)
+            pos += ENTRY.size
+            oid = data[pos:pos + oid_size]
+            pos += oid_size
+            flags, = struct.unpack_from('>H', data, pos)
+            pos += 2
+            extended = 0
+            if flags & EXTENDED and version >= 3:
+                extended, = struct.unpack_from('>H', data, pos)
+                pos += 2
+
+            if version == 4:
+                strip, pos = _varint(data, pos)
+                end = data.index(b'\0', pos)
+                path = path[:len(path) - strip] + data[pos:end]
+                pos = end + 1
+            else:
+                end = data.index(b'\0', pos)
+                path = data[pos:end]
+                # entries are padded with one to eight NULs
+                pos = start + ((end - start + 8) & ~7)
+
+            mode = fields[6]
+            if extended & SKIP_WORKTREE or stat.S_IFMT(mode) not in (
+                    stat.S_IFREG, stat.S_IFLNK):
+                continue
+            name = os.fsdecode(path)
+            if flags & STAGE:
+                # unmerged, the working tree file is not any one stage
+                self.entries[name] = None
+                continue
+            mtime_ns = fields[2] * 10 ** 9 + fields[3]
+            # racily clean entries may have changed after they were
+            # recorded without changing their stat data
+            if stat.S_ISREG(mode) and mtime_ns < self.mtime_ns:
+                self.entries[name] = Blob(fields[9], mtime_ns, fields[5],
+                                          oid, self.algorithm)
+            else:
+                self.entries[name] = None
+
+
+class Tree(object):
+    """The files of a git working tree, found with the help of its index.
+
+    Tracked files are listed from the git index.  To find the untracked
+    ones, the listing of every directory is remembered in a cache as the
+    tracked files missing from it and the untracked files and
+    subdirectories found in it, along with the directory's mtime and a
+    checksum of the names the index tracks there.  Adding or removing a
+    file changes the mtime of its directory, so while both the mtime and
+    the checksum match, the directory is not read again: one stat call
+    per directory replaces reading it.  Listings are taken with the ignore
+    rules applied, so the cache also records a checksum of the rules and
+    is discarded when they change.
+
+    Ignore rules apply as they do to the repository walk, and files are
+    returned in the same order.
+
+    :param repo:  the repository
+    :param index: the repository's GitIndex
+    """
+
+    def __init__(self, repo, index):
+        self.repo = repo
+        self.index = index
+        key = crc32(os.fsencode(str(repo.path)))
+        self.path = os.path.join(cache_dir(), 'tree-%08x' % key)
+        self.root = str(repo.path)
+
+    def __repr__(self):
+        return '<Tree %r>' % self.root
+
+    def _rules(self):
+        """Return a checksum of the repository's ignore patterns."""
+        return crc32(os.fsencode('\n'.join(self.repo.ignore.patterns)))
+
+    def _load(self):
+        """Return the cached directory listings and when they were taken."""
+        try:
+            with open(self.path, 'rb') as f:
+                fields = f.read().split(b'\0')
+            if fields[0] != TREE_MAGIC:
+                raise ValueError('unknown tree cache format')
+            written = int(fields[1])
+            if int(fields[2]) != self._rules():
+                return {}, 0
+            fields = [os.fsdecode(x) for x in fields[3:]]
+            dirs = {}
+            i = 0
+            while i < len(fields) - 1:
+                rel, mtime, crc = fields[i:i + 3]
+                counts = [int(x) for x in fields[i + 3:i + 6]]
+                i += 6
+                lists = []
+                for count in counts:
+                    lists.append(fields[i:i + count])
+                    i += count
+                dirs[rel] = (int(mtime), int(crc)) + tuple(lists)
+            return dirs, written
+        except (OSError, ValueError, IndexError):
+            return {}, 0
+
+    def _save(self, dirs, written):
+        """Write the cache, failures are silently ignored."""
+        fields = [TREE_MAGIC, b'%d' % written, b'%d' % self._rules()]
+        for rel, (mtime, crc, missing, untracked, subdirs) in dirs.items():
+            fields.append(os.fsencode(rel))
+            fields.extend(b'%d' % x for x in (
+                mtime, crc, len(missing), len(untracked), len(subdirs)))
+            for names in (missing, untracked, subdirs):
+                fields.extend(os.fsencode(x) for x in names)
+        fields.append(b'')
+        try:
+            atomic_write(self.path, [b'\0'.join(fields)])
+        except OSError:
+            pass
+
+    def _read(self, path, rel):
+        """Return the unignored files and subdirectories in a directory."""
+        match = self.repo.ignore.match
+        files, dirs = set(), []
+        with os.scandir(path) as listing:
+            for entry in listing:
+                child = rel + '/' + entry.name if rel else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if not match(child, True):
+                        dirs.append(entry.name)
+                elif entry.is_symlink() and entry.is_dir():
+                    continue
+                elif not match(child):
+                    files.add(entry.name)
+        return files, dirs
+
+    def files(self):
+        """Return the relative paths of all unignored files, sorted."""
+        tracked = {}
+        for name in self.index.entries:
+            dir, _, base = name.rpartition('/')
+            tracked.setdefault(dir, []).append(base)
+
+        cached, written = self._load()
+        started = int(time.time() * 1e9)
+        dirs = {}
+        result = []
+        stack = ['']
+        while stack:
+            rel = stack.pop()
+            path = os.path.join(self.root, rel) if rel else self.root
+            try:
+                mtime = os.lstat(path).st_mtime_ns
+            except OSError:
+                continue
+            names = sorted(tracked.get(rel, ()))
+            crc = crc32(os.fsencode('\0'.join(names)))
+            entry = cached.get(rel)
+            if entry is None or entry[:2] != (mtime, crc) or \
+                    mtime >= written:
+                try:
+                    present, subdirs = self._read(path, rel)
+                except OSError:
+                    continue
+                missing = [x for x in names if x not in present]
+                untracked = sorted(present.difference(names))
+                entry = (mtime, crc, missing, untracked, sorted(subdirs))
+            dirs[rel] = entry
+            _, _, missing, untracked, subdirs = entry
+
+            prefix = rel + '/' if rel else ''
+            gone = set(missing)
+            result.extend(prefix + x for x in names if x not in gone)
+            result.extend(prefix + x for x in untracked)
+            stack.extend(prefix + x for x in subdirs)
+
+        if dirs != cached:
+            self._save(dirs, started)
+        result.sort(key=lambda x: x.replace('/', '\0'))
+        return result
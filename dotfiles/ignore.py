@@ -0,0 +1,197 @@
+import os
+import re
+
+
+IGNORE_FILES = ['.gitignore', '.dotfilesignore']
+
+
+def _segment(glob):
+    """Translate a single path segment of a glob into a regex."""
+    i, n = 0, len(glob)
+    res = []
+    while i < n:
+        c = glob[i]
+        i += 1
+        if c == '*':
+            res.append('[^/]*')
+        elif c == '?':
+            res.append('[^/]')
+        elif c == '\\' and i < n:
+            res.append(re.escape(glob[i]))
+            i += 1
+        elif c == '[':
+            j = i
+            if j < n and glob[j] in '!^':
+                j += 1
+            if j < n and glob[j] == ']':
+                j += 1
+            while j < n and glob[j] != ']':
+                j += 1
+            if j >= n:
+                res.append('\\[')
+            else:
+                stuff = glob[i:j].replace('\\', '\\\\')
+                i = j + 1
+                if stuff[0] in '!^':
+                    stuff = '^/' + stuff[1:]
+                res.append('[%s]' % stuff)
+        else:
+            res.append(re.escape(c))
+    return ''.join(res)
+
+
+def _parse(pattern):
+    """Split a gitignore line into (segments, anchored, dir_only, negate).
+
+    Returns None if the line holds no pattern.
+    """
+    pattern = re.sub(r'(?<!\\) +$', '', pattern.rstrip('\r\n'))
+    if not pattern or pattern.startswith('#'):
+        return None
+
+    negate = pattern.startswith('!')
+    if negate:
+        pattern = pattern[1:]
+
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    if not pattern:
+        return None
+
+    anchored = '/' in pattern
+    return pattern.lstrip('/').split('/'), anchored, dir_only, negate
+
+
+def translate(pattern):
+    """Translate a gitignore pattern into a regex.
+
+    Returns a tuple of (regex, negate) or None if the line holds no
+    pattern.  The regex is matched against a path relative to the
+    repository, with a trailing slash appended for directories.
+    """
+    parsed = _parse(pattern)
+    if parsed is None:
+        return None
+    segments, anchored, dir_only, negate = parsed
+
+    regex = '' if anchored else '(?:.*/)?'
+    for i, segment in enumerate(segments):
+        last = i == len(segments) - 1
+        if segment == '**':
+            regex += '.+' if last else '(?:.*/)?'
+        else:
+            regex += _segment(segment) + ('' if last else '/')
+    regex += '/' if dir_only else '/?'
+
+    return regex, negate
+
+
+def _literal(segment):
+    return not any(c in segment for c in '*?[\\')
+
+
+class IgnoreMatcher(object):
+    """A compiled set of gitignore-style patterns.
+
+    Patterns are sorted by kind so that matching a path does not try
+    every pattern in turn.  Plain names such as `.git/` or `README` are
+    looked up by the path's last component, and plain paths such as
+    `/vimrc` by the whole path.  Extension globs such as `*.log` are
+    grouped by suffix, and looked up once per distinct suffix length.
+    Only the remaining globs are compiled into a regex, one named
+    alternative each.  Every pattern keeps its position and the last
+    pattern that matches decides the result, as with git.
+
+    :param patterns: an iterable of gitignore-style pattern lines
+    """
+
+    def __init__(self, patterns=()):
+        self.patterns = []
+        # name, path or suffix -> [(index, dir_only, negate)]
+        self._names = {}
+        self._paths = {}
+        self._suffixes = {}
+        self._negate = {}
+
+        alternatives = []
+        for pattern in patterns:
+            parsed = _parse(pattern)
+            if parsed is None:
+                continue
+            segments, anchored, dir_only, negate = parsed
+            index = len(self.patterns)
+            self.patterns.append(pattern)
+            rule = (index, dir_only, negate)
+            first = segments[0]
+            if all(_literal(x) for x in segments):
+                table = self._paths if anchored else self._names
+                table.setdefault('/'.join(segments), []).append(rule)
+            elif not anchored and first.startswith('*') and \
+                    len(first) > 1 and _literal(first[1:]):
+                self._suffixes.setdefault(first[1:], []).append(rule)
+            else:
+                regex, negate = translate(pattern)
+                group = 'p%d' % index
+                self._negate[group] = negate
+                alternatives.append('(?P<%s>%s)' % (group, regex))
+
+        self._lengths = sorted({len(x) for x in self._suffixes})
+        if alternatives:
+            self._regex = re.compile('|'.join(reversed(alternatives)))
+        else:
+            self._regex = None
+
+    @classmethod
+    def from_directory(cls, path, patterns=()):
+        """Build a matcher from patterns and the ignore files in path.
+
+        Only the ignore files at the top of the directory are read, their
+        patterns are relative to that directory.  Later files take
+        precedence over earlier ones and over the given patterns.
+        """
+        lines = list(patterns)
+        for name in IGNORE_FILES:
+            try:
+                with open(os.path.join(str(path), name)) as f:
+                    lines.extend(f.read().splitlines())
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+        return cls(lines)
+
+    def __repr__(self):
+        return '<IgnoreMatcher %d patterns>' % len(self.patterns)
+
+    def match(self, relpath, is_dir=False):
+        """Test whether a path, not considering its parents, is ignored."""
+        if not self.patterns:
+            return False
+        name = relpath.rpartition('/')[2]
+        rules = self._names.get(name, []) + self._paths.get(relpath, [])
+        for length in self._lengths:
+            if length > len(name):
+                break
+            rules += self._suffixes.get(name[-length:], [])
+        best, ignored = -1, False
+        for index, dir_only, negate in rules:
+            if index > best and (is_dir or not dir_only):
+                best, ignored = index, not negate
+
+        if self._regex is not None:
+            m = self._regex.fullmatch(relpath + '/' if is_dir else relpath)
+            if m is not None and int(m.lastgroup[1:]) > best:
+                return not self._negate[m.lastgroup]
+        return ignored
+
+    def excluded(self, relpath, is_dir=False):
+        """Test whether a path or any of its parent directories is ignored.
+
+        As with git, a path cannot be re-included once one of its parent
+        directories has been ignored.
+        """
+        if not self.patterns:
+            return False
+        parts = relpath.split('/')
+        for i in range(1, len(parts)):
+            if self.match('/'.join(parts[:i]), True):
+                return True
+        return self.match(relpath, is_dir)
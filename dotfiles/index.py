@@ -0,0 +1,189 @@
+import os
+import mmap
+import time
+import struct
+
+from zlib import crc32
+from itertools import chain
+
+
+STATES = ('missing', 'conflict', 'link', 'copy', 'external')
+
+# header: magic, version, entry count, string table size, write time
+HEADER = struct.Struct('<4sHIIq')
+# entry: name offset and length, link offset and length, the name's and
+# the target's (mode, dev, ino, size, mtime_ns) and the state
+ENTRY = struct.Struct('<IIIi' 'IQQqq' 'IQQqq' 'B')
+MAGIC = b'DIDX'
+VERSION = 1
+
+NO_STAT = (0, 0, 0, 0, 0)
+
+
+def cache_dir():
+    """Return the directory where dotfiles keeps its caches."""
+    base = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'dotfiles')
+
+
+def atomic_write(path, chunks):
+    """Write chunks of bytes to a file, replacing it in one step.
+
+    The chunks are written to a temporary file next to path, which is
+    then renamed over it, so readers never see a partly written file.
+    Missing parent directories are created.  On failure the temporary
+    file is removed and OSError raised.
+    """
+    tmp = '%s.%d' % (path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'wb') as f:
+            f.writelines(chunks)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _key(st):
+    """Return the parts of an lstat result that identify a file version."""
+    if st is None:
+        return NO_STAT
+    return st.st_mode, st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def signature(dotfile):
+    """Return the stat signature that a dotfile's state is derived from.
+
+    The signature holds the lstat data of both the name and the target
+    along with the name's link text, all taken from the dotfile's
+    snapshot so classifying it afterwards needs no further stat calls.
+    """
+    snapshot = dotfile.snapshot
+    return (_key(snapshot.name_lstat), snapshot.link,
+            _key(snapshot.target_lstat))
+
+
+class StatIndex(object):
+    """A persistent record of dotfile states and the stat data behind them.
+
+    Similar to git's index, the stat data of every dotfile's name and
+    target is recorded alongside its state.  When a later lookup finds
+    the same stat data the recorded state is reused, which avoids
+    comparing file contents for copied dotfiles.  Entries modified at
+    or after the time the index was written are never trusted, since
+    they could have changed again within the timestamp granularity.
+
+    One index is kept per repository and home directory pair.  It is
+    stored as a fixed size entry table followed by a string table, so
+    it can be memory-mapped and read without parsing text.
+
+    :param repo: the repository the index belongs to
+    """
+
+    def __init__(self, repo):
+        # crc32 rather than hashlib, which is slow to import
+        key = (crc32(os.fsencode(str(repo.path))),
+               crc32(os.fsencode(str(repo.home))))
+        self.path = os.path.join(cache_dir(), 'index-%08x%08x' % key)
+        self.entries = {}
+        self.seen = set()
+        self.written = 0
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return '<StatIndex %r>' % self.path
+
+    @classmethod
+    def load(cls, repo):
+        """Load the index for a repository, or an empty one."""
+        index = cls(repo)
+        try:
+            with open(index.path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    index._read(m)
+        except (OSError, ValueError, struct.error):
+            index.entries = {}
+            index.written = 0
+        return index
+
+    def _read(self, buf):
+        magic, version, count, size, written = HEADER.unpack_from(buf)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('unknown index format')
+        strings = HEADER.size + count * ENTRY.size
+        if len(buf) != strings + size:
+            raise ValueError('truncated index')
+
+        def string(offset, length):
+            start = strings + offset
+            return os.fsdecode(buf[start:start + length])
+
+        entries = {}
+        for entry in ENTRY.iter_unpack(buf[HEADER.size:strings]):
+            name = string(entry[0], entry[1])
+            link = None if entry[3] < 0 else string(entry[2], entry[3])
+            sig = (tuple(entry[4:9]), link, tuple(entry[9:14]))
+            entries[name] = (sig, STATES[entry[14]])
+        self.entries = entries
+        self.written = written
+
+    def _trusted(self, sig):
+        """Could the files have changed without changing their stat data?"""
+        return sig[0][4] < self.written and sig[2][4] < self.written
+
+    def state(self, dotfile):
+        """Return the state of a dotfile, reusing the recorded one if valid."""
+        sig = signature(dotfile)
+        name = str(dotfile)
+        self.seen.add(name)
+        entry = self.entries.get(name)
+        if entry is not None and entry[0] == sig and self._trusted(sig):
+            return entry[1]
+        state = dotfile.state
+        self.entries[name] = (sig, state)
+        self.dirty = True
+        return state
+
+    def save(self):
+        """Write the index if it changed, failures are silently ignored.
+
+        Only entries looked up since the index was loaded are written, so
+        dotfiles that left the repository are dropped.
+        """
+        if not self.dirty and len(self.seen) == len(self.entries):
+            return
+        entries = []
+        strings = []
+        offset = 0
+
+        def string(value):
+            nonlocal offset
+            data = os.fsencode(value)
+            strings.append(data)
+            offset += len(data)
+            return offset - len(data), len(data)
+
+        for name in self.seen:
+            (name_st, link, target_st), state = self.entries[name]
+            name_ref = string(name)
+            link_ref = (0, -1) if link is None else string(link)
+            entries.append(ENTRY.pack(*(name_ref + link_ref + name_st +
+                                        target_st),
+                                      STATES.index(state)))
+
+        written = int(time.time() * 1e9)
+        header = HEADER.pack(MAGIC, VERSION, len(entries), offset, written)
+        try:
+            atomic_write(self.path, chain([header], entries, strings))
+        except OSError:
+            return
+        self.written = written
+        self.dirty = False
@@ -0,0 +1,180 @@
+import os
+import re
+import binascii
+
+from .index import atomic_write
+
+NAME = '.dotfiles-manifest'
+HEADER = '# dotfiles manifest 1\n'
+
+
+def _escape(relpath):
+    return relpath.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _unescape(relpath):
+    return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n'
+                  else m.group(1), relpath)
+
+
+def _key(relpath):
+    # the order the repository walk yields files in
+    return relpath.replace('/', '\0')
+
+
+class Manifest(object):
+    """A list of the files in a repository, kept in the repository.
+
+    Every managed file is listed with its size, mtime and content digest,
+    one per line in the order the repository walk would give them.  When
+    a repository has a manifest, its contents are read from it instead of
+    walking the tree, which on network storage saves a round trip per
+    directory.  Adding and removing dotfiles keeps the manifest up to
+    date, see update(); changes made by other means are found with
+    compare().
+
+    :param root: the repository directory
+    """
+
+    def __init__(self, root):
+        self.root = str(root)
+        self.path = os.path.join(self.root, NAME)
+        # relative path -> (size, mtime_ns, hex digest)
+        self.entries = {}
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return '<Manifest %r>' % self.path
+
+    @classmethod
+    def load(cls, root):
+        """Read the manifest of a repository, or None if it has none.
+
+        ValueError is raised if the manifest cannot be parsed.
+        """
+        manifest = cls(root)
+        try:
+            f = open(manifest.path, encoding='utf-8',
+                     errors='surrogateescape', newline='\n')
+        except FileNotFoundError:
+            return None
+        with f:
+            if f.readline() != HEADER:
+                raise ValueError('%s: unknown manifest format' %
+                                 manifest.path)
+            for line in f:
+                try:
+                    digest, size, mtime, relpath = \
+                        line.rstrip('\n').split(' ', 3)
+                    manifest.entries[_unescape(relpath)] = \
+                        (int(size), int(mtime), digest)
+                except ValueError:
+                    raise ValueError('%s: invalid line: %r' % (
+                        manifest.path, line))
+        return manifest
+
+    @classmethod
+    def build(cls, repo):
+        """Return a new manifest of a repository's files."""
+        manifest = cls(repo.path)
+        for target in repo._contents(repo.path):
+            manifest.record(target)
+        manifest.dirty = True
+        return manifest
+
+    def _relpath(self, target):
+        return os.path.relpath(str(target), self.root)
+
+    @staticmethod
+    def _examine(target):
+        """Return the (size, mtime_ns, hex digest) entry of a file."""
+        # imported here, only manifests need digests outside copy mode
+        from .digest import shared
+        st = os.stat(target)
+        digest = shared().digest(target, st)
+        return (st.st_size, st.st_mtime_ns,
+                binascii.hexlify(digest).decode('ascii'))
+
+    def record(self, target):
+        """Add or update the entry of a repository file."""
+        target = str(target)
+        self.entries[self._relpath(target)] = self._examine(target)
+        self.dirty = True
+
+    def discard(self, target):
+        """Remove the entry of a repository file, if there is one."""
+        if self.entries.pop(self._relpath(target), None) is not None:
+            self.dirty = True
+
+    def files(self):
+        """Yield the paths of the listed files, in the order of a walk."""
+        prefix = os.path.join(self.root, '')
+        for relpath in sorted(self.entries, key=_key):
+            yield prefix + relpath
+
+    def save(self):
+        """Write the manifest if it changed, raising OSError on failure."""
+        if not self.dirty:
+            return
+        atomic_write(self.path, (x.encode('utf-8', 'surrogateescape')
+                                 for x in self._lines()))
+        self.dirty = False
+
+    def _lines(self):
+        yield HEADER
+        for relpath in sorted(self.entries, key=_key):
+            size, mtime, digest = self.entries[relpath]
+            yield '%s %d %d %s\n' % (digest, size, mtime, _escape(relpath))
+
+    def compare(self, repo):
+        """Yield (change, relative path) pairs where the tree has drifted.
+
+        A change is 'missing' for listed files that are gone, 'untracked'
+        for files that are not listed, or 'modified' for listed files
+        whose contents changed.  Files whose size and mtime match their
+        entries are not read.
+        """
+        listed = set(self.entries)
+        for target in repo._contents(repo.path):
+            relpath = self._relpath(target)
+            entry = self.entries.get(relpath)
+            if entry is None:
+                yield 'untracked', relpath
+                continue
+            listed.discard(relpath)
+            try:
+                st = os.stat(target)
+            except OSError:
+                yield 'missing', relpath
+                continue
+            if (st.st_size, st.st_mtime_ns) == entry[:2]:
+                continue
+            if st.st_size != entry[0] or \
+                    self._examine(target)[2] != entry[2]:
+                yield 'modified', relpath
+        for relpath in sorted(listed, key=_key):
+            yield 'missing', relpath
+
+
+def update(plan):
+    """Bring a repository's manifest up to date after a plan was executed.
+
+    Files moved into the repository by 'add' are recorded and files
+    moved out of it by 'remove' are discarded.  Repositories without a
+    manifest are left alone.
+    """
+    if plan.repository is None or plan.method not in ('add', 'remove'):
+        return
+    manifest = Manifest.load(plan.repository)
+    if manifest is None:
+        return
+    prefix = os.path.join(plan.repository, '')
+    for source, destination in plan.operations['move']:
+        if plan.method == 'add' and destination.startswith(prefix):
+            manifest.record(destination)
+        elif plan.method == 'remove' and source.startswith(prefix):
+            manifest.discard(source)
+    manifest.save()
@@ -0,0 +1,123 @@
+import os
+
+from .exceptions import NotRootedInHome
+
+
+class PathMapper(object):
+    """Translate paths between a repository and the home directory.
+
+    Every file in a directory maps the same way as its siblings, so the
+    mapping of each directory, including the removal or addition of the
+    leading dot, is computed once and remembered.  Translating a file is
+    then one dictionary lookup and one string concatenation, and a whole
+    directory listing is translated in one pass by names().
+
+    Paths are taken and returned as strings.
+
+    :param repository:         the repository directory
+    :param home:               the home directory
+    :param remove_leading_dot: whether dotfiles are stored without their
+                               leading dot in the repository
+    """
+
+    def __init__(self, repository, home, remove_leading_dot=True):
+        self.repository = str(repository)
+        self.home = str(home)
+        self.dot = '.' if remove_leading_dot else ''
+        # directory -> the prefix of its files' counterparts
+        self._names = {self.repository: os.path.join(self.home, '')}
+        self._targets = {self.home: os.path.join(self.repository, '')}
+        # home directory -> the link text leading to its counterpart
+        self._links = {}
+
+    def __repr__(self):
+        return '<PathMapper %r %r>' % (self.repository, self.home)
+
+    def _undot(self, dir, base):
+        """Strip the leading dot of a file directly in the home directory."""
+        if dir == self.home and self.dot and base.startswith(self.dot):
+            return base[1:]
+        return base
+
+    def _name_prefix(self, dir):
+        prefix = self._names.get(dir)
+        if prefix is None:
+            parent, base = os.path.split(dir)
+            if parent == dir:
+                raise ValueError('%r is not within %r' % (
+                    dir, self.repository))
+            if parent == self.repository:
+                base = self.dot + base
+            prefix = self._name_prefix(parent) + base + '/'
+            self._names[dir] = prefix
+        return prefix
+
+    def _target_prefix(self, dir):
+        prefix = self._targets.get(dir)
+        if prefix is None:
+            parent, base = os.path.split(dir)
+            if parent == dir:
+                raise NotRootedInHome(dir)
+            prefix = self._target_prefix(parent) + \
+                self._undot(parent, base) + '/'
+            self._targets[dir] = prefix
+        return prefix
+
+    def name(self, target):
+        """Return the home path of a repository path.
+
+        ValueError is raised for paths outside the repository.
+        """
+        target = str(target)
+        if target == self.repository:
+            return self.home
+        dir, base = os.path.split(target)
+        if dir == self.repository:
+            base = self.dot + base
+        return self._name_prefix(dir) + base
+
+    def target(self, name):
+        """Return the repository path of a home path.
+
+        NotRootedInHome is raised for paths outside the home directory.
+        """
+        name = str(name)
+        if name == self.home:
+            return self.repository
+        dir, base = os.path.split(name)
+        try:
+            return self._target_prefix(dir) + self._undot(dir, base)
+        except NotRootedInHome:
+            raise NotRootedInHome(name)
+
+    def names(self, targets):
+        """Yield (name, target) pairs for a stream of repository paths.
+
+        Paths in the same directory as the one before, as a directory
+        listing gives them, reuse its mapping without looking it up.
+        """
+        last = prefix = None
+        for target in targets:
+            dir, base = os.path.split(target)
+            if dir != last:
+                last = dir
+                prefix = self._name_prefix(dir)
+                if dir == self.repository:
+                    prefix += self.dot
+            yield prefix + base, target
+
+    def link(self, name):
+        """Return the relative link text from a home path to its target.
+
+        The path between the two directories is computed once per home
+        directory.
+        """
+        dir, base = os.path.split(str(name))
+        link = self._links.get(dir)
+        if link is None:
+            target_dir = self._target_prefix(dir)[:-1]
+            link = os.path.join(os.path.relpath(target_dir, dir), '')
+            if link == './':
+                link = ''
+            self._links[dir] = link
+        return link + self._undot(dir, base)
@@ -0,0 +1,139 @@
+import os
+
+
+class _Node(object):
+    """A home directory path component in the ownership trie."""
+
+    def __init__(self):
+        self.children = {}
+        # repositories with a dotfile at or below this path, in order
+        self.below = []
+        # repositories with a dotfile at exactly this path
+        self.claims = []
+
+
+def _add(repos, repo):
+    if not repos or repos[-1] is not repo:
+        repos.append(repo)
+
+
+class Ownership(object):
+    """An index of which repositories own which home paths.
+
+    Every dotfile of every repository is entered into a prefix trie of
+    home path components, so looking up the owners of a path costs one
+    dictionary lookup per component no matter how many dotfiles there
+    are.  A path owned by more than one repository is a collision.
+
+    :param repos: the repositories, sharing one home directory
+    """
+
+    def __init__(self, repos):
+        self.repos = list(repos)
+        self.home = str(self.repos[0].home)
+        self.root = _Node()
+        self._prefix = len(os.path.join(self.home, ''))
+        for repo in self.repos:
+            for dotfile in repo.contents():
+                node = self.root
+                _add(node.below, repo)
+                for part in str(dotfile)[self._prefix:].split('/'):
+                    node = node.children.setdefault(part, _Node())
+                    _add(node.below, repo)
+                node.claims.append(repo)
+
+    def __repr__(self):
+        return '<Ownership %d repositories>' % len(self.repos)
+
+    def _parts(self, path):
+        path = os.path.abspath(os.path.expanduser(str(path)))
+        if path == self.home:
+            return []
+        if not path.startswith(os.path.join(self.home, '')):
+            return None
+        return path[self._prefix:].split('/')
+
+    def _repository(self, path):
+        """Return the repository a path lies within, if any."""
+        path = os.path.abspath(os.path.expanduser(str(path)))
+        for repo in self.repos:
+            if path.startswith(os.path.join(str(repo.path), '')):
+                return repo
+        return None
+
+    def _walk(self, path):
+        """Return the nodes along a path, stopping where the trie ends."""
+        nodes = [self.root]
+        parts = self._parts(path)
+        if parts is None:
+            return []
+        for part in parts:
+            node = nodes[-1].children.get(part)
+            if node is None:
+                break
+            nodes.append(node)
+        else:
+            return nodes
+        return nodes + [None]
+
+    def claims(self, path):
+        """Return the repositories with a dotfile at exactly a path."""
+        repo = self._repository(path)
+        if repo is not None:
+            return [repo]
+        nodes = self._walk(path)
+        if not nodes or nodes[-1] is None:
+            return []
+        return list(nodes[-1].claims)
+
+    def below(self, path):
+        """Return the repositories with dotfiles at or below a path."""
+        repo = self._repository(path)
+        if repo is not None:
+            return [repo]
+        nodes = self._walk(path)
+        if not nodes or nodes[-1] is None:
+            return []
+        return list(nodes[-1].below)
+
+    def nearest(self, path):
+        """Return the repositories owning the closest parent of a path.
+
+        This is where a new file most likely belongs: the repositories
+        with dotfiles in the deepest directory above it that has any.
+        The home directory itself does not count.
+        """
+        repo = self._repository(path)
+        if repo is not None:
+            return [repo]
+        nodes = self._walk(path)[1:-1]
+        return list(nodes[-1].below) if nodes else []
+
+    def _owned(self, node, path):
+        """Yield (name, repositories) for the dotfiles below a node."""
+        stack = [(node, path)]
+        while stack:
+            node, path = stack.pop()
+            if node.claims:
+                yield path, list(node.claims)
+            for part in sorted(node.children, reverse=True):
+                stack.append((node.children[part],
+                              os.path.join(path, part)))
+
+    def files(self, path):
+        """Yield (name, repositories) for every dotfile at or below a path.
+
+        Names are yielded in sorted order, straight from the index, so
+        the home directory is not walked.
+        """
+        nodes = self._walk(path)
+        if not nodes or nodes[-1] is None:
+            return iter(())
+        return self._owned(nodes[-1],
+                           os.path.join(self.home, *self._parts(path)))
+
+    def collisions(self):
+        """Yield (name, repositories) for paths owned more than once."""
+        for path, repos in self._owned(self.root, self.home):
+            if len(repos) > 1:
+                yield path, repos
@@ -0,0 +1,407 @@
+import os
+import json
+import stat
+import errno
+
+from collections import OrderedDict
+
+from .exceptions import echo
+
+
+VERSION = 2
+MAX_HANDLES = 64
+
+# os.replace shares os.rename's implementation, but is not listed itself
+DIR_FD = all(f in os.supports_dir_fd for f in
+             (os.mkdir, os.unlink, os.rename, os.symlink, os.stat,
+              os.readlink))
+
+
+class DirectoryHandles(object):
+    """A cache of open directory file descriptors.
+
+    Operations on many files in the same directory can then be issued
+    relative to one descriptor, so the kernel does not resolve the whole
+    directory path again for every call.  The least recently used
+    descriptors are closed once more than `size` are open.
+    """
+
+    def __init__(self, size=MAX_HANDLES):
+        self.size = size
+        self._fds = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def split(self, path):
+        """Return a (directory descriptor, file name) pair for a path."""
+        dir, name = os.path.split(path)
+        fd = self._fds.get(dir)
+        if fd is None:
+            fd = os.open(dir, os.O_RDONLY | os.O_DIRECTORY)
+            self._fds[dir] = fd
+            if len(self._fds) > self.size:
+                os.close(self._fds.popitem(last=False)[1])
+        else:
+            self._fds.move_to_end(dir)
+        return fd, name
+
+    def close(self):
+        while self._fds:
+            os.close(self._fds.popitem()[1])
+
+
+class Plan(object):
+    """An ordered, deduplicated list of file system operations.
+
+    Dotfile operations add what they need to a plan instead of changing
+    the file system themselves.  Executing the plan creates all missing
+    directories first, then removes, moves, copies and links files in
+    the order they were planned and finally removes directories left
+    empty.  Each dotfile's steps are thus carried out together, so when
+    one fails the dotfiles before it are complete and those after it are
+    untouched.  Each directory is checked for and created at most once
+    no matter how many dotfiles live in it, and only directories that
+    files were taken out of are considered for removal.
+
+    Operations are issued relative to cached directory descriptors where
+    the platform supports it, which saves resolving deep paths such as
+    ~/.config/... for every file.  The same descriptors serve the stat
+    calls made while planning, see `handles`.
+
+    A plan can be written to a file and executed later without scanning
+    the repository again.  When executed from a file, progress is
+    journaled next to it so an interrupted run can be resumed, and every
+    operation is checked against the file system first, see _check().
+
+    :param method: the dotfile operation the plan was built for
+    :param repo:   the repository the plan was built for, if any
+    """
+    ORDER = ('mkdir', 'unlink', 'move', 'copy', 'link', 'prune')
+    # carried out in the order they were planned, between mkdir and prune
+    STEPS = ('unlink', 'move', 'copy', 'link')
+
+    FORMATS = {
+        'mkdir':  'MKDIR  %s',
+        'unlink': 'UNLINK %s',
+        'move':   'MOVE   %s -> %s',
+        'copy':   'COPY   %s -> %s',
+        'link':   'LINK   %s -> %s',
+        'prune':  'PRUNE  %s up to %s',
+    }
+
+    def __init__(self, method=None, repo=None):
+        self.method = method
+        self.repository = None if repo is None else str(repo.path)
+        self.home = None if repo is None else str(repo.home)
+        self.operations = {action: [] for action in self.ORDER}
+        self.messages = []
+        self._steps = []
+        self._dirs = set()
+        self._pruned = set()
+        self._handles = None
+
+    def __len__(self):
+        return sum(len(x) for x in self.operations.values())
+
+    def __iter__(self):
+        for args in self.operations['mkdir']:
+            yield ('mkdir',) + args
+        for step in self._steps:
+            yield step
+        for args in self.operations['prune']:
+            yield ('prune',) + args
+
+    def __repr__(self):
+        return '<Plan %s %d operations>' % (self.method, len(self))
+
+    @property
+    def handles(self):
+        """The plan's DirectoryHandles, or None where unsupported.
+
+        They are opened on first use, kept while the plan is built and
+        executed, and closed by close().
+        """
+        if self._handles is None and DIR_FD:
+            self._handles = DirectoryHandles()
+        return self._handles
+
+    def close(self):
+        """Close the plan's directory handles, if any were opened."""
+        if self._handles is not None:
+            self._handles.close()
+            self._handles = None
+
+    def _isdir(self, dir):
+        handles = self.handles
+        if handles is None or dir == os.path.dirname(dir):
+            return os.path.isdir(dir)
+        try:
+            fd, name = handles.split(dir)
+            return stat.S_ISDIR(os.stat(name, dir_fd=fd).st_mode)
+        except OSError:
+            return False
+
+    def mkdir(self, dir):
+        """Ensure a directory and its parents exist before anything else.
+
+        Every directory is examined at most once per plan.
+        """
+        dir = str(dir)
+        missing = []
+        while dir not in self._dirs:
+            self._dirs.add(dir)
+            if self._isdir(dir):
+                break
+            missing.append(dir)
+            dir = os.path.dirname(dir)
+        for dir in reversed(missing):
+            self._add('mkdir', (dir,))
+
+    def _add(self, action, args):
+        self.operations[action].append(args)
+        if action in self.STEPS:
+            self._steps.append((action,) + args)
+
+    def unlink(self, path, st=None):
+        """Remove a symlink or a copied file.
+
+        :param st: the lstat result of the file when it was planned for,
+                   a plan executed from a file refuses to remove the file
+                   once its inode or mtime differ
+        """
+        if st is None:
+            self._add('unlink', (str(path),))
+        else:
+            self._add('unlink', (str(path), st.st_ino, st.st_mtime_ns))
+
+    def move(self, source, destination):
+        """Move a file, replacing the destination."""
+        self._add('move', (str(source), str(destination)))
+
+    def copy(self, source, destination):
+        """Copy a file with its metadata, replacing the destination."""
+        self._add('copy', (str(source), str(destination)))
+
+    def link(self, path, target):
+        """Create a symlink at path whose link text is target."""
+        self._add('link', (str(path), str(target)))
+
+    def prune(self, dir):
+        """Remove a directory and its parents, once they are empty.
+
+        Only directories within the repository or the home directory the
+        plan was built for are removed, never those roots themselves.
+        Directories are removed bottom-up until the first one that is not
+        empty.
+        """
+        dir = str(dir)
+        if dir in self._pruned:
+            return
+        for root in (self.repository, self.home):
+            if root is not None and dir.startswith(os.path.join(root, '')):
+                self._pruned.add(dir)
+                self._add('prune', (dir, root))
+                return
+
+    def done(self, message):
+        """Record a message to show once the plan has been executed."""
+        self.messages.append(message)
+
+    def dirs(self):
+        """Return the directories whose entries the plan changes."""
+        dirs = set()
+        for operation in self:
+            action, path = operation[:2]
+            # copies leave their source alone, links hold no path
+            if action != 'copy':
+                dirs.add(os.path.dirname(path))
+            if action in ('move', 'copy'):
+                dirs.add(os.path.dirname(operation[2]))
+        return dirs
+
+    def describe(self, operation):
+        """Return a human-readable line for an operation."""
+        format = self.FORMATS[operation[0]]
+        # unlink operations may carry the file's identity after its path
+        return format % operation[1:format.count('%s') + 1]
+
+    def dump(self, file):
+        """Write the plan as JSON to a file object."""
+        json.dump({
+            'version': VERSION,
+            'method': self.method,
+            'repository': self.repository,
+            'home': self.home,
+            'operations': [list(x) for x in self],
+            'messages': self.messages,
+        }, file, indent=1)
+        file.write('\n')
+        self.close()
+
+    @classmethod
+    def load(cls, file):
+        """Read a plan written by dump() from a file object."""
+        data = json.load(file)
+        if data.get('version') != VERSION:
+            raise ValueError('unsupported plan version')
+        plan = cls(data['method'])
+        plan.repository = data['repository']
+        plan.home = data['home']
+        for operation in data['operations']:
+            if operation[0] not in plan.operations:
+                raise ValueError('unknown operation: %s' % operation[0])
+            plan._add(operation[0], tuple(operation[1:]))
+        plan.messages = data['messages']
+        return plan
+
+    @staticmethod
+    def _applied(operation, following=()):
+        """Has an operation already been carried out?
+
+        Used when executing from a file, since the last operation of an
+        interrupted run may have completed without being journaled and a
+        plan may be applied again after it completed.
+
+        :param following: the operation after this one, if any, as a file
+                          removed by an unlink may since have been
+                          replaced by the file it moves there
+        """
+        action, path = operation[:2]
+        if action == 'prune':
+            # pruning again is harmless
+            return False
+        if action == 'mkdir':
+            return os.path.isdir(path)
+        if action == 'unlink':
+            return not os.path.lexists(path) or any(
+                x[0] == 'move' and x[2] == path and Plan._applied(x)
+                for x in following)
+        if action == 'move':
+            return not os.path.lexists(path) and \
+                os.path.lexists(operation[2])
+        if action == 'copy':
+            # copies keep the source's size and modification time
+            try:
+                source, destination = os.stat(path), os.lstat(operation[2])
+            except OSError:
+                return False
+            return (source.st_size, source.st_mtime_ns) == \
+                (destination.st_size, destination.st_mtime_ns)
+        if action == 'link':
+            return os.path.islink(path) and os.readlink(path) == operation[2]
+
+    @staticmethod
+    def _check(operation):
+        """Raise FileExistsError if an operation is no longer safe.
+
+        A plan read from a file may have been written long before it is
+        executed.  Nothing is put where a file has appeared since, and a
+        file is only removed while it is the one that was planned for.
+        """
+        action, path = operation[:2]
+        if action in ('move', 'copy'):
+            path = operation[2]
+        if action in ('move', 'copy', 'link'):
+            if os.path.lexists(path):
+                raise FileExistsError(errno.EEXIST, 'Refusing to replace',
+                                      path)
+        elif action == 'unlink' and len(operation) > 2:
+            st = os.lstat(path)
+            if (st.st_ino, st.st_mtime_ns) != tuple(operation[2:]):
+                raise FileExistsError(errno.EEXIST, 'Changed since the plan '
+                                      'was written', path)
+
+    @staticmethod
+    def _apply(operation, handles=None):
+        """Carry out one operation, relative to directory handles if given."""
+        action, path = operation[:2]
+        if action == 'copy':
+            # imported here, copying is rare and shutil is slow to import
+            from .transfer import copy_file
+            copy_file(path, operation[2])
+            return
+        if action == 'prune':
+            root = os.path.join(operation[2], '')
+            while path.startswith(root):
+                try:
+                    os.rmdir(path)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    # not empty, nothing more to prune
+                    return
+                path = os.path.dirname(path)
+            return
+
+        if handles is None:
+            if action == 'mkdir':
+                os.mkdir(path)
+            elif action == 'unlink':
+                os.unlink(path)
+            elif action == 'move':
+                os.replace(path, operation[2])
+            elif action == 'link':
+                os.symlink(operation[2], path)
+            return
+
+        fd, name = handles.split(path)
+        if action == 'mkdir':
+            os.mkdir(name, dir_fd=fd)
+        elif action == 'unlink':
+            os.unlink(name, dir_fd=fd)
+        elif action == 'move':
+            dst_fd, dst_name = handles.split(operation[2])
+            os.replace(name, dst_name, src_dir_fd=fd, dst_dir_fd=dst_fd)
+        elif action == 'link':
+            os.symlink(operation[2], name, dir_fd=fd)
+
+    def execute(self, debug=False, journal=None):
+        """Carry out the plan, or only show it when debug is set.
+
+        :param journal: a path where the index of every completed
+                        operation is recorded, given when executing a plan
+                        read from a file.  Operations recorded there or
+                        found to be applied already are skipped, the others
+                        are checked before they are carried out, and the
+                        journal is removed once the whole plan has been
+                        executed.
+        """
+        if debug:
+            self.close()
+            for operation in self:
+                echo(self.describe(operation))
+            return
+
+        completed = set()
+        if journal is not None:
+            try:
+                with open(journal) as f:
+                    completed = {int(x) for x in f.read().split()}
+            except FileNotFoundError:
+                pass
+            log = open(journal, 'a', buffering=1)
+
+        operations = list(self)
+        handles = self.handles
+        try:
+            for i, operation in enumerate(operations):
+                if i in completed:
+                    continue
+                if journal is None:
+                    self._apply(operation, handles)
+                elif not self._applied(operation, operations[i + 1:i + 2]):
+                    self._check(operation)
+                    self._apply(operation, handles)
+                if journal is not None:
+                    log.write('%d\n' % i)
+        finally:
+            self.close()
+            if journal is not None:
+                log.close()
+
+        if journal is not None:
+            os.unlink(journal)
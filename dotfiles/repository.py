@@ -1,35 +1,64 @@
 import os
 
-from click import echo
 from pathlib import Path
-from fnmatch import fnmatch
-from operator import attrgetter
 
 from .dotfile import Dotfile
-from .exceptions import DotfileException, TargetIgnored
+from .ignore import IgnoreMatcher
+from .manifest import Manifest, NAME as MANIFEST
+from .mapping import PathMapper
+from .exceptions import echo, DotfileException, TargetIgnored
 from .exceptions import NotRootedInHome, InRepository, IsDirectory
 
 
+def _entry_name(entry):
+    return entry.name
+
+
 class Repositories(object):
-    """An iterable collection of repository objects."""
-    def __init__(self, paths, home=Path.home()):
-        self.repos = []
-        for path in paths:
-            self.repos.append(Repository(path, home))
+    """An iterable collection of repository objects.
+
+    Repositories are constructed on first access, so commands that do
+    not need all of them don't pay for resolving or creating them.
+    """
+    def __init__(self, paths, home=None, scan='walk'):
+        self.paths = list(paths)
+        self.home = home
+        self.scan = scan
+        self.repos = [None] * len(self.paths)
 
     def __len__(self):
         return len(self.repos)
 
     def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if self.repos[index] is None:
+            self.repos[index] = Repository(self.paths[index], self.home,
+                                           self.scan)
         return self.repos[index]
 
+    def load(self):
+        """Construct every repository now."""
+        for i in range(len(self)):
+            self[i]
+        return self
+
 
 class Repository(object):
-    """A repository is a directory that contains dotfiles."""
+    """A repository is a directory that contains dotfiles.
+
+    :param scan: how the repository's files are found when it has no
+                 manifest, by walking it ('walk') or from its git index
+                 ('git')
+    """
     REMOVE_LEADING_DOT = True
-    IGNORE_PATTERNS = ['.git/*', '.gitignore', 'README*', '*~']
+    IGNORE_PATTERNS = ['.git/', '.gitignore', '.dotfilesignore', 'README*',
+                       '*~', MANIFEST]
+    SCANS = ('walk', 'git')
 
-    def __init__(self, path, home=Path.home()):
+    def __init__(self, path, home=None, scan='walk'):
+        if home is None:
+            home = Path.home()
         self.path = Path(path).expanduser().resolve()
         self.home = Path(home).expanduser().resolve()
 
@@ -40,6 +69,11 @@ class Repository(object):
         if not self.home.exists():
             raise FileNotFoundError(self.home)
 
+        self.reload_ignore()
+        self.mapper = PathMapper(self.path, self.home,
+                                 self.REMOVE_LEADING_DOT)
+        self.scan = scan
+        self._listing = None
 
     def __str__(self):
         """Return human-readable repository contents."""
@@ -48,88 +82,238 @@ class Repository(object):
     def __repr__(self):
         return '<Repository %r>' % str(self.path)
 
-    def _ignore(self, path):
-        """Test whether a dotfile should be ignored."""
-        for pattern in self.IGNORE_PATTERNS:
-            if fnmatch(str(path), '*/%s' % pattern):
-                return True
-        return False
+    def reload_ignore(self):
+        """Read the repository's ignore files again."""
+        self.ignore = IgnoreMatcher.from_directory(self.path,
+                                                   self.IGNORE_PATTERNS)
+
+    def _ignore(self, path, is_dir=False):
+        """Test whether a repository path should be ignored."""
+        relpath = os.path.relpath(str(path), str(self.path))
+        return self.ignore.excluded(relpath, is_dir)
 
     def _dotfile_path(self, target):
         """Return the expected symlink for the given repository target."""
-        relpath = target.relative_to(self.path)
-        if self.REMOVE_LEADING_DOT:
-            return self.home / ('.%s' % relpath)
-        else:
-            return self.home / relpath
+        return Path(self.mapper.name(target))
 
     def _dotfile_target(self, path):
         """Return the expected repository target for the given symlink."""
-        try:
-            # is the dotfile within the home directory?
-            relpath = str(path.relative_to(self.home))
-        except ValueError:
-            raise NotRootedInHome(path)
-
-        if self.REMOVE_LEADING_DOT and relpath[0] == '.':
-            relpath = relpath[1:]
-
-        return self.path / relpath
+        return Path(self.mapper.target(path))
 
     def _dotfile(self, path):
         """Return a valid dotfile for the given path."""
-        target = self._dotfile_target(path)
+        path = str(path)
+        target = self.mapper.target(path)
 
-        if not fnmatch(str(path), '%s/*' % self.home):
+        if not path.startswith(os.path.join(str(self.home), '')):
             raise NotRootedInHome(path)
-        if fnmatch(str(path), '%s/*' % self.path):
+        repository = os.path.join(str(self.path), '')
+        if path.startswith(repository):
             raise InRepository(path)
-        if self._ignore(target):
+        if self.ignore.excluded(target[len(repository):]):
             raise TargetIgnored(path)
-        if path.is_dir():
+        if os.path.isdir(path):
             raise IsDirectory(path)
 
-        return Dotfile(path, target)
+        return Dotfile(path, target, self.mapper)
+
+    def _walk(self, dir, relpath='', dirs=False):
+        """Yield unignored paths below a directory, depth first.
+
+        Ignored directories are skipped before they are entered and the
+        file type information from each directory entry is reused, so no
+        extra stat calls are needed.  Symlinked directories are neither
+        followed nor yielded.  When `dirs` is true, directories are
+        yielded after their contents (bottom-up) instead of files.  Paths
+        are yielded as strings.
+
+        Each directory listing is sorted by name and subdirectories are
+        entered at their position in the listing, so paths come out in
+        the same order as sorting them would give while only the
+        listings along the current path are held in memory.
+
+        :param relpath: the path of `dir` relative to the repository, used
+                        for ignore matching, or None to match nothing
+        """
+        match = self.ignore.match
+        stack = [(str(dir), relpath, None)]
+        while stack:
+            path, rel, entries = stack[-1]
+            if entries is None:
+                try:
+                    with os.scandir(path) as listing:
+                        entries = iter(sorted(listing, key=_entry_name))
+                except OSError:
+                    stack.pop()
+                    continue
+                stack[-1] = (path, rel, entries)
+            for entry in entries:
+                if rel is None:
+                    child = None
+                else:
+                    child = rel + '/' + entry.name if rel else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if child is None or not match(child, True):
+                        stack.append((entry.path, child, None))
+                        break
+                elif entry.is_symlink() and entry.is_dir():
+                    continue
+                elif not dirs and (child is None or not match(child)):
+                    yield entry.path
+            else:
+                stack.pop()
+                if dirs and stack:
+                    yield path
 
     def _contents(self, dir):
-        """Return all unignored files contained below a directory."""
-        def skip(path):
-            return path.is_dir() or self._ignore(path)
+        """Return all unignored files contained below a directory.
 
-        return [x for x in dir.rglob('*') if not skip(x)]
+        The directory may be within the repository or within the home
+        directory, in which case ignore rules apply to the corresponding
+        repository paths.
+        """
+        dir = Path(dir)
+        if dir == self.path:
+            return self._walk(dir)
+        try:
+            relpath = str(dir.relative_to(self.path))
+        except ValueError:
+            try:
+                relpath = str(self._dotfile_target(dir).relative_to(self.path))
+            except (DotfileException, ValueError):
+                relpath = None
+            if dir == self.home or relpath == '.':
+                relpath = None
+        if relpath is not None and self.ignore.excluded(relpath, True):
+            return iter(())
+        return self._walk(dir, relpath)
 
     def contents(self):
-        """Return dotfile objects for each file in the repository."""
-        def construct(target):
-            return Dotfile(self._dotfile_path(target), target)
+        """Yield dotfile objects for each file in the repository.
 
-        contents = self._contents(self.path)
-        return sorted(map(construct, contents), key=attrgetter('name'))
+        Dotfiles are produced lazily while the repository is walked, in
+        order of their names.  Each directory listing is mapped to the
+        home directory in one pass, see PathMapper.names().  When the
+        repository has a manifest, the files listed there are used
+        instead of walking the repository.
+        """
+        mapper = self.mapper
+        prefix = len(os.path.join(str(self.path), ''))
+        targets, blobs = self._listing or self._targets()
+        for name, target in mapper.names(targets):
+            yield Dotfile(name, target, mapper, blobs.get(target[prefix:]))
+
+    def listing(self):
+        """Scan the repository's files once for all later contents().
+
+        The files are kept in memory, so changes to the repository after
+        this are not seen.  Used to serve many home directories from one
+        scan, see rehome().
+        """
+        if self._listing is None:
+            targets, blobs = self._targets()
+            self._listing = (list(targets), blobs)
+        return self._listing
 
-    def dotfiles(self, paths):
-        """Return a collection of dotfiles given a list of paths.
+    def rehome(self, home):
+        """Return a copy of this repository for another home directory.
 
-        This function takes a list of paths where each path can be a
-        file or a directory.  Each directory is recursively expaned into
-        file paths.  Once the list is converted into only files, Dotfile
-        objects are constructed for each item in the set.  This set of
-        dotfiles is returned to the caller.
+        The copy shares the ignore rules and the listing, if any, of this
+        repository, so the repository is not read again for it.
         """
-        paths = [Path(x).expanduser().absolute() for x in paths]
-
+        # imported here, only needed for several home directories
+        from copy import copy
+        home = Path(home).expanduser().resolve()
+        if not home.exists():
+            raise FileNotFoundError(home)
+        other = copy(self)
+        other.home = home
+        other.mapper = PathMapper(self.path, home, self.REMOVE_LEADING_DOT)
+        return other
+
+    def _targets(self):
+        """Return the repository's files and what git knows of them.
+
+        Files are listed from the manifest if there is one, from the git
+        index when scanning with git, or else by walking the repository.
+        The second item maps relative paths to their Blob in the git
+        index, where one is known.
+        """
+        try:
+            manifest = Manifest.load(self.path)
+            if manifest is not None:
+                return manifest.files(), {}
+            if self.scan == 'git':
+                return self._tracked()
+        except (OSError, ValueError) as err:
+            echo('%s, walking the repository instead' % err)
+        return self._contents(self.path), {}
+
+    def _tracked(self):
+        """Return the files found with the git index, see _targets()."""
+        # imported here, only needed when scanning with git
+        from .gitindex import git_dir, GitIndex, Tree
+        path = git_dir(self.path)
+        index = None if path is None else GitIndex.load(path)
+        if index is None:
+            return self._contents(self.path), {}
+        prefix = os.path.join(str(self.path), '')
+        targets = [prefix + x for x in Tree(self, index).files()]
+        return targets, index.entries
+
+    def _expand(self, paths):
+        """Yield the files named by paths, expanding directories.
+
+        Directories are expanded through the same walk as contents(), so
+        ignored directories are never entered.  A home directory that does
+        not exist is expanded from the repository.  Every file is yielded
+        once, as a string, and a directory within one that was already
+        expanded is not walked again.
+        """
+        seen = set()
+        expanded = set()
         for path in paths:
+            path = Path(path).expanduser().absolute()
+            key = str(path)
+            if key in seen or key in expanded:
+                continue
             if path.is_dir():
-                paths.extend(self._contents(path))
-                paths.remove(path)
+                children = self._contents(path)
+            else:
+                # a home directory that does not exist yet is expanded
+                # from its counterpart in the repository
+                try:
+                    target = self._dotfile_target(path)
+                except DotfileException:
+                    target = None
+                if target is None or not target.is_dir():
+                    seen.add(key)
+                    yield key
+                    continue
+                children = (name for name, _ in
+                            self.mapper.names(self._contents(target)))
+            if any(str(x) in expanded for x in path.parents):
+                continue
+            expanded.add(key)
+            for child in children:
+                if child not in seen:
+                    seen.add(child)
+                    yield child
+
+    def dotfiles(self, paths):
+        """Yield dotfile objects given an iterable of paths.
 
-        def construct(path):
+        Each path can be a file or a directory, which is recursively
+        expanded into file paths.  Paths are consumed lazily, so a long
+        stream of them is never held in memory, and duplicates are
+        dropped.  Paths that are not valid dotfiles are reported and
+        skipped.
+        """
+        for path in self._expand(paths):
             try:
-                return self._dotfile(path)
+                yield self._dotfile(path)
             except DotfileException as err:
                 echo(err)
-                return None
-
-        return [d for d in map(construct, paths) if d is not None]
 
     def prune(self, debug=False):
         """Remove any empty directories in the repository.
@@ -137,17 +321,15 @@ class Repository(object):
         After a remove operation, there may be empty directories remaining.
         The Dotfile class has no knowledge of other dotfiles in the repository,
         so pruning must take place explicitly after such operations occur.
+        Plans prune the directories they take files out of by themselves,
+        this walks the whole repository.  With `debug`, the directories
+        are only shown.
         """
-        def skip(path):
-            return self._ignore(path) or path == str(self.path)
-
-        # TODO: this *could* use pathlib instead
-
-        dirs = reversed([dir for dir, subdirs, files in
-                         os.walk(str(self.path)) if not skip(dir)])
-
-        for dir in dirs:
-            if not len(os.listdir(dir)):
+        for dir in self._walk(self.path, dirs=True):
+            with os.scandir(dir) as entries:
+                empty = next(entries, None) is None
+            if empty:
                 if debug:
                     echo('PRUNE  %s' % (dir))
-                os.rmdir(dir)
+                else:
+                    os.rmdir(dir)
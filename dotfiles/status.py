@@ -0,0 +1,200 @@
+import os
+import re
+
+from heapq import merge
+from itertools import groupby
+from operator import attrgetter
+from collections import deque
+
+from .index import StatIndex
+
+
+NETWORK_FILESYSTEMS = {
+    '9p', 'afs', 'ceph', 'cifs', 'davfs', 'fuse.glusterfs', 'fuse.sshfs',
+    'glusterfs', 'gpfs', 'lustre', 'ncpfs', 'nfs', 'nfs4', 'smb3', 'smbfs',
+    'sshfs',
+}
+MAX_JOBS = 32
+PREFETCH = 1024
+
+
+def _unescape(field):
+    """Decode the octal escapes used for spaces and such in /proc/mounts."""
+    return re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), field)
+
+
+def fstype(path, mounts='/proc/self/mounts'):
+    """Return the type of the file system a path is on, or None."""
+    path = os.path.realpath(str(path))
+    best, kind = '', None
+    try:
+        with open(mounts) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount = _unescape(fields[1])
+                if (path == mount or
+                        path.startswith(os.path.join(mount, ''))) and \
+                        len(mount) >= len(best):
+                    best, kind = mount, fields[2]
+    except OSError:
+        pass
+    return kind
+
+
+def default_jobs(path):
+    """Pick a number of status workers for a directory.
+
+    Stat calls on local file systems are cheap enough that handing them
+    to threads costs more than it saves, so they are classified serially.
+    On network file systems every call is a round trip, so several are
+    kept in flight per CPU.
+    """
+    if fstype(path) in NETWORK_FILESYSTEMS:
+        return min(MAX_JOBS, (os.cpu_count() or 1) * 4)
+    return 1
+
+
+def classify(items, jobs=1, state=attrgetter('state')):
+    """Yield (item, state) pairs in the order the items are given.
+
+    With more than one job, states are computed by a pool of threads.
+    Only a bounded number of items is in flight at any time, so the
+    input is consumed lazily and the first results are yielded as soon
+    as they are known.
+
+    :param jobs:  the number of worker threads
+    :param state: a function returning the state of an item, by default
+                  the item is a dotfile and its state attribute is used
+    """
+    if jobs <= 1:
+        for item in items:
+            yield item, state(item)
+        return
+
+    # imported here, it is slow to import and only needed for jobs > 1
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(state, item)))
+            if len(pending) >= jobs * 4:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
+def prefetch(iterable, size=PREFETCH):
+    """Consume an iterable in a background thread, yielding its items.
+
+    At most `size` items are buffered.  Exceptions raised by the iterable
+    are raised again in the consumer, and the thread stops soon after the
+    consumer is closed.
+    """
+    import queue
+    import threading
+
+    items = queue.Queue(size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as err:
+            put((done, err))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, err = items.get()
+            if item is done:
+                if err is not None:
+                    raise err
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def _name(item):
+    return item[1].key
+
+
+def scan(repos):
+    """Scan repositories concurrently and merge their contents.
+
+    Yields (repository, dotfile, claims) tuples ordered by home path.
+    When more than one repository has a dotfile for the same home path,
+    `claims` holds all of those repositories in the order given and the
+    home path is examined only once for all of them, otherwise it is
+    empty.
+    """
+    def contents(repo):
+        return ((repo, dotfile) for dotfile in repo.contents())
+
+    if len(repos) == 1:
+        streams = [contents(repos[0])]
+    else:
+        streams = [prefetch(contents(repo)) for repo in repos]
+
+    for _, group in groupby(merge(*streams, key=_name), key=_name):
+        group = list(group)
+        if len(group) == 1:
+            yield group[0] + ((),)
+            continue
+        first = group[0][1]
+        for _, dotfile in group[1:]:
+            dotfile.share_snapshot(first)
+        claims = tuple(repo for repo, _ in group)
+        for repo, dotfile in group:
+            yield repo, dotfile, claims
+
+
+def report(repos, jobs=None, refresh=False):
+    """Yield (name, state, claims) tuples for the dotfiles in repositories.
+
+    Names are relative to the home directory and in sorted order.  For a
+    name claimed by more than one repository, `claims` holds the paths of
+    those repositories and a tuple is yielded for each of them.  States
+    are looked up in each repository's stat index, which is rebuilt from
+    scratch when `refresh` is set, and the indexes are saved once every
+    dotfile has been reported.
+
+    :param jobs: the number of worker threads, picked from the type of
+                 the home directory's file system by default
+    """
+    if jobs is None:
+        jobs = default_jobs(repos[0].home)
+    load = StatIndex if refresh else StatIndex.load
+    indexes = {repo: load(repo) for repo in repos}
+    prefixes = {repo: len(os.path.join(str(repo.home), '')) for repo in repos}
+
+    def state(item):
+        repo, dotfile, claims = item
+        return indexes[repo].state(dotfile)
+
+    for (repo, dotfile, claims), dotfile_state in \
+            classify(scan(repos), jobs, state):
+        yield (str(dotfile)[prefixes[repo]:], dotfile_state,
+               tuple(str(x.path) for x in claims))
+
+    for index in indexes.values():
+        index.save()
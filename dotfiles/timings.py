@@ -0,0 +1,181 @@
+import os
+import time
+import heapq
+import threading
+
+from collections import Counter, OrderedDict
+
+from . import digest
+from .dotfile import Dotfile, Snapshot
+from .ignore import IgnoreMatcher
+from .index import StatIndex
+from .plan import Plan
+from .repository import Repository
+
+
+SLOWEST = 10
+
+# file system calls counted, all made through the os module
+FS_CALLS = ('stat', 'lstat', 'scandir', 'listdir', 'readlink', 'open',
+            'mkdir', 'rmdir', 'unlink', 'replace', 'rename', 'symlink')
+
+
+class Timings(object):
+    """Account where the time of a command goes.
+
+    Once installed, the functions behind every phase of a command are
+    wrapped so that the wall time spent in each phase is added up, the
+    file system calls made through the os module are counted, and the
+    dotfiles that took longest to classify or plan are kept.  Phases are
+    timed exclusively: time spent in a nested phase, such as ignore
+    matching during the walk, is not also charged to the outer one.
+
+    Nothing is wrapped until install() is called, so commands that do
+    not ask for timings run the original functions.
+
+    :param slowest: the number of slowest dotfiles to keep
+    """
+
+    def __init__(self, slowest=SLOWEST):
+        self.size = slowest
+        self.phases = OrderedDict()
+        self.calls = Counter()
+        self.slowest = []
+        self.started = None
+        self._local = threading.local()
+        self._restore = []
+
+    def __repr__(self):
+        return '<Timings %d phases>' % len(self.phases)
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def _charge(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def enter(self, phase):
+        """Start charging time to a phase, pausing the current one."""
+        now = time.perf_counter()
+        stack = self._stack()
+        if stack:
+            self._charge(stack[-1][0], now - stack[-1][1])
+        stack.append([phase, now])
+
+    def leave(self):
+        """Stop charging time to the current phase, resuming the outer one."""
+        now = time.perf_counter()
+        stack = self._stack()
+        phase, start = stack.pop()
+        self._charge(phase, now - start)
+        if stack:
+            stack[-1][1] = now
+
+    def _phase(self, phase, function):
+        def wrapper(*args, **kwargs):
+            self.enter(phase)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.leave()
+        return wrapper
+
+    def _generator(self, phase, function):
+        def wrapper(*args, **kwargs):
+            iterator = function(*args, **kwargs)
+            while True:
+                self.enter(phase)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.leave()
+                yield item
+        return wrapper
+
+    def _dotfile(self, phase, function):
+        def wrapper(dotfile, *args, **kwargs):
+            start = time.perf_counter()
+            self.enter(phase)
+            try:
+                return function(dotfile, *args, **kwargs)
+            finally:
+                self.leave()
+                self.record(time.perf_counter() - start, str(dotfile))
+        return wrapper
+
+    def _counted(self, name, function):
+        def wrapper(*args, **kwargs):
+            self.calls[name] += 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    def record(self, seconds, name):
+        """Remember a dotfile if it is among the slowest seen."""
+        if len(self.slowest) < self.size:
+            heapq.heappush(self.slowest, (seconds, name))
+        elif self.size:
+            heapq.heappushpop(self.slowest, (seconds, name))
+
+    def _patch(self, owner, name, value):
+        self._restore.append((owner, name, vars(owner)[name]))
+        setattr(owner, name, value)
+
+    def install(self):
+        """Wrap the functions behind every phase and start the clock."""
+        import click
+
+        state = vars(Dotfile)['state']
+        patches = [
+            (Repository, '_walk', self._generator('walk', Repository._walk)),
+            (IgnoreMatcher, 'match',
+             self._phase('ignore', IgnoreMatcher.match)),
+            (StatIndex, 'state', self._phase('index', StatIndex.state)),
+            (Snapshot, '__init__', self._phase('stat', Snapshot.__init__)),
+            (Dotfile, 'state',
+             property(self._dotfile('classify', state.fget))),
+            (Dotfile, '_same_contents',
+             self._phase('compare', Dotfile._same_contents)),
+            (digest, '_hash', self._phase('hash', digest._hash)),
+            (digest, '_compare', self._phase('hash', digest._compare)),
+            (Dotfile, 'plan', self._dotfile('plan', Dotfile.plan)),
+            (Plan, 'execute', self._phase('execute', Plan.execute)),
+            (click, 'echo', self._phase('render', click.echo)),
+            (click, 'secho', self._phase('render', click.secho)),
+        ]
+        patches.extend((os, name, self._counted(name, getattr(os, name)))
+                       for name in FS_CALLS)
+        for owner, name, value in patches:
+            self._patch(owner, name, value)
+        self.started = time.perf_counter()
+
+    def uninstall(self):
+        """Restore the original functions."""
+        while self._restore:
+            owner, name, value = self._restore.pop()
+            setattr(owner, name, value)
+
+    def report(self):
+        """Return the report as a list of lines."""
+        total = time.perf_counter() - self.started
+        phases = list(self.phases.items())
+        phases.append(('other', max(0.0, total - sum(self.phases.values()))))
+        lines = ['timings:']
+        lines.extend('  %-10s %10.1f ms' % (phase, seconds * 1000)
+                     for phase, seconds in phases)
+        lines.append('  %-10s %10.1f ms' % ('total', total * 1000))
+        if self.calls:
+            lines.append('calls:')
+            lines.extend('  %-10s %10d' % item
+                         for item in sorted(self.calls.items()))
+        if self.slowest:
+            lines.append('slowest:')
+            lines.extend('  %8.2f ms  %s' % (seconds * 1000, name)
+                         for seconds, name in sorted(self.slowest,
+                                                     reverse=True))
+        return lines
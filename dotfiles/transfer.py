@@ -0,0 +1,111 @@
+import os
+import shutil
+
+
+# ioctl request to share a file's extents with another, from linux/fs.h
+FICLONE = 0x40049409
+# upper bound for a single kernel copy call
+MAX_COUNT = 1 << 30
+CHUNK_SIZE = 1024 * 1024
+
+
+def _clone(src, dst):
+    """Make dst a reflink of src, on file systems such as btrfs and xfs."""
+    import fcntl
+    fcntl.ioctl(dst, FICLONE, src)
+    return os.fstat(dst).st_size
+
+
+def _copy_file_range(src, dst):
+    """Copy within the kernel, possibly offloaded to the file system."""
+    copied = 0
+    while True:
+        count = os.copy_file_range(src, dst, MAX_COUNT)
+        if not count:
+            return copied
+        copied += count
+
+
+def _sendfile(src, dst):
+    """Copy within the kernel through the page cache."""
+    copied = 0
+    while True:
+        count = os.sendfile(dst, src, None, MAX_COUNT)
+        if not count:
+            return copied
+        copied += count
+
+
+def _read_write(src, dst):
+    """Copy through user space, the fallback that always works."""
+    copied = 0
+    while True:
+        chunk = os.read(src, CHUNK_SIZE)
+        if not chunk:
+            return copied
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(dst, view):]
+        copied += len(chunk)
+
+
+METHODS = [('clone', _clone)]
+if hasattr(os, 'copy_file_range'):
+    METHODS.append(('copy_file_range', _copy_file_range))
+if hasattr(os, 'sendfile'):
+    METHODS.append(('sendfile', _sendfile))
+
+
+def _transfer(src, dst, size):
+    """Copy between open files with the cheapest method that works.
+
+    Returns the name of the method used.  A method that fails, or copies
+    nothing from a file that is not empty, is taken as unsupported here:
+    the destination is truncated and the next method is tried.
+    """
+    for name, method in METHODS:
+        try:
+            if method(src, dst) or not size:
+                return name
+        except OSError:
+            pass
+        os.lseek(src, 0, os.SEEK_SET)
+        os.lseek(dst, 0, os.SEEK_SET)
+        os.ftruncate(dst, 0)
+    _read_write(src, dst)
+    return 'read'
+
+
+def copy_file(source, destination):
+    """Copy a file, atomically replacing the destination.
+
+    The data is copied into a temporary file next to the destination,
+    which is renamed over it once complete, so readers never see a
+    partial file.  Where the file system allows, the copy is a reflink
+    sharing the source's extents, otherwise the kernel copies the data
+    without passing it through Python.  Permission bits, timestamps and
+    extended attributes are preserved.
+
+    Returns the name of the copy method used.
+    """
+    dir, base = os.path.split(str(destination))
+    tmp = os.path.join(dir, '.%s.%d.tmp' % (base, os.getpid()))
+    src = os.open(str(source), os.O_RDONLY)
+    try:
+        dst = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            try:
+                method = _transfer(src, dst, os.fstat(src).st_size)
+            finally:
+                os.close(dst)
+            shutil.copystat(str(source), tmp)
+            os.replace(tmp, str(destination))
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+    finally:
+        os.close(src)
+    return method
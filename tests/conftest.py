@@ -4,6 +4,13 @@ from click.testing import CliRunner
 from dotfiles.repository import Repository
 
 
+@pytest.fixture(autouse=True)
+def cache(tmp_path_factory, monkeypatch):
+    path = tmp_path_factory.mktemp('cache')
+    monkeypatch.setenv('XDG_CACHE_HOME', str(path))
+    return path
+
+
 @pytest.fixture(scope='function', params=['', 'home'])
 def repo(request, tmpdir):
     path = str(tmpdir.ensure_dir('repo'))
@@ -11,6 +18,17 @@ def repo(request, tmpdir):
     return Repository(path, home)
 
 
+@pytest.fixture(scope='function')
+def touch(repo):
+    """Create files in the repository, each containing its own name."""
+    def touch(*paths):
+        for path in paths:
+            path = repo.path / path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(path.name)
+    return touch
+
+
 @pytest.fixture(scope='function')
 def runner():
     return CliRunner()
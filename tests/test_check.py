@@ -0,0 +1,79 @@
+import os
+
+from dotfiles.check import Summary, check
+from dotfiles.status import scan as full_scan
+from dotfiles.repository import Repositories
+
+
+def _repos(repo):
+    return Repositories([str(repo.path)], repo.home)
+
+
+def _age(summary):
+    # stamps taken within the timestamp granularity are never trusted
+    summary.written += 10 ** 10
+    summary.save()
+
+
+def test_check(repo):
+    repos = _repos(repo)
+    assert check(repos)
+
+    (repo.path / 'a').touch()
+    assert not check(repos)
+
+    (repo.home / '.a').symlink_to(repo.path / 'a')
+    assert check(repos)
+
+
+def test_cached_summary(repo):
+    (repo.path / 'a').touch()
+    (repo.home / '.a').symlink_to(repo.path / 'a')
+    repos = _repos(repo)
+    assert check(repos)
+
+    summary = Summary.load(repos.paths, repos.home)
+    assert str(repo.path) in summary.stamps
+    assert str(repo.home) in summary.stamps
+    _age(summary)
+    assert Summary.load(repos.paths, repos.home).valid()
+
+    (repo.home / '.a').unlink()
+    assert not Summary.load(repos.paths, repos.home).valid()
+    assert not check(repos)
+
+
+def test_cached_summary_skips_scan(repo, monkeypatch):
+    repos = _repos(repo)
+    assert check(repos)
+    _age(Summary.load(repos.paths, repos.home))
+
+    monkeypatch.setattr('dotfiles.check.scan', None)
+    assert check(repos)
+
+
+def test_copied_dotfile_edited(repo):
+    (repo.path / 'a').write_text('a')
+    (repo.home / '.a').write_text('a')
+    repos = _repos(repo)
+    assert check(repos)
+    _age(Summary.load(repos.paths, repos.home))
+
+    (repo.home / '.a').write_text('b')
+    os.utime(str(repo.home / '.a'), ns=(1, 1))
+    assert not check(repos)
+
+
+def test_stops_at_first_drift(repo, monkeypatch):
+    for name in 'abc':
+        (repo.path / name).touch()
+    scanned = []
+
+    def scan(repos):
+        for item in full_scan(repos):
+            scanned.append(item)
+            yield item
+
+    monkeypatch.setattr('dotfiles.check.scan', scan)
+    assert not check(_repos(repo))
+    assert len(scanned) == 1
@@ -1,4 +1,8 @@
-from dotfiles.cli import cli
+import io
+
+import pytest
+
+from dotfiles.cli import cli, read_paths
 
 
 class TestCli(object):
@@ -8,3 +12,68 @@ class TestCli(object):
         result = runner.invoke(cli, ['-r', str(repo.path), 'status'])
         assert not result.exception
         assert result.output == ''
+
+    def test_status_skips_ignored_dirs(self, runner, repo):
+        (repo.path / '.git/objects').mkdir(parents=True)
+        (repo.path / '.git/objects/ab').touch()
+        (repo.path / 'config/dotfiles-test').mkdir(parents=True)
+        (repo.path / 'config/dotfiles-test/init.vim').touch()
+        (repo.path / 'dotfiles-testrc').touch()
+        (repo.path / 'dotfiles-testrc~').touch()
+
+        result = runner.invoke(cli, ['-r', str(repo.path), 'status', '-a'])
+        assert not result.exception
+        assert result.output.splitlines() == [
+            '? .config/dotfiles-test/init.vim',
+            '? .dotfiles-testrc',
+        ]
+
+    def test_status_jobs(self, runner, repo):
+        for n in range(20):
+            (repo.path / ('dotfiles-test%02d' % n)).touch()
+
+        args = ['-r', str(repo.path), 'status', '-a']
+        serial = runner.invoke(cli, args + ['-j', '1'])
+        parallel = runner.invoke(cli, args + ['-j', '4'])
+        assert not parallel.exception
+        assert parallel.output == serial.output
+        assert len(parallel.output.splitlines()) == 20
+
+    def test_status_multiple_repos(self, runner, tmpdir):
+        base = tmpdir.ensure_dir('base')
+        host = tmpdir.ensure_dir('host')
+        base.ensure('dotfiles-test-a')
+        base.ensure('dotfiles-test-c')
+        host.ensure('dotfiles-test-b')
+        host.ensure('dotfiles-test-c')
+
+        result = runner.invoke(cli, ['-r', str(base), '-r', str(host),
+                                     'status'])
+        assert not result.exception
+        assert result.output.splitlines() == [
+            '? .dotfiles-test-a',
+            '? .dotfiles-test-b',
+            '= .dotfiles-test-c (%s, %s)' % (base, host),
+            '? .dotfiles-test-c',
+            '? .dotfiles-test-c',
+        ]
+
+
+@pytest.mark.parametrize('size', [1, 3, 1024])
+def test_read_paths(size):
+    data = b'a\0bc\0\0d/e f\0g'
+    assert list(read_paths(io.BytesIO(data), size)) == [
+        'a', 'bc', 'd/e f', 'g']
+
+
+def test_enable_from_file(runner, repo):
+    for name in ['dotfiles-test-a', 'dotfiles-test-b']:
+        (repo.path / name).touch()
+    names = [bytes(repo.home / ('.%s' % x))
+             for x in ['dotfiles-test-a', 'dotfiles-test-b']]
+    result = runner.invoke(cli, ['-r', str(repo.path), 'enable', '--debug',
+                                 '--from-file', '-'],
+                           input=b'\0'.join(names),
+                           env={'HOME': str(repo.home)})
+    assert not result.exception
+    assert result.output.count('LINK') == 2
@@ -0,0 +1,80 @@
+import os
+
+from operator import attrgetter
+
+import pytest
+
+from dotfiles import digest
+from dotfiles.digest import DigestCache
+from dotfiles.dotfile import Dotfile
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Record the number of bytes read from each file compared."""
+    counts = {}
+
+    class Counted(object):
+        def __init__(self, path, *args, **kwargs):
+            self.path = path
+            self.file = open(path, *args, **kwargs)
+            counts.setdefault(path, 0)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.file.close()
+
+        def readinto(self, buf):
+            n = self.file.readinto(buf)
+            counts[self.path] += n
+            return n
+
+    monkeypatch.setattr(digest, '_shared', DigestCache())
+    monkeypatch.setattr(digest, 'open', Counted, raising=False)
+    return counts
+
+
+def _copy(repo, name, contents, target_contents):
+    dotfile = Dotfile(repo.home / name, repo.path / name.lstrip('.'))
+    dotfile.name.write_bytes(contents)
+    dotfile.target.write_bytes(target_contents)
+    return dotfile
+
+
+def test_dotfile_keys_sort_like_paths(repo):
+    names = ['a.b', 'a/b', 'a/a/z', 'a-b/c', 'B', 'a0', 'b/.x', 'a b']
+    dotfiles = [Dotfile(repo.home / x, repo.path / x) for x in names]
+    assert [str(x) for x in sorted(dotfiles, key=attrgetter('key'))] == \
+        [str(x) for x in sorted(dotfiles, key=attrgetter('name'))]
+    assert not hasattr(dotfiles[0], '__dict__')
+
+
+def test_same_contents(repo, reads):
+    dotfile = _copy(repo, '.a', b'abc' * 1000, b'abc' * 1000)
+    assert dotfile.state == 'copy'
+    assert sorted(reads.values()) == [3000, 3000]
+
+
+def test_sizes_differ(repo, reads):
+    dotfile = _copy(repo, '.a', b'abc', b'abcd')
+    assert dotfile.state == 'conflict'
+    assert reads == {}
+
+
+def test_same_inode(repo, reads):
+    dotfile = Dotfile(repo.home / '.a', repo.path / 'a')
+    dotfile.target.write_text('a')
+    os.link(str(dotfile.target), str(dotfile.name))
+    assert dotfile.state == 'copy'
+    assert reads == {}
+
+
+def test_stops_at_first_difference(repo, reads, monkeypatch):
+    monkeypatch.setattr(digest, 'CHUNK_SIZE', 1024)
+    size = 1024 * 1024
+    dotfile = _copy(repo, '.a', b'x' + bytes(size - 1), bytes(size))
+    assert dotfile.state == 'conflict'
+    assert sorted(reads.values()) == [1024, 1024]
+    assert len(digest.shared()) == 0
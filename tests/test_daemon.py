@@ -0,0 +1,116 @@
+import time
+import threading
+
+import pytest
+
+from dotfiles.cli import cli
+from dotfiles.daemon import Daemon, Inotify, notify, query
+from dotfiles.repository import Repositories
+
+
+def _inotify():
+    try:
+        Inotify().close()
+    except OSError:
+        return False
+    return True
+
+
+@pytest.fixture(autouse=True)
+def runtime(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path / 'run'))
+
+
+@pytest.fixture(params=[
+    True,
+    pytest.param(False, marks=pytest.mark.skipif(
+        not _inotify(), reason='inotify is not available')),
+])
+def daemon(request, repo):
+    daemon = Daemon(Repositories([str(repo.path)], repo.home),
+                    interval=0.05, polling=request.param)
+    thread = threading.Thread(target=daemon.serve_forever)
+    thread.start()
+    yield daemon
+    daemon.stop()
+    thread.join()
+
+
+def _wait(repos, expected, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        entries = query(repos)
+        if entries == expected or time.monotonic() > deadline:
+            return entries
+        time.sleep(0.02)
+
+
+def test_query_without_daemon(repo):
+    assert query(Repositories([str(repo.path)], repo.home)) is None
+
+
+def test_daemon(daemon, repo):
+    repos = daemon.repos
+    assert _wait(repos, []) == []
+
+    (repo.path / 'a').touch()
+    assert _wait(repos, [('.a', 'missing', ())]) == [('.a', 'missing', ())]
+
+    (repo.home / '.a').symlink_to(repo.path / 'a')
+    assert _wait(repos, [('.a', 'link', ())]) == [('.a', 'link', ())]
+
+
+def test_query_sees_own_changes(daemon, repo, runner):
+    repos = daemon.repos
+    (repo.path / 'a').touch()
+    assert _wait(repos, [('.a', 'missing', ())]) == [('.a', 'missing', ())]
+
+    result = runner.invoke(cli, ['-r', str(repo.path), 'enable',
+                                 str(repo.home / '.a')],
+                           env={'HOME': str(repo.home)})
+    assert not result.exception
+    assert query(repos) == [('.a', 'link', ())]
+
+
+def test_query_sees_pending_events(daemon, repo):
+    if daemon.inotify is None:
+        pytest.skip('changes are only seen when polling or notified')
+    repos = daemon.repos
+    assert _wait(repos, []) == []
+
+    (repo.path / 'a').touch()
+    assert query(repos) == [('.a', 'missing', ())]
+
+    (repo.path / '.dotfilesignore').write_text('a\n')
+    assert query(repos) == []
+
+
+def test_polling_answers_from_table(repo):
+    daemon = Daemon(Repositories([str(repo.path)], repo.home),
+                    interval=60, polling=True)
+    thread = threading.Thread(target=daemon.serve_forever)
+    thread.start()
+    try:
+        repos = daemon.repos
+        assert _wait(repos, []) == []
+        scans = []
+        rescan = daemon.rescan
+        daemon.rescan = lambda: scans.append(rescan())
+        (repo.home / '.a').write_text('changed')
+        for _ in range(3):
+            assert query(repos) == []
+        assert scans == []
+
+        (repo.path / 'a').touch()
+        notify({str(repo.path)})
+        assert query(repos) == [('.a', 'conflict', ())]
+        assert len(scans) == 1
+    finally:
+        daemon.stop()
+        thread.join()
+
+
+def test_daemon_already_running(daemon):
+    _wait(daemon.repos, [])
+    with pytest.raises(RuntimeError):
+        Daemon(daemon.repos).serve_forever()
@@ -0,0 +1,123 @@
+import os
+
+import pytest
+
+from dotfiles import digest
+from dotfiles.digest import DigestCache
+from dotfiles.dotfile import Dotfile
+
+
+@pytest.fixture
+def hashed(monkeypatch):
+    """Record the paths whose contents are read."""
+    paths = []
+    original_hash = digest._hash
+    original_compare = digest._compare
+
+    def _hash(path):
+        paths.append(path)
+        return original_hash(path)
+
+    def _compare(a, b):
+        paths.extend([a, b])
+        return original_compare(a, b)
+
+    monkeypatch.setattr(digest, '_hash', _hash)
+    monkeypatch.setattr(digest, '_compare', _compare)
+    monkeypatch.setattr(digest, 'SETTLE_NS', 0)
+    return paths
+
+
+def _digest(cache, path):
+    return cache.digest(str(path), os.stat(str(path)))
+
+
+def test_digest_cached(tmpdir, hashed):
+    a = tmpdir.join('a')
+    a.write('a')
+    cache = DigestCache()
+    first = _digest(cache, a)
+    assert _digest(cache, a) == first
+    assert hashed == [str(a)]
+
+    a.write('b')
+    assert _digest(cache, a) != first
+    assert len(hashed) == 2
+
+
+def test_recent_changes_not_cached(tmpdir):
+    a = tmpdir.join('a')
+    a.write('a')
+    cache = DigestCache()
+    _digest(cache, a)
+    assert len(cache) == 0
+
+
+def test_eviction(tmpdir, hashed):
+    cache = DigestCache(size=2)
+    paths = [tmpdir.join(x) for x in 'abc']
+    for path in paths:
+        path.write(path.basename)
+    _digest(cache, paths[0])
+    _digest(cache, paths[1])
+    _digest(cache, paths[0])
+    _digest(cache, paths[2])
+    assert len(cache) == 2
+
+    del hashed[:]
+    _digest(cache, paths[0])
+    _digest(cache, paths[1])
+    assert hashed == [str(paths[1])]
+
+
+def test_save_and_load(tmpdir, hashed):
+    a = tmpdir.join('a')
+    a.write('a')
+    cache = DigestCache()
+    first = _digest(cache, a)
+    cache.save()
+
+    loaded = DigestCache.load()
+    assert loaded.entries == cache.entries
+    assert _digest(loaded, a) == first
+    assert hashed == [str(a)]
+
+
+def test_corrupt_cache(tmpdir):
+    cache = DigestCache()
+    os.makedirs(os.path.dirname(cache.path))
+    with open(cache.path, 'wb') as f:
+        f.write(b'DDIG garbage')
+    assert len(DigestCache.load()) == 0
+
+
+def test_copies_read_once(repo, hashed, monkeypatch):
+    monkeypatch.setattr(digest, '_shared', DigestCache())
+    (repo.path / 'a').write_text('a')
+    (repo.home / '.a').write_text('a')
+
+    for _ in range(2):
+        dotfile = Dotfile(repo.home / '.a', repo.path / 'a')
+        assert dotfile.state == 'copy'
+    assert len(hashed) == 2
+
+
+def test_same(tmpdir, hashed):
+    a, b, c = [tmpdir.join(x) for x in 'abc']
+    a.write('same')
+    b.write('same')
+    c.write('diff')
+    cache = DigestCache()
+
+    def same(x, y):
+        return cache.same(str(x), os.stat(str(x)), str(y), os.stat(str(y)))
+
+    # differing files leave nothing to cache
+    assert not same(a, c)
+    assert len(cache) == 0
+    assert same(a, b)
+    assert len(cache) == 2
+
+    del hashed[:]
+    assert same(a, b)
+    assert hashed == []
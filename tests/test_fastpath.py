@@ -0,0 +1,101 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from dotfiles.fastpath import _parse, main, quiet_status
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def env(monkeypatch):
+    for name in list(os.environ):
+        if name.startswith('DOTFILES_'):
+            monkeypatch.delenv(name)
+
+
+@pytest.mark.parametrize('args, repos', [
+    (['status'], [os.path.expanduser('~/Dotfiles')]),
+    (['-r', '/a', 'status'], ['/a']),
+    (['-r', '/a', '--repos', '/b', 'status'], ['/a', '/b']),
+    (['-r', '/a', 'check'], ['/a']),
+    (['status', '-a'], None),
+    (['-r', 'status'], None),
+    (['enable'], None),
+    ([], None),
+])
+def test_parse(env, args, repos):
+    assert _parse(args) == repos
+
+
+def test_parse_environment(env, monkeypatch):
+    monkeypatch.setenv('DOTFILES_REPOS', '/a:/b')
+    assert _parse(['status']) == ['/a', '/b']
+    monkeypatch.setenv('DOTFILES_STATUS_ALL', '1')
+    assert _parse(['status']) is None
+
+
+def test_quiet_status(repo):
+    paths = [str(repo.path)]
+    assert quiet_status(paths, repo.home)
+    (repo.path / 'a').touch()
+    assert not quiet_status(paths, repo.home)
+    (repo.home / '.a').symlink_to(repo.path / 'a')
+    assert quiet_status(paths, repo.home)
+
+
+def test_quiet_status_missing_repo(tmpdir):
+    assert not quiet_status([str(tmpdir.join('missing'))])
+
+
+def _run(args, home, cache):
+    code = ('import sys; from dotfiles.fastpath import main; '
+            'code = main(sys.argv[1:]); '
+            'print("click" in sys.modules); sys.exit(code)')
+    env = dict(os.environ, HOME=str(home), XDG_CACHE_HOME=str(cache),
+               PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, '-c', code] + args, env=env,
+                          stdout=subprocess.PIPE, universal_newlines=True)
+
+
+def test_no_click_when_quiet(env, tmpdir, cache):
+    home = tmpdir.ensure_dir('home')
+    repo = home.ensure_dir('Dotfiles')
+    repo.ensure('vimrc')
+    home.join('.vimrc').mksymlinkto(repo.join('vimrc'))
+
+    result = _run(['status'], home, cache)
+    assert result.returncode == 0
+    assert result.stdout == 'False\n'
+
+
+def test_fallback_when_not_quiet(env, tmpdir, cache):
+    home = tmpdir.ensure_dir('home')
+    repo = home.ensure_dir('Dotfiles')
+    repo.ensure('vimrc')
+
+    with pytest.raises(SystemExit) as exc:
+        main(['-r', str(repo), 'status'])
+    assert exc.value.code == 0
+
+    result = _run(['-r', str(repo), 'status'], home, cache)
+    assert result.returncode == 0
+    assert result.stdout.startswith('? ')
+
+
+def test_check_without_click(env, tmpdir, cache):
+    home = tmpdir.ensure_dir('home')
+    repo = home.ensure_dir('Dotfiles')
+    repo.ensure('vimrc')
+
+    result = _run(['check'], home, cache)
+    assert result.returncode == 1
+    assert result.stdout == 'False\n'
+
+    home.join('.vimrc').mksymlinkto(repo.join('vimrc'))
+    result = _run(['check'], home, cache)
+    assert result.returncode == 0
+    assert result.stdout == 'False\n'
@@ -0,0 +1,99 @@
+import os
+import pytest
+
+from dotfiles.cli import cli
+from dotfiles.fleet import Fleet
+from dotfiles.repository import Repository
+
+
+@pytest.fixture
+def homes(tmpdir):
+    return [str(tmpdir.ensure_dir('homes', x)) for x in 'abc']
+
+
+def test_scanned_once(repo, homes, monkeypatch, touch):
+    touch('bashrc', 'config/nvim/init.vim')
+    scans = []
+    original = Repository._targets
+
+    def counted(self):
+        scans.append(self)
+        return original(self)
+
+    monkeypatch.setattr(Repository, '_targets', counted)
+    results = Fleet([repo], homes).status()
+    assert len(scans) == 1
+    assert [home for home, _ in results] == homes
+    for home, entries in results:
+        assert entries == [('.bashrc', 'missing', ()),
+                           ('.config/nvim/init.vim', 'missing', ())]
+
+
+def test_enable(repo, homes, touch):
+    touch('bashrc', 'config/nvim/init.vim', 'config/git/config')
+    os.mkdir(os.path.join(homes[1], '.bashrc'))
+
+    results = Fleet([repo], homes, jobs=2).perform('enable', ['.bashrc',
+                                                              '.config/nvim'])
+    for home, result in zip(homes, results):
+        assert result.home == home
+        assert not os.path.lexists(os.path.join(home, '.config/git/config'))
+        link = os.path.join(home, '.config/nvim/init.vim')
+        assert os.path.realpath(link) == str(repo.path /
+                                             'config/nvim/init.vim')
+        assert 'enabled %s' % link in result.messages
+    assert [len(x.errors) for x in results] == [0, 1, 0]
+    assert os.path.islink(os.path.join(homes[0], '.bashrc'))
+
+
+def test_debug(repo, homes, touch):
+    touch('bashrc')
+    results = Fleet([repo], homes[:1]).perform('enable', debug=True)
+    assert results[0].messages == ['LINK   %s -> %s' % (
+        os.path.join(homes[0], '.bashrc'),
+        os.path.relpath(str(repo.path / 'bashrc'), homes[0]))]
+    assert not os.listdir(homes[0])
+
+
+def test_cli(repo, homes, runner, touch):
+    touch('bashrc')
+
+    def invoke(*args, **kwargs):
+        options = []
+        for home in homes:
+            options += ['--home', home]
+        return runner.invoke(cli, ['-r', str(repo.path)] + list(args) +
+                             options, **kwargs)
+
+    result = invoke('status')
+    assert not result.exception
+    assert result.output.splitlines() == [
+        '? %s' % os.path.join(home, '.bashrc') for home in homes]
+
+    result = invoke('enable', input='y\n')
+    assert not result.exception
+    for home in homes:
+        assert os.path.islink(os.path.join(home, '.bashrc'))
+
+    result = invoke('status', '-a')
+    assert result.output.splitlines() == [
+        'l %s' % os.path.join(home, '.bashrc') for home in homes]
+
+
+def test_cli_rejects_absolute_paths(repo, homes, runner):
+    result = runner.invoke(cli, ['-r', str(repo.path), 'enable', '--home',
+                                 homes[0], os.path.join(homes[0], '.a')])
+    assert result.exit_code == 2
+    assert 'relative to the home directories' in result.output
+
+
+def test_relative_homes(repo, homes, runner, touch, tmpdir, monkeypatch):
+    touch('bashrc')
+    monkeypatch.chdir(str(tmpdir))
+    result = runner.invoke(cli, ['-r', str(repo.path), 'enable',
+                                 '--home', 'homes/a', '--home', 'homes/b',
+                                 '.bashrc'], input='y\n')
+    assert not result.exception
+    for home in homes[:2]:
+        assert os.path.islink(os.path.join(home, '.bashrc'))
+    assert not os.path.lexists(os.path.join(homes[2], '.bashrc'))
@@ -0,0 +1,154 @@
+import os
+import shutil
+import subprocess
+import pytest
+
+from dotfiles.dotfile import Dotfile
+from dotfiles.gitindex import GitIndex, Tree, git_dir
+from dotfiles.repository import Repository
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None,
+                                reason='git is not installed')
+
+
+def _git(repo, *args):
+    subprocess.check_call(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+        + list(args), cwd=str(repo.path), stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+
+
+def _ls_files(repo):
+    output = subprocess.check_output(['git', 'ls-files', '-z'],
+                                     cwd=str(repo.path))
+    return sorted(os.fsdecode(x) for x in output.split(b'\0') if x)
+
+
+@pytest.fixture
+def git_repo(repo, touch):
+    _git(repo, 'init', '-q')
+    touch('bashrc', 'config/nvim/init.vim', 'config/nvim/after/x',
+          'config/git/config', 'a-b/c', 'a.b', 'README')
+    os.symlink('bashrc', str(repo.path / 'link'))
+    _git(repo, 'add', '-A')
+    _git(repo, 'commit', '-q', '-m', 'initial')
+    return repo
+
+
+@pytest.mark.parametrize('version', [2, 3, 4])
+def test_index_versions(git_repo, version):
+    _git(git_repo, 'update-index', '--index-version', str(version))
+    if version == 3:
+        _git(git_repo, 'update-index', '--skip-worktree', 'a.b')
+    index = GitIndex.load(git_dir(git_repo.path))
+    assert index.version == version
+    expected = _ls_files(git_repo)
+    if version == 3:
+        expected.remove('a.b')
+    assert sorted(index.entries) == expected
+
+
+def test_invalid_index(git_repo):
+    path = git_dir(git_repo.path)
+    assert GitIndex.load(str(git_repo.path / 'missing')) is None
+    with open(os.path.join(path, 'index'), 'r+b') as f:
+        f.truncate(40)
+    with pytest.raises(ValueError):
+        GitIndex.load(path)
+
+
+def test_git_file(git_repo, tmpdir):
+    worktree = tmpdir.join('worktree')
+    _git(git_repo, 'worktree', 'add', '-q', str(worktree))
+    index = GitIndex.load(git_dir(str(worktree)))
+    assert sorted(index.entries) == _ls_files(git_repo)
+
+
+def _walked(repo):
+    prefix = len(os.path.join(str(repo.path), ''))
+    return [x[prefix:] for x in repo._contents(repo.path)]
+
+
+def test_tree_matches_walk(git_repo, touch):
+    touch('untracked', 'config/new/file', 'x~')
+    (git_repo.path / 'config/git/config').unlink()
+    # still in the working tree, no longer in the index
+    _git(git_repo, 'rm', '-q', '--cached', 'a.b')
+
+    index = GitIndex.load(git_dir(git_repo.path))
+    assert Tree(git_repo, index).files() == _walked(git_repo)
+
+
+def test_tree_cache(git_repo, monkeypatch, touch):
+    index = GitIndex.load(git_dir(git_repo.path))
+    tree = Tree(git_repo, index)
+    tree.files()
+    # trust the directories listed just now
+    dirs, written = tree._load()
+    tree._save(dirs, written + 10 ** 10)
+
+    read = []
+    original = Tree._read
+
+    def counted(self, path, rel):
+        read.append(rel)
+        return original(self, path, rel)
+
+    monkeypatch.setattr(Tree, '_read', counted)
+    assert tree.files() == _walked(git_repo)
+    assert read == []
+
+    touch('config/nvim/untracked')
+    assert tree.files() == _walked(git_repo)
+    assert read == ['config/nvim']
+
+
+def test_tree_cache_ignore_changed(git_repo, touch):
+    touch('secret', '.dotfilesignore')
+    index = GitIndex.load(git_dir(git_repo.path))
+    tree = Tree(git_repo, index)
+    assert 'secret' in tree.files()
+    dirs, written = tree._load()
+    tree._save(dirs, written + 10 ** 10)
+
+    # appending leaves the mtime of the directory alone
+    with (git_repo.path / '.dotfilesignore').open('a') as f:
+        f.write('\nsecret\n')
+    repo = Repository(git_repo.path, git_repo.home)
+    assert Tree(repo, index).files() == _walked(repo)
+    assert 'secret' not in _walked(repo)
+
+
+def test_contents_from_git(git_repo, touch):
+    touch('untracked')
+    scanned = Repository(git_repo.path, git_repo.home, scan='git')
+    assert [str(x) for x in scanned.contents()] == \
+        [str(x) for x in git_repo.contents()]
+
+
+def test_copy_compared_with_blob(git_repo, monkeypatch):
+    _git(git_repo, 'update-index', '--refresh')
+    # the index must be written after the file for its entry to be trusted
+    os.utime(str(git_repo.path / 'bashrc'), ns=(0, 0))
+    _git(git_repo, 'update-index', '--really-refresh')
+    scanned = Repository(git_repo.path, git_repo.home, scan='git')
+    dotfile = next(x for x in scanned.contents()
+                   if x.target.name == 'bashrc')
+    assert dotfile._blob is not None
+    shutil.copy(str(dotfile.target), str(dotfile.name))
+
+    def same(a, a_st, b, b_st):
+        raise AssertionError('%s was compared' % a)
+
+    monkeypatch.setattr('dotfiles.digest.DigestCache.same',
+                        lambda self, *args: same(*args))
+    assert dotfile.state == 'copy'
+
+    dotfile.name.write_text('bashrX')
+    dotfile.refresh()
+    assert dotfile.state == 'conflict'
+
+    # without the blob, the files are compared
+    plain = Dotfile(dotfile.name, dotfile.target)
+    with pytest.raises(AssertionError):
+        plain.state
@@ -0,0 +1,111 @@
+import timeit
+
+import pytest
+
+from dotfiles.ignore import IgnoreMatcher, translate
+
+
+@pytest.mark.parametrize('line', ['', '   ', '# comment', '!', '/'])
+def test_translate_empty(line):
+    assert translate(line) is None
+
+
+@pytest.mark.parametrize('pattern, path, is_dir, ignored', [
+    ('*~', 'vimrc~', False, True),
+    ('*~', 'config/nvim/init.vim~', False, True),
+    ('*~', 'vimrc', False, False),
+    ('README*', 'README.md', False, True),
+    ('README*', 'doc/README', False, True),
+    ('.git/', '.git', True, True),
+    ('.git/', 'sub/.git', True, True),
+    ('.git/', '.git', False, False),
+    ('/vimrc', 'vimrc', False, True),
+    ('/vimrc', 'vim/vimrc', False, False),
+    ('config/*.bak', 'config/a.bak', False, True),
+    ('config/*.bak', 'config/sub/a.bak', False, False),
+    ('config/*.bak', 'other/config/a.bak', False, False),
+    ('**/cache', 'a/b/cache', True, True),
+    ('config/**', 'config/a/b', False, True),
+    ('config/**', 'config', True, False),
+    ('a/**/b', 'a/b', False, True),
+    ('a/**/b', 'a/x/y/b', False, True),
+    ('file[0-9]', 'file3', False, True),
+    ('file[!0-9]', 'file3', False, False),
+    ('\\#hash', '#hash', False, True),
+    ('trailing   ', 'trailing', False, True),
+])
+def test_match(pattern, path, is_dir, ignored):
+    assert IgnoreMatcher([pattern]).match(path, is_dir) == ignored
+
+
+def test_negation():
+    matcher = IgnoreMatcher(['*.log', '!keep.log'])
+    assert matcher.match('debug.log')
+    assert not matcher.match('keep.log')
+
+    # the last matching pattern wins
+    matcher = IgnoreMatcher(['!keep.log', '*.log'])
+    assert matcher.match('keep.log')
+
+
+def test_excluded_parents():
+    matcher = IgnoreMatcher(['private/', '!private/keep'])
+    assert not matcher.match('private/keep')
+    assert matcher.excluded('private/keep')
+    assert matcher.excluded('private/a/b')
+    assert not matcher.excluded('public/a')
+
+
+def test_many_patterns():
+    patterns = ['file%d' % i for i in range(500)]
+    matcher = IgnoreMatcher(patterns)
+    assert len(matcher.patterns) == 500
+    assert matcher.match('dir/file499')
+    assert not matcher.match('dir/file500')
+
+
+def test_precedence_across_kinds():
+    # names, paths, suffixes and globs are looked up separately
+    matcher = IgnoreMatcher(['*.log', 'config/*', '!keep.log', '/config/a',
+                             '!config/a'])
+    assert matcher.match('x.log')
+    assert not matcher.match('keep.log')
+    assert matcher.match('config/b')
+    assert not matcher.match('config/a')
+
+    matcher = IgnoreMatcher(['!keep.log', 'keep.*', 'build/', '!*.log'])
+    assert matcher.match('keep.txt')
+    assert not matcher.match('keep.log')
+    assert matcher.match('a/build', True)
+    assert not matcher.match('a/build')
+
+
+def _patterns(n):
+    kinds = ['name%d', 'dir%d/', '*.ext%d', '/top%d', 'sub/path%d']
+    return ['.git/', 'README*', '**/cache/'] + [
+        kinds[i % len(kinds)] % i for i in range(n)]
+
+
+def test_match_time_flat():
+    def timed(n):
+        matcher = IgnoreMatcher(_patterns(n))
+        return min(timeit.repeat(lambda: matcher.match('d1/d2/file1234'),
+                                 number=2000, repeat=5))
+
+    assert timed(1000) < 3 * timed(10)
+
+
+def test_no_patterns():
+    assert not IgnoreMatcher().match('anything')
+    assert not IgnoreMatcher().excluded('any/thing')
+
+
+def test_from_directory(tmpdir):
+    tmpdir.join('.gitignore').write('*.log\nsecret/\n')
+    tmpdir.join('.dotfilesignore').write('!keep.log\n')
+
+    matcher = IgnoreMatcher.from_directory(str(tmpdir), ['README*'])
+    assert matcher.match('README')
+    assert matcher.match('a.log')
+    assert not matcher.match('keep.log')
+    assert matcher.excluded('secret/key')
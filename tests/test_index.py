@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+from dotfiles.dotfile import Dotfile
+from dotfiles.index import StatIndex, atomic_write, signature
+
+
+def _dotfile(repo, name='.vimrc', target='vimrc'):
+    return Dotfile(repo.home / name, repo.path / target)
+
+
+def _age(path, seconds=10):
+    st = os.lstat(str(path))
+    os.utime(str(path), ns=(st.st_atime_ns, st.st_mtime_ns - seconds * 10**9),
+             follow_symlinks=False)
+
+
+def test_signature(repo):
+    dotfile = _dotfile(repo)
+    name, link, target = signature(dotfile)
+    assert name == target == (0, 0, 0, 0, 0)
+    assert link is None
+
+    dotfile.target.touch()
+    dotfile.name.symlink_to(dotfile.target)
+    dotfile.refresh()
+    name, link, target = signature(dotfile)
+    assert link == str(dotfile.target)
+    assert target[2] == dotfile.target.stat().st_ino
+
+
+def test_roundtrip(repo, cache):
+    dotfile = _dotfile(repo)
+    dotfile.target.write_text('a')
+    dotfile.name.write_text('a')
+
+    index = StatIndex.load(repo)
+    assert len(index) == 0
+    assert index.state(dotfile) == 'copy'
+    index.save()
+    assert os.path.dirname(index.path) == str(cache / 'dotfiles')
+
+    index = StatIndex.load(repo)
+    assert len(index) == 1
+    assert index.entries[str(dotfile.name)][1] == 'copy'
+
+
+def test_reuse_and_invalidate(repo, monkeypatch):
+    dotfile = _dotfile(repo)
+    dotfile.target.write_text('a')
+    dotfile.name.write_text('b')
+    _age(dotfile.target)
+    _age(dotfile.name)
+
+    index = StatIndex.load(repo)
+    assert index.state(dotfile) == 'conflict'
+    index.save()
+
+    # an unchanged dotfile is not examined again
+    monkeypatch.setattr(Dotfile, 'state', property(lambda self: 1 / 0))
+    index = StatIndex.load(repo)
+    assert index.state(dotfile) == 'conflict'
+    monkeypatch.undo()
+
+    # but a changed one is
+    dotfile.name.write_text('a')
+    dotfile.refresh()
+    index = StatIndex.load(repo)
+    assert index.state(dotfile) == 'copy'
+
+
+def test_racy_entries_are_not_trusted(repo, monkeypatch):
+    dotfile = _dotfile(repo)
+    dotfile.target.write_text('a')
+    dotfile.name.write_text('a')
+
+    index = StatIndex.load(repo)
+    index.state(dotfile)
+    index.written = 0
+    monkeypatch.setattr(Dotfile, 'state', property(lambda self: 'conflict'))
+    assert index.state(dotfile) == 'conflict'
+
+
+def test_stale_entries_dropped(repo):
+    first = _dotfile(repo)
+    second = _dotfile(repo, '.bashrc', 'bashrc')
+
+    index = StatIndex.load(repo)
+    index.state(first)
+    index.state(second)
+    index.save()
+
+    index = StatIndex.load(repo)
+    index.state(first)
+    index.save()
+    assert list(StatIndex.load(repo).entries) == [str(first.name)]
+
+
+def test_corrupt_index(repo):
+    index = StatIndex(repo)
+    os.makedirs(os.path.dirname(index.path))
+    with open(index.path, 'wb') as f:
+        f.write(b'garbage')
+    assert len(StatIndex.load(repo)) == 0
+
+
+def test_atomic_write(tmpdir):
+    path = str(tmpdir.join('a/b/file'))
+    atomic_write(path, [b'a', b'b'])
+    with open(path, 'rb') as f:
+        assert f.read() == b'ab'
+
+    def chunks():
+        yield b'c'
+        raise OSError('disk full')
+
+    with pytest.raises(OSError):
+        atomic_write(path, chunks())
+    with open(path, 'rb') as f:
+        assert f.read() == b'ab'
+    assert os.listdir(os.path.dirname(path)) == ['file']
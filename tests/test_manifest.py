@@ -0,0 +1,77 @@
+import os
+import pytest
+
+from dotfiles.cli import cli
+from dotfiles.manifest import Manifest, NAME
+
+
+def _invoke(runner, repo, *args):
+    return runner.invoke(cli, ['-r', str(repo.path)] + list(args),
+                         env={'HOME': str(repo.home)})
+
+
+def test_roundtrip(repo, touch):
+    touch('b', 'a/b', 'a.b', 'with space', 'new\nline')
+    manifest = Manifest.build(repo)
+    manifest.save()
+
+    loaded = Manifest.load(repo.path)
+    assert loaded.entries == manifest.entries
+    assert list(loaded.files()) == list(repo._contents(repo.path))
+
+
+def test_missing_and_invalid(repo):
+    assert Manifest.load(repo.path) is None
+    (repo.path / NAME).write_text('nonsense\n')
+    with pytest.raises(ValueError):
+        Manifest.load(repo.path)
+
+
+def test_contents_read_from_manifest(repo, touch):
+    touch('a', 'config/b')
+    Manifest.build(repo).save()
+    # files not listed are not walked for
+    touch('c')
+    assert [str(x.target) for x in repo.contents()] == [
+        str(repo.path / 'a'), str(repo.path / 'config/b')]
+
+
+def test_compare(repo, touch):
+    touch('a', 'b', 'c')
+    manifest = Manifest.build(repo)
+    (repo.path / 'a').unlink()
+    (repo.path / 'b').write_text('changed')
+    # same size and contents, only the mtime differs
+    os.utime(str(repo.path / 'c'), ns=(0, 0))
+    touch('d')
+    assert list(manifest.compare(repo)) == [
+        ('modified', 'b'), ('untracked', 'd'), ('missing', 'a')]
+
+
+def test_add_and_remove_update_manifest(repo, runner, touch):
+    touch('a')
+    result = _invoke(runner, repo, 'verify', '--rebuild')
+    assert not result.exception
+
+    (repo.home / '.b').write_text('b')
+    result = _invoke(runner, repo, 'add', str(repo.home / '.b'))
+    assert not result.exception
+    assert sorted(Manifest.load(repo.path).entries) == ['a', 'b']
+
+    result = _invoke(runner, repo, 'remove', str(repo.home / '.b'))
+    assert not result.exception
+    assert sorted(Manifest.load(repo.path).entries) == ['a']
+    assert _invoke(runner, repo, 'verify').exit_code == 0
+
+
+def test_verify(repo, runner, touch):
+    result = _invoke(runner, repo, 'verify')
+    assert result.exit_code == 0
+    assert 'has no manifest' in result.output
+
+    touch('a')
+    _invoke(runner, repo, 'verify', '--rebuild')
+    touch('b')
+    result = _invoke(runner, repo, 'verify')
+    assert result.exit_code == 1
+    assert result.output == '+ %s\n' % (repo.path / 'b')
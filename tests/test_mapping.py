@@ -0,0 +1,60 @@
+import os
+import pytest
+
+from dotfiles.exceptions import NotRootedInHome
+from dotfiles.mapping import PathMapper
+
+
+@pytest.mark.parametrize('repository', ['/home/dotfiles', '/repo'])
+@pytest.mark.parametrize('dot, target, name', [
+    (True, 'vimrc', '.vimrc'),
+    (True, 'config/nvim/init.vim', '.config/nvim/init.vim'),
+    (True, 'config/.x/.y', '.config/.x/.y'),
+    (False, '.vimrc', '.vimrc'),
+    (False, 'bin/x', 'bin/x'),
+])
+def test_roundtrip(repository, dot, target, name):
+    mapper = PathMapper(repository, '/home', dot)
+    target = os.path.join(repository, target)
+    name = os.path.join('/home', name)
+    assert mapper.name(target) == name
+    assert mapper.target(name) == target
+    assert list(mapper.names([target])) == [(name, target)]
+
+
+def test_undotted_home_file():
+    mapper = PathMapper('/repo', '/home')
+    assert mapper.target('/home/a/b') == '/repo/a/b'
+    assert mapper.target('/home/.a/.b') == '/repo/a/.b'
+
+
+def test_roots():
+    mapper = PathMapper('/repo', '/home')
+    assert mapper.name('/repo') == '/home'
+    assert mapper.target('/home') == '/repo'
+
+
+def test_outside():
+    mapper = PathMapper('/repo', '/home')
+    with pytest.raises(NotRootedInHome):
+        mapper.target('/homer/.a')
+    with pytest.raises(ValueError):
+        mapper.name('/elsewhere/a')
+
+
+def test_names_listing():
+    mapper = PathMapper('/repo', '/home')
+    targets = ['/repo/a', '/repo/b/c', '/repo/b/d', '/repo/b/e/f', '/repo/g']
+    assert [name for name, _ in mapper.names(targets)] == [
+        '/home/.a', '/home/.b/c', '/home/.b/d', '/home/.b/e/f', '/home/.g']
+    # every directory was mapped once
+    assert sorted(mapper._names) == ['/repo', '/repo/b', '/repo/b/e']
+
+
+@pytest.mark.parametrize('repository', ['/home/dotfiles', '/repo'])
+@pytest.mark.parametrize('name', ['/home/.a', '/home/.config/nvim/init.vim',
+                                  '/home/.config/nvim/after/x'])
+def test_link(repository, name):
+    mapper = PathMapper(repository, '/home')
+    assert mapper.link(name) == os.path.relpath(mapper.target(name),
+                                                os.path.dirname(name))
@@ -0,0 +1,96 @@
+import pytest
+
+from dotfiles.cli import cli
+from dotfiles.ownership import Ownership
+from dotfiles.repository import Repository
+
+
+@pytest.fixture
+def repos(tmpdir):
+    home = tmpdir.ensure_dir('home')
+    a = tmpdir.ensure_dir('a')
+    b = tmpdir.ensure_dir('b')
+    a.ensure('config/nvim/init.vim')
+    a.ensure('bashrc')
+    b.ensure('config/git/config')
+    b.ensure('bashrc')
+    return [Repository(str(a), str(home)), Repository(str(b), str(home))]
+
+
+def test_claims(repos):
+    a, b = repos
+    owners = Ownership(repos)
+    assert owners.claims(a.home / '.config/nvim/init.vim') == [a]
+    assert owners.claims(a.home / '.config/git/config') == [b]
+    assert owners.claims(a.home / '.bashrc') == [a, b]
+    assert owners.claims(a.home / '.config') == []
+    assert owners.claims(a.home / '.zshrc') == []
+    assert owners.claims(b.path / 'bashrc') == [b]
+    assert owners.claims('/elsewhere') == []
+
+
+def test_below(repos):
+    a, b = repos
+    owners = Ownership(repos)
+    assert owners.below(a.home / '.config') == [a, b]
+    assert owners.below(a.home / '.config/nvim') == [a]
+    assert owners.below(a.home / '.vim') == []
+
+
+def test_nearest(repos):
+    a, b = repos
+    owners = Ownership(repos)
+    assert owners.nearest(a.home / '.config/nvim/lua/x.lua') == [a]
+    assert owners.nearest(a.home / '.config/git/ignore') == [b]
+    assert owners.nearest(a.home / '.config/new') == [a, b]
+    assert owners.nearest(a.home / '.zshrc') == []
+
+
+def test_collisions(repos):
+    a, b = repos
+    assert list(Ownership(repos).collisions()) == [
+        (str(a.home / '.bashrc'), [a, b])]
+
+
+def test_dispatch(repos, runner):
+    a, b = repos
+    home = str(a.home)
+    result = runner.invoke(cli, ['-r', str(a.path), '-r', str(b.path),
+                                 'enable', '--debug', home + '/.config',
+                                 home + '/.bashrc'], env={'HOME': home})
+    assert not result.exception
+    lines = result.output.splitlines()
+    assert lines[0].startswith("ERROR: '%s/.bashrc' is claimed by" % home)
+    links = [x for x in lines if x.startswith('LINK')]
+    assert len(links) == 2
+    assert links[0].endswith('a/config/nvim/init.vim')
+    assert links[1].endswith('b/config/git/config')
+
+
+def test_files(repos):
+    a, b = repos
+    home = str(a.home)
+    owners = Ownership(repos)
+    assert list(owners.files(a.home / '.config')) == [
+        (home + '/.config/git/config', [b]),
+        (home + '/.config/nvim/init.vim', [a])]
+    assert list(owners.files(home + '/.bashrc')) == [
+        (home + '/.bashrc', [a, b])]
+    assert list(owners.files(a.home / '.vim')) == []
+
+
+def test_dispatch_directory(repos, runner):
+    a, b = repos
+    home = str(a.home)
+    args = ['-r', str(a.path), '-r', str(b.path)]
+    result = runner.invoke(cli, args + ['enable', home + '/.config'],
+                           input='y\n', env={'HOME': home})
+    assert not result.exception
+    assert (a.home / '.config/git/config').is_symlink()
+    assert (a.home / '.config/nvim/init.vim').is_symlink()
+
+    result = runner.invoke(cli, args + ['disable', home + '/.config'],
+                           input='y\n', env={'HOME': home})
+    assert not result.exception
+    assert 'missing' not in result.output
+    assert not (a.home / '.config').exists()
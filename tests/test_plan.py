@@ -0,0 +1,401 @@
+import io
+import os
+import pytest
+
+from dotfiles.cli import cli
+from dotfiles.dotfile import Dotfile, relative_link
+from dotfiles.exceptions import DotfileException
+from dotfiles.plan import DIR_FD, Plan, DirectoryHandles
+
+
+def _dotfile(repo, name, target):
+    return Dotfile(repo.home / name, repo.path / target)
+
+
+def test_mkdir_deduplicated(tmpdir):
+    plan = Plan()
+    plan.mkdir(tmpdir.join('a/b/c'))
+    plan.mkdir(tmpdir.join('a/b/d'))
+    plan.mkdir(tmpdir.join('a/b'))
+    plan.mkdir(tmpdir)
+    assert list(plan) == [
+        ('mkdir', str(tmpdir.join('a'))),
+        ('mkdir', str(tmpdir.join('a/b'))),
+        ('mkdir', str(tmpdir.join('a/b/c'))),
+        ('mkdir', str(tmpdir.join('a/b/d'))),
+    ]
+
+
+def test_order(tmpdir):
+    plan = Plan('remove', None)
+    plan.repository = str(tmpdir)
+    plan.prune(tmpdir.join('p'))
+    plan.link('/l', 't')
+    plan.copy('/s', '/c')
+    plan.move('/a', '/b')
+    plan.unlink('/u')
+    plan.mkdir(tmpdir.join('d'))
+    # directories first and last, everything else as planned
+    assert [x[0] for x in plan] == ['mkdir', 'link', 'copy', 'move',
+                                    'unlink', 'prune']
+
+
+def test_dirs():
+    plan = Plan('enable', None)
+    plan.link('/l/x', '../t/x')
+    plan.copy('/s/y', '/c/y')
+    plan.move('/a/z', '/b/z')
+    plan.unlink('/u/w')
+    assert plan.dirs() == {'/l', '/c', '/a', '/b', '/u'}
+
+
+def test_failure_leaves_dotfiles_whole(repo):
+    dotfiles = [_dotfile(repo, '.%s' % x, x) for x in 'abc']
+    plan = Plan('add', repo)
+    for dotfile in dotfiles:
+        dotfile.name.write_text('x')
+        dotfile.plan(plan, 'add')
+    # fails the second move
+    dotfiles[1].name.unlink()
+
+    with pytest.raises(OSError):
+        plan.execute()
+    dotfiles[0].refresh()
+    assert dotfiles[0].state == 'link'
+    assert dotfiles[2].name.read_text() == 'x'
+    assert not dotfiles[2].target.exists()
+
+
+def test_add_missing(repo, runner):
+    for name in ('.a', '.c'):
+        (repo.home / name).write_text(name)
+    result = runner.invoke(cli, ['-r', str(repo.path), 'add'] +
+                           [str(repo.home / x) for x in ('.a', '.b', '.c')],
+                           env={'HOME': str(repo.home)})
+    assert not result.exception
+    assert "'%s' not found" % (repo.home / '.b') in result.output
+    for name in ('.a', '.c'):
+        assert (repo.home / name).is_symlink()
+        assert (repo.home / name).read_text() == name
+
+
+def test_enable_many(repo):
+    dotfiles = []
+    for name in ['a', 'b', 'c']:
+        dotfile = _dotfile(repo, '.config/nvim/%s' % name, 'config/nvim/%s'
+                           % name)
+        dotfile.target.parent.mkdir(parents=True, exist_ok=True)
+        dotfile.target.touch()
+        dotfiles.append(dotfile)
+
+    plan = Plan('enable')
+    for dotfile in dotfiles:
+        dotfile.plan(plan, 'enable')
+    assert len(plan.operations['mkdir']) == 2
+    assert len(plan.operations['link']) == 3
+
+    plan.execute()
+    for dotfile in dotfiles:
+        dotfile.refresh()
+        assert dotfile.state == 'link'
+        assert not os.path.isabs(os.readlink(str(dotfile.name)))
+
+
+def test_debug(repo, capsys):
+    dotfile = _dotfile(repo, '.a', 'a')
+    dotfile.name.touch()
+
+    plan = Plan('add')
+    dotfile.plan(plan, 'add')
+    plan.execute(debug=True)
+    assert capsys.readouterr().out.splitlines() == [
+        'MOVE   %s -> %s' % (dotfile.name, dotfile.target),
+        'LINK   %s -> %s' % (dotfile.name, os.path.relpath(
+            str(dotfile.target), str(repo.home))),
+    ]
+    assert not dotfile.target.exists()
+
+
+def test_roundtrip(repo):
+    dotfile = _dotfile(repo, '.a/b', 'a/b')
+    dotfile.name.parent.mkdir()
+    dotfile.name.touch()
+
+    plan = Plan('add', repo)
+    dotfile.plan(plan, 'add')
+    plan.done('added .a/b')
+    buf = io.StringIO()
+    plan.dump(buf)
+    buf.seek(0)
+
+    loaded = Plan.load(buf)
+    assert list(loaded) == list(plan)
+    assert loaded.messages == ['added .a/b']
+    assert loaded.repository == str(repo.path)
+    assert loaded.method == 'add'
+
+
+def test_load_invalid():
+    with pytest.raises(ValueError):
+        Plan.load(io.StringIO('{"version": 0}'))
+
+
+def test_resume(repo):
+    dotfiles = [_dotfile(repo, '.%s' % x, x) for x in 'abc']
+    plan = Plan('enable')
+    for dotfile in dotfiles:
+        dotfile.target.touch()
+        dotfile.plan(plan, 'enable')
+
+    # the first link was journaled, the second was created but not
+    journal = str(repo.path / 'plan.journal')
+    with open(journal, 'w') as f:
+        f.write('0\n')
+    operations = list(plan)
+    os.symlink(operations[1][2], operations[1][1])
+    os.unlink(str(dotfiles[0].target))
+
+    plan.execute(journal=journal)
+    assert not os.path.exists(journal)
+    assert not dotfiles[0].name.is_symlink()
+    for dotfile in dotfiles[1:]:
+        dotfile.refresh()
+        assert dotfile.state == 'link'
+
+
+def test_apply(repo, runner, tmpdir):
+    dotfile = _dotfile(repo, '.a', 'a')
+    dotfile.target.touch()
+    plan = Plan('enable', repo)
+    dotfile.plan(plan, 'enable')
+    plan.done('enabled .a')
+    path = tmpdir.join('plan.json')
+    with path.open('w') as f:
+        plan.dump(f)
+
+    result = runner.invoke(cli, ['-r', str(repo.path), 'apply', str(path)])
+    assert not result.exception
+    assert result.output == 'enabled .a\n'
+    dotfile.refresh()
+    assert dotfile.state == 'link'
+    assert not tmpdir.join('plan.json.journal').exists()
+
+
+@pytest.mark.parametrize('target, dir', [
+    ('/repo/a', '/home'),
+    ('/repo/config/nvim/init.vim', '/home/.config/nvim'),
+    ('/home/repo/a', '/home'),
+    ('/home/a', '/home'),
+    ('/a', '/home/x/y'),
+])
+def test_relative_link(target, dir):
+    assert relative_link(target, dir) == os.path.relpath(target, dir)
+
+
+def test_directory_handles(tmpdir):
+    for name in 'abc':
+        tmpdir.ensure_dir(name)
+
+    with DirectoryHandles(size=2) as handles:
+        fd, name = handles.split(str(tmpdir.join('a/file')))
+        assert name == 'file'
+        assert handles.split(str(tmpdir.join('a/other')))[0] == fd
+        handles.split(str(tmpdir.join('b/file')))
+        handles.split(str(tmpdir.join('c/file')))
+        assert len(handles._fds) == 2
+    assert not handles._fds
+
+
+@pytest.mark.parametrize('dir_fd', [True, False])
+def test_execute(repo, monkeypatch, dir_fd):
+    monkeypatch.setattr('dotfiles.plan.DIR_FD', dir_fd)
+    dotfile = _dotfile(repo, '.a/b/c', 'a/b/c')
+    dotfile.name.parent.mkdir(parents=True)
+    dotfile.name.write_text('c')
+
+    dotfile.add()
+    assert dotfile.state == 'link'
+    dotfile.remove()
+    assert not dotfile.target.exists()
+    assert dotfile.name.read_text() == 'c'
+
+
+def test_copy_mode(repo):
+    dotfile = _dotfile(repo, '.config/a', 'config/a')
+    dotfile.name.parent.mkdir()
+    dotfile.name.write_text('a')
+
+    dotfile.add(copy=True)
+    assert dotfile.state == 'copy'
+    assert dotfile.target.read_text() == 'a'
+
+    dotfile.disable()
+    assert dotfile.state == 'missing'
+    dotfile.enable(copy=True)
+    assert dotfile.state == 'copy'
+    assert dotfile.name.stat().st_mtime_ns == \
+        dotfile.target.stat().st_mtime_ns
+
+    dotfile.remove()
+    assert dotfile.name.read_text() == 'a'
+    assert not dotfile.target.exists()
+
+
+def test_modified_copy_is_kept(repo):
+    dotfile = _dotfile(repo, '.a', 'a')
+    dotfile.target.write_text('a')
+    dotfile.enable(copy=True)
+    dotfile.name.write_text('b')
+    dotfile.refresh()
+
+    for method in ('disable', 'remove'):
+        with pytest.raises(DotfileException):
+            getattr(dotfile, method)()
+    assert dotfile.name.read_text() == 'b'
+
+
+def test_remove_prunes_touched_dirs(repo):
+    dotfile = _dotfile(repo, '.config/nvim/init.vim', 'config/nvim/init.vim')
+    other = repo.path / 'other' / 'empty'
+    other.mkdir(parents=True)
+    dotfile.target.parent.mkdir(parents=True)
+    dotfile.target.touch()
+    dotfile.name.parent.mkdir(parents=True)
+    dotfile.name.symlink_to(dotfile.target)
+
+    plan = Plan('remove', repo)
+    dotfile.plan(plan, 'remove')
+    assert list(plan)[-1] == ('prune', str(dotfile.target.parent),
+                              str(repo.path))
+    plan.execute()
+    assert not (repo.path / 'config').exists()
+    assert repo.path.is_dir()
+    # directories the plan did not touch are left alone
+    assert other.is_dir()
+
+
+def test_prune_stops_at_non_empty(repo):
+    dotfile = _dotfile(repo, '.config/nvim/init.vim', 'config/nvim/init.vim')
+    dotfile.target.parent.mkdir(parents=True)
+    dotfile.target.touch()
+    (repo.path / 'config' / 'keep').touch()
+    dotfile.name.parent.mkdir(parents=True)
+    dotfile.name.symlink_to(dotfile.target)
+
+    plan = Plan('remove', repo)
+    dotfile.plan(plan, 'remove')
+    plan.execute()
+    assert not dotfile.target.parent.exists()
+    assert (repo.path / 'config' / 'keep').exists()
+
+
+def test_disable_prunes_home_dirs(repo):
+    dotfile = _dotfile(repo, '.config/nvim/init.vim', 'config/nvim/init.vim')
+    dotfile.target.parent.mkdir(parents=True)
+    dotfile.target.touch()
+    dotfile.name.parent.mkdir(parents=True)
+    dotfile.name.symlink_to(dotfile.target)
+
+    plan = Plan('disable', repo)
+    dotfile.plan(plan, 'disable')
+    plan.execute()
+    assert not (repo.home / '.config').exists()
+    assert repo.home.is_dir()
+    assert dotfile.target.exists()
+
+
+def test_prune_debug(repo, capsys):
+    dotfile = _dotfile(repo, '.a/b', 'a/b')
+    dotfile.target.parent.mkdir()
+    dotfile.target.touch()
+    dotfile.name.parent.mkdir()
+    dotfile.name.symlink_to(dotfile.target)
+
+    plan = Plan('remove', repo)
+    dotfile.plan(plan, 'remove')
+    plan.execute(debug=True)
+    assert 'PRUNE  %s up to %s' % (dotfile.target.parent, repo.path) in \
+        capsys.readouterr().out
+    assert dotfile.target.exists()
+
+    repo.prune(debug=True)
+    assert dotfile.target.parent.exists()
+
+
+def _apply(runner, repo, tmpdir, method, dotfile, **kwargs):
+    plan = Plan(method, repo)
+    dotfile.plan(plan, method, **kwargs)
+    path = tmpdir.join('%s.json' % method)
+    with path.open('w') as f:
+        plan.dump(f)
+    return lambda: runner.invoke(cli, ['apply', str(path)])
+
+
+def test_apply_refuses_to_replace(repo, runner, tmpdir):
+    dotfile = _dotfile(repo, '.a', 'a')
+    dotfile.target.touch()
+    apply = _apply(runner, repo, tmpdir, 'enable', dotfile)
+    dotfile.name.write_text('created since')
+
+    result = apply()
+    assert result.exit_code == 1
+    assert 'Refusing to replace' in result.output
+    assert dotfile.name.read_text() == 'created since'
+
+
+@pytest.mark.parametrize('method', ['enable', 'remove'])
+def test_apply_twice(repo, runner, tmpdir, method):
+    dotfile = _dotfile(repo, '.a', 'a')
+    dotfile.target.write_text('a')
+    if method == 'remove':
+        dotfile.name.symlink_to(dotfile.target)
+    apply = _apply(runner, repo, tmpdir, method, dotfile)
+
+    for _ in range(2):
+        result = apply()
+        assert not result.exception
+    dotfile.refresh()
+    if method == 'remove':
+        assert dotfile.name.read_text() == 'a'
+        assert not dotfile.target.exists()
+    else:
+        assert dotfile.state == 'link'
+
+
+def test_apply_keeps_changed_copy(repo, runner, tmpdir):
+    dotfile = _dotfile(repo, '.a', 'a')
+    dotfile.target.write_text('a')
+    dotfile.enable(copy=True)
+    apply = _apply(runner, repo, tmpdir, 'disable', dotfile)
+    os.unlink(str(dotfile.name))
+    dotfile.name.write_text('b')
+
+    result = apply()
+    assert result.exit_code == 1
+    assert 'Changed since the plan was written' in result.output
+    assert dotfile.name.read_text() == 'b'
+
+
+@pytest.mark.skipif(not DIR_FD, reason='no dir_fd support')
+def test_planned_relative_to_handles(repo, monkeypatch):
+    dotfile = _dotfile(repo, '.config/nvim/init.vim', 'config/nvim/init.vim')
+    dotfile.target.parent.mkdir(parents=True)
+    dotfile.target.touch()
+
+    calls = []
+    for name in ('stat', 'lstat'):
+        def counted(path, *args, _original=getattr(os, name), **kwargs):
+            calls.append((path, kwargs.get('dir_fd')))
+            return _original(path, *args, **kwargs)
+        monkeypatch.setattr(os, name, counted)
+
+    plan = Plan('enable', repo)
+    dotfile.plan(plan, 'enable')
+    monkeypatch.undo()
+    assert calls
+    assert all(fd is not None and '/' not in path for path, fd in calls)
+
+    plan.execute()
+    assert plan._handles is None
+    dotfile.refresh()
+    assert dotfile.state == 'link'
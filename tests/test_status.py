@@ -0,0 +1,125 @@
+import os
+import pytest
+
+from dotfiles.repository import Repository
+from dotfiles.status import classify, default_jobs, fstype, prefetch, scan
+
+
+MOUNTS = '''\
+sysfs /sys sysfs rw 0 0
+/dev/sda1 / ext4 rw 0 0
+server:/export /home nfs4 rw 0 0
+/dev/sdb1 /home/local\\040disk xfs rw 0 0
+'''
+
+
+@pytest.fixture
+def mounts(tmpdir):
+    path = tmpdir.join('mounts')
+    path.write(MOUNTS)
+    return str(path)
+
+
+@pytest.mark.parametrize('path, kind', [
+    ('/', 'ext4'),
+    ('/etc', 'ext4'),
+    ('/home', 'nfs4'),
+    ('/home/user', 'nfs4'),
+    ('/homeless', 'ext4'),
+    ('/home/local disk/user', 'xfs'),
+])
+def test_fstype(mounts, path, kind):
+    assert fstype(path, mounts) == kind
+
+
+def test_fstype_unreadable(tmpdir):
+    assert fstype('/', str(tmpdir.join('missing'))) is None
+
+
+def test_default_jobs(monkeypatch):
+    monkeypatch.setattr('dotfiles.status.fstype', lambda path: 'ext4')
+    assert default_jobs('/') == 1
+    monkeypatch.setattr('dotfiles.status.fstype', lambda path: 'nfs')
+    assert default_jobs('/') > 1
+
+
+class Fake(object):
+    def __init__(self, n):
+        self.state = n * 2
+
+
+@pytest.mark.parametrize('jobs', [1, 2, 8])
+def test_classify_order(jobs):
+    dotfiles = [Fake(n) for n in range(100)]
+    result = list(classify(iter(dotfiles), jobs))
+    assert [d for d, _ in result] == dotfiles
+    assert [s for _, s in result] == [n * 2 for n in range(100)]
+
+
+def test_classify_is_lazy():
+    consumed = []
+
+    def source():
+        for n in range(1000):
+            consumed.append(n)
+            yield Fake(n)
+
+    results = classify(source(), 2)
+    next(results)
+    assert len(consumed) < 1000
+    results.close()
+
+
+def test_prefetch():
+    assert list(prefetch(iter(range(5000)), size=8)) == list(range(5000))
+
+
+def test_prefetch_error():
+    def broken():
+        yield 1
+        raise ValueError('broken')
+
+    items = prefetch(broken())
+    assert next(items) == 1
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def test_scan_merges_repositories(tmpdir):
+    home = tmpdir.ensure_dir('home')
+    base = tmpdir.ensure_dir('base')
+    host = tmpdir.ensure_dir('host')
+    base.ensure('a')
+    base.ensure('c/vimrc')
+    host.ensure('b')
+    host.ensure('c/vimrc')
+    home.ensure('.c/vimrc')
+
+    repos = [Repository(str(base), str(home)), Repository(str(host),
+                                                          str(home))]
+    result = [(repo, str(dotfile.short_name(repo.home)), claims)
+              for repo, dotfile, claims in scan(repos)]
+    assert result == [
+        (repos[0], '.a', ()),
+        (repos[1], '.b', ()),
+        (repos[0], '.c/vimrc', tuple(repos)),
+        (repos[1], '.c/vimrc', tuple(repos)),
+    ]
+
+
+def test_scan_shares_home_stats(tmpdir, monkeypatch):
+    home = tmpdir.ensure_dir('home')
+    repos = []
+    for name in ('base', 'host'):
+        path = tmpdir.ensure_dir(name)
+        path.ensure('vimrc')
+        repos.append(Repository(str(path), str(home)))
+    home.ensure('.vimrc')
+
+    calls = []
+    lstat = os.lstat
+    monkeypatch.setattr(os, 'lstat',
+                        lambda path: calls.append(path) or lstat(path))
+    for repo, dotfile, claims in scan(repos):
+        assert dotfile.state == 'copy'
+    assert calls.count(str(home.join('.vimrc'))) == 1
@@ -0,0 +1,52 @@
+import os
+
+from dotfiles.cli import cli
+from dotfiles.dotfile import Dotfile
+from dotfiles.timings import Timings
+
+
+def test_nested_phases_are_exclusive():
+    timings = Timings()
+    timings.enter('outer')
+    timings.enter('inner')
+    timings.leave()
+    timings.leave()
+    assert list(timings.phases) == ['outer', 'inner']
+    assert all(x >= 0 for x in timings.phases.values())
+
+
+def test_slowest():
+    timings = Timings(slowest=2)
+    for i in range(5):
+        timings.record(i, 'f%d' % i)
+    assert sorted(timings.slowest) == [(3, 'f3'), (4, 'f4')]
+
+
+def test_install_and_uninstall(repo):
+    lstat = os.lstat
+    state = vars(Dotfile)['state']
+    timings = Timings()
+    timings.install()
+    try:
+        (repo.path / 'a').touch()
+        [dotfile] = list(repo.contents())
+        assert dotfile.state == 'missing'
+    finally:
+        timings.uninstall()
+    assert os.lstat is lstat
+    assert vars(Dotfile)['state'] is state
+
+    assert {'walk', 'stat', 'classify'} <= set(timings.phases)
+    assert timings.calls['lstat'] and timings.calls['scandir'] == 1
+    assert [x[1] for x in timings.slowest] == [str(repo.home / '.a')]
+
+
+def test_cli_timings(runner, repo, tmpdir):
+    (repo.path / 'dotfiles-test-timings').touch()
+    profile = str(tmpdir.join('status.prof'))
+    result = runner.invoke(cli, ['-r', str(repo.path), '--timings',
+                                 '--profile', profile, 'status'])
+    assert result.exit_code == 0
+    assert 'timings:' in result.output
+    assert 'lstat' in result.output
+    assert os.path.getsize(profile)
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from dotfiles import transfer
+from dotfiles.transfer import copy_file
+
+
+def _source(tmpdir, data=b'data' * 100000):
+    source = tmpdir.join('source')
+    source.write_binary(data)
+    source.chmod(0o640)
+    os.utime(str(source), ns=(1, 1000000000))
+    return source
+
+
+@pytest.mark.parametrize('size', [0, 1, 400000])
+def test_copy_file(tmpdir, size):
+    source = _source(tmpdir, b'x' * size)
+    destination = tmpdir.join('destination')
+    destination.write('old')
+
+    copy_file(str(source), str(destination))
+    assert destination.read_binary() == source.read_binary()
+    st = os.stat(str(destination))
+    assert st.st_mode & 0o777 == 0o640
+    assert st.st_mtime_ns == 1000000000
+    assert sorted(os.listdir(str(tmpdir))) == ['destination', 'source']
+
+
+def test_fallback(tmpdir, monkeypatch):
+    def unsupported(src, dst):
+        os.write(dst, b'partial')
+        raise OSError('unsupported')
+
+    source = _source(tmpdir)
+    monkeypatch.setattr(transfer, 'METHODS', [('clone', unsupported)])
+    destination = tmpdir.join('destination')
+    assert copy_file(str(source), str(destination)) == 'read'
+    assert destination.read_binary() == source.read_binary()
+
+
+def test_failure_leaves_destination(tmpdir, monkeypatch):
+    def broken(src, dst):
+        raise OSError('broken')
+
+    source = _source(tmpdir)
+    destination = tmpdir.join('destination')
+    destination.write('old')
+    monkeypatch.setattr(transfer, 'METHODS', [])
+    monkeypatch.setattr(transfer, '_read_write', broken)
+    with pytest.raises(OSError):
+        copy_file(str(source), str(destination))
+    assert destination.read() == 'old'
+    assert sorted(os.listdir(str(tmpdir))) == ['destination', 'source']
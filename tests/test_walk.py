@@ -0,0 +1,51 @@
+from dotfiles.repository import Repository
+
+
+def test_prune_keeps_ignored_dirs(repo):
+    (repo.path / '.git').mkdir()
+    (repo.path / 'a/b/c').mkdir(parents=True)
+    (repo.path / 'd').mkdir()
+    (repo.path / 'd/e').touch()
+
+    repo.prune()
+    assert sorted(x.name for x in repo.path.iterdir()) == ['.git', 'd']
+
+
+def test_walk_honors_ignore_files(tmpdir):
+    path = tmpdir.ensure_dir('repo')
+    path.join('.gitignore').write('secret/\n*.log\n!keep.log\n')
+    path.ensure('secret/key')
+    path.ensure('a.log')
+    path.ensure('keep.log')
+    path.ensure('bashrc')
+
+    repo = Repository(str(path), str(tmpdir))
+    assert sorted(x.target.name for x in repo.contents()) == [
+        'bashrc', 'keep.log']
+
+
+def test_contents_streams_in_sorted_order(repo):
+    for path in ['a.b', 'a/b', 'a/a/z', 'a-b/c', 'B', 'a0', 'b/.x']:
+        target = repo.path / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.touch()
+
+    contents = repo.contents()
+    assert next(contents).target == repo.path / 'B'
+    names = [repo.home / '.B'] + [dotfile.name for dotfile in contents]
+    assert names == sorted(names)
+    assert len(names) == 7
+
+
+def test_dotfiles_deduplicated(repo):
+    for path in ['.config/nvim/init.vim', '.config/nvim/after/x.vim',
+                 '.config/git/config', '.bashrc']:
+        name = repo.home / path
+        name.parent.mkdir(parents=True, exist_ok=True)
+        name.touch()
+
+    config = repo.home / '.config'
+    paths = [config / 'nvim/init.vim', config, config / 'nvim',
+             repo.home / '.bashrc', str(repo.home / '.bashrc')]
+    names = [x.name for x in repo.dotfiles(iter(paths))]
+    assert len(names) == len(set(names)) == 4